@@ -1,5 +1,5 @@
 from src.mpc import AllocationPolicy
-from src.simulator import Simulator
+from src.sweep import sweep_jobs, run_sweep
 
 # Configurations from Chatgpt
 
@@ -45,28 +45,16 @@ if __name__ == "__main__":
     n_run = 1
     duration = 1000
     
-    for i in range(n_run):
+    variants = {
         # Run the simulation to get the values for the battery optimmization
-        s = Simulator(i, f"reference", move_computation_enabled=False, config=medium_config, allocation_policy=AllocationPolicy.MOVE1)
-        s.run(duration)
-        
-        s = Simulator(i, f"battery", move_computation_enabled=True, config=medium_config, allocation_policy=AllocationPolicy.MOVE1)
-        s.run(duration)
-        
-        # s = Simulator(i, f"delay-1-9", move_computation_enabled=True, config=medium_config, delay_operation_enabled=True)
-        # s.run(duration)
-        
-        # s = Simulator(i, f"reference-opt", move_computation_enabled=False, optimize_computation_frequency=1, optimize_computation_window=1000, config=medium_config, allocation_policy=AllocationPolicy.MOVE1)
-        # s.run(duration)
-        
-        for j in [250, 500, 750, 1000]:
-            s = Simulator(i, f"battery-opt-{str(j)}-m3", move_computation_enabled=False, optimize_computation_frequency=1, optimize_computation_window=j, config=medium_config, allocation_policy=AllocationPolicy.MOVE3, num_processes=22)
-            s.run(duration)
-        
-       
-        
-        
-        
-        
-                
-    
\ No newline at end of file
+        "reference": dict(move_computation_enabled=False, allocation_policy=AllocationPolicy.MOVE1),
+        "battery": dict(move_computation_enabled=True, allocation_policy=AllocationPolicy.MOVE1),
+        # "delay-1-9": dict(move_computation_enabled=True, delay_operation_enabled=True),
+        # "reference-opt": dict(move_computation_enabled=False, optimize_computation_frequency=1, optimize_computation_window=1000, allocation_policy=AllocationPolicy.MOVE1),
+    }
+    for j in [250, 500, 750, 1000]:
+        variants[f"battery-opt-{str(j)}-m3"] = dict(move_computation_enabled=False, optimize_computation_frequency=1, optimize_computation_window=j, allocation_policy=AllocationPolicy.MOVE3, num_processes=22)
+    
+    # The simulations run in parallel, the completed ones (in res/<variant name>) are not run again
+    jobs = sweep_jobs({"medium": medium_config}, range(n_run), variants, duration, name="{variant}")
+    run_sweep(jobs)
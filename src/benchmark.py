@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import numpy as np
+from src.mpc import Allocator, AllocationPolicy
+from src.simulator import Simulator
+from src.plotting import PlotMode
+
+# Robot configuration of the benchmarks (medium_config of main.py)
+BENCHMARK_CONFIG = {
+    "charge_rate": 65,
+    "discharge_rate": 25,
+    "total_battery": 220*60,
+    "AI_computation": 20
+}
+
+# Throughput metrics compared against the baseline (higher is better)
+METRICS = ("epochs_per_s", "candidates_per_s")
+
+# Default parameters of each group, and values of the parameters varied one at a time around them:
+# - simulator: epochs without optimization, through the FleetState (epochs/sec)
+# - candidates: generation of the candidate allocations of the MOVE_N and BRUTE_FORCE policies (candidates/sec)
+# - mpc: simulations optimizing the allocation every optimize_computation_frequency epochs (epochs/sec and candidates/sec)
+GROUPS = {
+    "simulator": {
+        "defaults": dict(n_robots=32, probability=1, vectorized=True, epochs=2000),
+        "dimensions": {"n_robots": [8, 32, 128, 500], "probability": [0.1, 0.5, 1], "vectorized": [False, True]},
+        "quick": {"n_robots": [8, 128], "vectorized": [False, True]},
+    },
+    "candidates": {
+        "defaults": dict(policy="MOVE1", n_robots=8),
+        "dimensions": {"policy": ["BRUTE_FORCE", "MOVE1", "MOVE2", "MOVE3"], "n_robots": [8, 16, 32, 64]},
+        "quick": {"policy": ["MOVE1", "MOVE2", "MOVE3"], "n_robots": [8, 32]},
+    },
+    "mpc": {
+        "defaults": dict(policy="MOVE1", n_robots=6, window=50, num_processes=1, probability=1, batched=False, epochs=2000, frequency=200),
+        "dimensions": {"policy": ["BRUTE_FORCE", "MOVE1", "MOVE2", "MOVE3"], "window": [50, 250, 1000], "num_processes": [1, 2, 4], "probability": [0.5, 1], "n_robots": [6, 8, 16]},
+        "quick": {"policy": ["MOVE1", "MOVE2"], "num_processes": [1, 2]},
+    },
+}
+
+# Minimum duration (in seconds) of a candidates case: the candidates are generated again until it is reached
+MIN_DURATION = 0.2
+
+# Combinations too large to benchmark: the number of candidates grows as n_robots**k for MOVEk and
+# faster than exponentially for BRUTE_FORCE
+MAX_ROBOTS = {"BRUTE_FORCE": 6, "MOVE1": 64, "MOVE2": 16, "MOVE3": 12}
+
+def benchmark_cases(groups=None, quick=False):
+    """
+    Cases of the benchmark: the defaults of each group, and the defaults with one parameter changed for
+    each value of its dimensions (the combinations above MAX_ROBOTS are left out).
+
+    Args:
+        groups (list): Names of the groups (all of them if None).
+        quick (bool): If True, only the dimensions of the quick subset of each group are varied.
+
+    Returns:
+        list: Cases, as dictionaries with their name, group and parameters.
+    """
+    cases = {}
+    for group in (groups if groups is not None else GROUPS):
+        spec = GROUPS[group]
+        dimensions = spec["quick"] if quick else spec["dimensions"]
+        for param, values in [(None, [None])] + list(dimensions.items()):
+            for value in values:
+                params = dict(spec["defaults"])
+                if param is not None:
+                    params[param] = value
+                if "policy" in params and params["n_robots"] > MAX_ROBOTS[params["policy"]]:
+                    continue
+                name = group + "/" + ",".join(f"{k}={params[k]}" for k in sorted(params))
+                cases[name] = {"name": name, "group": group, "params": params}
+    return list(cases.values())
+
+def make_simulator(case, results_root):
+    """
+    Simulator of a simulator or mpc case. The topology is generated with a fixed seed, and the results
+    are written in <results_root>/<group>.
+    """
+    params = case["params"]
+    config = dict(BENCHMARK_CONFIG, n_robots=params["n_robots"])
+    np.random.seed(0)
+    kwargs = dict(plot_mode=PlotMode.OFF, profile=True, probability=params["probability"], results_root=results_root)
+    if case["group"] == "simulator":
+        kwargs.update(vectorized=params["vectorized"])
+    else:
+        kwargs.update(optimize_computation_frequency=params["frequency"], optimize_computation_window=params["window"], allocation_policy=AllocationPolicy[params["policy"]], num_processes=params["num_processes"], batched_evaluation=params["batched"], vectorized=params["batched"])
+    return Simulator(0, case["group"], config=config, **kwargs)
+
+def run_case(case):
+    """
+    Run a case once. The results of the simulations are written in a temporary directory, deleted
+    afterwards, so that they do not mix with the ones in res/.
+
+    Returns:
+        dict: Wall time of the measured part and throughput of the case.
+    """
+    params = case["params"]
+    if case["group"] == "candidates":
+        n = 0
+        rounds = 0
+        start = time.perf_counter()
+        while rounds == 0 or time.perf_counter() - start < MIN_DURATION:
+            allocator = Allocator(params["n_robots"], AllocationPolicy[params["policy"]], batched=True, lazy=True)
+            n += sum(1 for _ in allocator.get_candidates([-1] * params["n_robots"]))
+            rounds += 1
+        wall_time = time.perf_counter() - start
+        return {"wall_time_s": wall_time / rounds, "candidates": n // rounds, "candidates_per_s": n / wall_time}
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as results_root:
+        s = make_simulator(case, results_root)
+        start = time.perf_counter()
+        s.run(params["epochs"])
+        wall_time = time.perf_counter() - start
+
+    summary = s.profiler.summary(params["epochs"])
+    result = {"wall_time_s": wall_time, "epochs": params["epochs"], "epochs_per_s": params["epochs"] / wall_time}
+    if case["group"] == "mpc":
+        result["candidates"] = int(summary.get("candidates", 0))
+        result["candidates_per_s"] = summary.get("candidates_per_s", 0.0)
+        if "worker_utilization" in summary:
+            result["worker_utilization"] = summary["worker_utilization"]
+    return result
+
+def run_benchmarks(cases, repeat=3):
+    """
+    Run every case repeat times and keep the fastest run of each one.
+
+    Returns:
+        dict: Environment of the run and results by case name.
+    """
+    results = {}
+    for case in cases:
+        runs = [run_case(case) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["wall_time_s"])
+        results[case["name"]] = dict(best, group=case["group"], params=case["params"], repeat=repeat)
+        rates = ", ".join(f"{best[m]:.1f} {m.replace('_per_s', '')}/s" for m in METRICS if m in best)
+        print(f"{case['name']}: {best['wall_time_s']:.3f} s, {rates}")
+
+    environment = {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(), "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+    return {"environment": environment, "results": results}
+
+def compare(report, baseline, tolerance=0.1):
+    """
+    Compare the throughputs of the cases of report with the ones of the same cases in baseline. A metric
+    regressed if it is lower than (1 - tolerance) times the baseline.
+
+    Returns:
+        list: (case name, metric, baseline value, new value) of the regressions.
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        for metric in METRICS:
+            old = baseline["results"][name].get(metric)
+            new = result.get(metric)
+            if old is None or new is None or old == 0:
+                continue
+            regressed = new < (1 - tolerance) * old
+            print(f"{name} {metric}: {old:.1f} -> {new:.1f} ({new / old:.2f}x){' REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+def save_report(report, path):
+    directory = os.path.dirname(path)
+    if directory != "" and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmarks of the simulator, of the candidate generation and of the MPC.")
+    parser.add_argument("--group", nargs="+", choices=list(GROUPS), default=None, help="groups of cases to run (all by default)")
+    parser.add_argument("--quick", action="store_true", help="vary only a subset of the dimensions of each group")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each case, the fastest one is kept")
+    parser.add_argument("--output", default="bench/results.json", help="JSON file of the results")
+    parser.add_argument("--baseline", default="bench/baseline.json", help="JSON file of the baseline to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="also save the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    report = run_benchmarks(benchmark_cases(args.group, args.quick), args.repeat)
+    save_report(report, args.output)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        regressions = compare(report, load_report(args.baseline), args.tolerance)
+        print(f"{len(regressions)} regressions against {args.baseline}.")
+    if args.save_baseline:
+        save_report(report, args.baseline)
+        print(f"Baseline saved in {args.baseline}.")
+
+    sys.exit(1 if len(regressions) > 0 else 0)
@@ -0,0 +1,134 @@
+import hashlib
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+import numpy as np
+from src.graph import CSRGraph
+
+# Approximate memory used by each entry besides its key: the slot of the dictionary, the node of the
+# LRU list and the cost
+ENTRY_OVERHEAD = 200
+
+def topology_key(adjacency_matrix):
+    """
+    Digest of the content of a topology (dense adjacency matrix or CSRGraph).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(adjacency_matrix, CSRGraph):
+        h.update(b"csr")
+        h.update(adjacency_matrix.indptr.tobytes())
+        h.update(adjacency_matrix.indices.tobytes())
+    else:
+        adjacency_matrix = np.asarray(adjacency_matrix)
+        h.update(repr((adjacency_matrix.shape, adjacency_matrix.dtype.str)).encode())
+        h.update(adjacency_matrix.tobytes())
+    return h.digest()
+
+def rollout_prefix(robots, objective, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, quantum=None):
+    """
+    Digest of everything but the allocation that determines the cost of a rollout: the battery levels,
+    total batteries, statuses, charge and discharge rates and task demands of the robots, the cost
+    function, the thresholds, the topology and the length of the window. The tasks are not part of it,
+    since every allocation reassigns all of them.
+
+    Args:
+        objective (str): Name of the cost function (e.g. "operation_time").
+        quantum (float): If given, the battery levels are rounded to a multiple of quantum, so that
+            fleets with close battery levels share their costs.
+
+    Returns:
+        bytes: Prefix of the keys of the allocations (see allocation_key).
+    """
+    state = np.array([(r.battery_level, r.total_battery, r.status_code, r.charge_rate, r.discharge_rate, r.self_task.get_consumption()) for r in robots], dtype=np.float64)
+    if quantum is not None:
+        state[:, 0] = np.round(state[:, 0] / quantum)
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(state.tobytes())
+    h.update(repr((objective, charging_threshold, operating_threshold, bool(move_computation_enabled), time_instants)).encode())
+    h.update(topology_key(adjacency_matrix))
+    return h.digest()
+
+def allocation_key(prefix, allocation):
+    return prefix + np.asarray(allocation, dtype=np.int32).tobytes()
+
+class RolloutCache:
+    """
+    LRU cache of the costs of the rollouts, keyed on rollout_prefix and the allocation. The least
+    recently used entries are evicted when the (approximate) memory of the entries exceeds max_bytes.
+    Only the costs of complete rollouts are stored (never the ones of pruned rollouts).
+
+    A RolloutCache passed to a ProcessPool is copied in each worker. To share the same entries among the
+    workers (and among simulators), use shared_rollout_cache.
+    """
+    def __init__(self, max_bytes=64*2**20, quantum=None):
+        self.max_bytes = max_bytes
+        self.quantum = quantum
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_quantum(self):
+        return self.quantum
+
+    def get_many(self, keys):
+        """
+        Cost of each key, None if it is not cached.
+        """
+        costs = []
+        for key in keys:
+            cost = self.entries.get(key)
+            if cost is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            costs.append(cost)
+
+        return costs
+
+    def put_many(self, items):
+        """
+        Store (key, cost) pairs, evicting the least recently used entries if needed.
+        """
+        for key, cost in items:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            else:
+                self.n_bytes += len(key) + ENTRY_OVERHEAD
+            self.entries[key] = float(cost)
+
+        while self.n_bytes > self.max_bytes and len(self.entries) > 0:
+            key, _ = self.entries.popitem(last=False)
+            self.n_bytes -= len(key) + ENTRY_OVERHEAD
+            self.evictions += 1
+
+    def count(self, hits, misses):
+        """
+        Add the lookups made on a copy of the cache (e.g. in a process pool worker).
+        """
+        self.hits += hits
+        self.misses += misses
+
+    def clear(self):
+        self.entries.clear()
+        self.n_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits/lookups if lookups > 0 else 0.0, "evictions": self.evictions, "entries": len(self.entries), "bytes": self.n_bytes}
+
+class CacheManager(BaseManager):
+    pass
+
+CacheManager.register("RolloutCache", RolloutCache, exposed=("get_quantum", "get_many", "put_many", "count", "clear", "stats"))
+
+def shared_rollout_cache(max_bytes=64*2**20, quantum=None):
+    """
+    RolloutCache kept in a server process. The returned proxy has the same methods and can be given to
+    several allocators and simulators: all their workers read and fill the same entries.
+    """
+    manager = CacheManager()
+    manager.start()
+    return manager.RolloutCache(max_bytes, quantum)
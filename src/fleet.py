@@ -0,0 +1,598 @@
+import heapq
+import numpy as np
+from src.robot import Robot, CHARGING, OPERATING, STATUS_CODES, STATUS_NAMES, STAT_KEYS
+from src.utils import neighbour_order
+
+# Same status codes and stats layout of Robot
+STAT_INDEX = {key: id for id, key in enumerate(STAT_KEYS)}
+
+OPERATION_TIME = STAT_INDEX["operation_time"]
+CHARGING_TIME = STAT_INDEX["charging_time"]
+N_CHARGING = STAT_INDEX["n_charging"]
+N_OPERATING = STAT_INDEX["n_operating"]
+N_OFFLOADED = STAT_INDEX["n_offloaded"]
+N_HOSTED = STAT_INDEX["n_hosted"]
+COMPUTATION = STAT_INDEX["computation"]
+FREE_COMPUTING = STAT_INDEX["free_computing"]
+SELF_COMPUTING = STAT_INDEX["self_computing"]
+OFFLOAD_COMPUTING = STAT_INDEX["offload_computing"]
+
+# Stats that accumulate task demands, the others are counters
+CONSUMPTION_STATS = (FREE_COMPUTING, SELF_COMPUTING, OFFLOAD_COMPUTING)
+
+class FleetState:
+    """
+    Array based representation of a fleet of robots.
+
+    Every per-robot quantity is stored in an array of shape (n_copies, n_robots): each row is an
+    independent copy of the same fleet, so that several copies (e.g. different allocations) can be
+    advanced together. The simulator uses a single row.
+
+    The self task of robot i is executed by robot offload_to[i] (i itself if not offloaded), while
+    hosted_from[i] is the robot whose task is hosted by i (-1 if i is not hosting).
+    """
+    def __init__(self, battery_level, total_battery, charge_rate, discharge_rate, task_demand, status, offload_to, hosted_from, stats=None):
+        # robot constants, shared by all the copies
+        self.total_battery = np.asarray(total_battery)
+        self.charge_rate = np.asarray(charge_rate)
+        self.discharge_rate = np.asarray(discharge_rate)
+        self.task_demand = np.asarray(task_demand)
+
+        # battery levels stay integers only if every quantity that changes them is an integer
+        battery_dtype = np.result_type(np.asarray(battery_level), self.total_battery, self.charge_rate, self.discharge_rate, self.task_demand)
+        self.battery_level = np.array(battery_level, dtype=battery_dtype, ndmin=2)
+        self.status = np.array(status, dtype=np.int8, ndmin=2)
+        self.offload_to = np.array(offload_to, dtype=np.int64, ndmin=2)
+        self.hosted_from = np.array(hosted_from, dtype=np.int64, ndmin=2)
+
+        self.ids = np.arange(self.n_robots)
+
+        # the counters are integers, but the stats share one array: with fractional task demands it is a
+        # float array, and stat_values converts the counters back to integers
+        stats_dtype = np.result_type(self.task_demand, np.int64)
+        if stats is None:
+            self.stats = np.zeros(self.battery_level.shape + (len(STAT_KEYS),), dtype=stats_dtype)
+        else:
+            self.stats = np.array(stats, dtype=stats_dtype).reshape(self.battery_level.shape + (len(STAT_KEYS),))
+
+    @property
+    def n_copies(self):
+        return self.battery_level.shape[0]
+
+    @property
+    def n_robots(self):
+        return self.battery_level.shape[1]
+
+    @classmethod
+    def from_robots(cls, robots, n_copies=1):
+        """
+        Build a fleet state from a list of Robot objects.
+
+        Args:
+            robots (list): Robots, the position in the list must match the robot name.
+            n_copies (int): Number of identical copies (rows) of the fleet.
+        """
+        offload_to = []
+        hosted_from = []
+        for r in robots:
+            offload_to.append(r.get_self_task().get_to().get_name())
+            hosted_from.append(-1 if r.get_hosted_task() is None else r.get_hosted_task().get_from().get_name())
+
+        def rows(values):
+            return [values for _ in range(n_copies)]
+
+        return cls(
+            battery_level=rows([r.get_battery_level() for r in robots]),
+            total_battery=[r.total_battery for r in robots],
+            charge_rate=[r.get_charge_rate() for r in robots],
+            discharge_rate=[r.get_discharge_rate() for r in robots],
+            task_demand=[r.get_self_task().get_consumption() for r in robots],
+            status=rows([r.status_code for r in robots]),
+            offload_to=rows(offload_to),
+            hosted_from=rows(hosted_from),
+            stats=rows([r.get_stats().values() for r in robots]),
+        )
+
+    def to_robots(self, robots, row=0):
+        """
+        Write the state of one copy of the fleet back into the Robot objects.
+        """
+        for id, r in enumerate(robots):
+            r.battery_level = self.battery_level[row, id].item()
+            r.status_code = self.status[row, id].item()
+            r.get_self_task().assign_to(robots[self.offload_to[row, id]])
+
+            source = self.hosted_from[row, id]
+            r.hosted_task = None if source < 0 else robots[source].get_self_task()
+
+            r.stats.set_values(self.stat_values(id, row))
+            r.update_index()
+
+    def stat_values(self, id, row=0):
+        """
+        Stats of a robot with the same types of the ones of Robot: integer counters and, with fractional
+        task demands, float consumptions (the integer 0 until a task is computed, as in Robot.tick).
+        """
+        values = self.stats[row, id].tolist()
+        if self.stats.dtype.kind != "f":
+            return values
+        return [value if k in CONSUMPTION_STATS and value != 0 else int(value) for k, value in enumerate(values)]
+
+    def to_arrays(self):
+        """
+        All the arrays describing the fleet, by name (see from_arrays).
+        """
+        return {
+            "battery_level": self.battery_level,
+            "total_battery": self.total_battery,
+            "charge_rate": self.charge_rate,
+            "discharge_rate": self.discharge_rate,
+            "task_demand": self.task_demand,
+            "status": self.status,
+            "offload_to": self.offload_to,
+            "hosted_from": self.hosted_from,
+            "stats": self.stats,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Build a fleet state from the arrays returned by to_arrays (the arrays are copied).
+        """
+        return cls(**{name: np.array(array) for name, array in arrays.items()})
+
+    def make_robots(self, row=0):
+        """
+        Create new Robot objects with the state of one copy of the fleet.
+        """
+        robots = []
+        for id in range(self.n_robots):
+            robots.append(Robot(id, battery_level=self.battery_level[row, id].item(), total_battery=self.total_battery[id].item(), charge_rate=self.charge_rate[id].item(), disharge_rate=self.discharge_rate[id].item(), task_demand=self.task_demand[id].item(), status=self.status[row, id].item()))
+
+        self.to_robots(robots, row)
+        return robots
+
+    def copy(self):
+        return FleetState(self.battery_level.copy(), self.total_battery, self.charge_rate, self.discharge_rate, self.task_demand, self.status.copy(), self.offload_to.copy(), self.hosted_from.copy(), self.stats.copy())
+
+    def select(self, rows):
+        """
+        New fleet state with the given copies of this one.
+        """
+        return FleetState(self.battery_level[rows], self.total_battery, self.charge_rate, self.discharge_rate, self.task_demand, self.status[rows], self.offload_to[rows], self.hosted_from[rows], self.stats[rows])
+
+    @classmethod
+    def concatenate(cls, fleets):
+        """
+        New fleet state with the copies of all the given fleets (same robots).
+        """
+        first = fleets[0]
+        return cls(np.concatenate([f.battery_level for f in fleets]), first.total_battery, first.charge_rate, first.discharge_rate, first.task_demand, np.concatenate([f.status for f in fleets]), np.concatenate([f.offload_to for f in fleets]), np.concatenate([f.hosted_from for f in fleets]), np.concatenate([f.stats for f in fleets]))
+
+    def linked(self, mask):
+        """
+        Extend a mask of robots with the robots that execute their tasks or whose task they execute,
+        until no robot is added. The robots of the extended mask change tasks only among themselves.
+
+        Args:
+            mask (np.ndarray): Boolean mask of shape (n_copies, n_robots), or of shape (k, n_robots)
+                if the fleet has a single copy.
+        """
+        mask = mask.copy()
+        rows = np.indices(mask.shape)[0]
+        partners = [np.broadcast_to(a, mask.shape) for a in (self.offload_to, self.hosted_from)]
+        while True:
+            size = mask.sum()
+            for partner in partners:
+                valid = partner >= 0
+                mask |= valid & np.take_along_axis(mask, np.where(valid, partner, 0), axis=1)
+                link = valid & mask
+                mask[rows[link], partner[link]] = True
+            if mask.sum() == size:
+                return mask
+
+    def extract(self, columns):
+        """
+        New fleet state with only some robots of each copy, renumbered from 0 in the given order.
+
+        Args:
+            columns (np.ndarray): Robots of each copy, of shape (n_copies, k), increasing along each row.
+                The robots of a row must be closed under linked, and have the same constants as the
+                robots of the first row.
+        """
+        rows = np.arange(self.n_copies)[:, None]
+        local = np.full(self.battery_level.shape, -1, dtype=np.int64)
+        local[rows, columns] = np.arange(columns.shape[1])
+
+        hosted_from = self.hosted_from[rows, columns]
+        hosted_from = np.where(hosted_from >= 0, local[rows, np.maximum(hosted_from, 0)], -1)
+
+        first = columns[0]
+        return FleetState(self.battery_level[rows, columns], self.total_battery[first], self.charge_rate[first], self.discharge_rate[first], self.task_demand[first], self.status[rows, columns], local[rows, self.offload_to[rows, columns]], hosted_from, self.stats[rows, columns])
+
+    def original_tasks(self, columns):
+        """
+        offload_to and hosted_from of a fleet returned by extract, with the original robot numbers.
+        """
+        rows = np.arange(self.n_copies)[:, None]
+        offload_to = columns[rows, self.offload_to]
+        hosted_from = np.where(self.hosted_from >= 0, columns[rows, np.maximum(self.hosted_from, 0)], -1)
+        return offload_to, hosted_from
+
+    def embed(self, fleet, columns):
+        """
+        Write the robots of a fleet returned by extract back into the given robots of each copy.
+        """
+        rows = np.arange(self.n_copies)[:, None]
+        self.battery_level[rows, columns] = fleet.battery_level
+        self.status[rows, columns] = fleet.status
+        self.offload_to[rows, columns], self.hosted_from[rows, columns] = fleet.original_tasks(columns)
+        self.stats[rows, columns] = fleet.stats
+
+    def get_battery_percentage(self):
+        return self.battery_level / self.total_battery
+
+    def count_status(self, status):
+        """
+        Number of robots with the given status code, for each copy of the fleet.
+        """
+        return np.count_nonzero(self.status == status, axis=1)
+
+    def has_offloaded(self):
+        return self.offload_to != self.ids
+
+    def is_hosting(self):
+        return self.hosted_from >= 0
+
+    def _consumptions(self, rows, cols):
+        """
+        Consumption of the self task and of the hosted task executed by the given robots.
+        """
+        own = self.offload_to[rows, cols] == cols
+        self_cons = np.where(own, self.task_demand[cols], 0)
+
+        source = self.hosted_from[rows, cols]
+        hosted_cons = np.where(source >= 0, self.task_demand[source], 0)
+
+        return self_cons, hosted_cons
+
+    def _tick_robots(self, rows, cols, battery_before, stats_before):
+        """
+        Advance the given robots by one time instant, starting from battery_before and stats_before.
+        Same semantic of Robot.tick.
+        """
+        charging = self.status[rows, cols] == CHARGING
+        operating = ~charging
+        self_cons, hosted_cons = self._consumptions(rows, cols)
+
+        battery = battery_before[rows, cols]
+        charged = np.minimum(battery + self.charge_rate[cols], self.total_battery[cols])
+        discharged = battery - self.discharge_rate[cols] - self_cons - hosted_cons
+        self.battery_level[rows, cols] = np.where(charging, charged, discharged)
+
+        stats = stats_before[rows, cols]
+        stats[:, CHARGING_TIME] += charging
+        stats[:, OPERATION_TIME] += operating
+        stats[:, SELF_COMPUTING] += self_cons
+        stats[:, FREE_COMPUTING] += np.where(charging, hosted_cons, 0)
+        stats[:, OFFLOAD_COMPUTING] += np.where(operating, hosted_cons, 0)
+        self.stats[rows, cols] = stats
+
+    def _tick_all(self):
+        """
+        Same as _tick_robots for every robot of every copy, starting from the current state.
+        """
+        charging = self.status == CHARGING
+        operating = ~charging
+        self_cons = np.where(self.offload_to == self.ids, self.task_demand, 0)
+        hosted_cons = np.where(self.hosted_from >= 0, self.task_demand[self.hosted_from], 0)
+
+        charged = np.minimum(self.battery_level + self.charge_rate, self.total_battery)
+        discharged = self.battery_level - self.discharge_rate - self_cons - hosted_cons
+        self.battery_level[...] = np.where(charging, charged, discharged)
+
+        self.stats[..., CHARGING_TIME] += charging
+        self.stats[..., OPERATION_TIME] += operating
+        self.stats[..., SELF_COMPUTING] += self_cons
+        self.stats[..., FREE_COMPUTING] += np.where(charging, hosted_cons, 0)
+        self.stats[..., OFFLOAD_COMPUTING] += np.where(operating, hosted_cons, 0)
+
+    def tick(self, operating_threshold, charging_threshold, delay_enabled=False):
+        """
+        Advance every copy of the fleet by one time instant. Same semantic of src.utils.tick, including
+        the effects that a robot changing status has on the robots that follow it in the list.
+
+        Args:
+            operating_threshold (float): Battery percentage at which a charging robot starts operating.
+            charging_threshold (float): Battery percentage at which an operating robot starts charging.
+            delay_enabled (bool): If True, the first robot that should start operating is not switched.
+
+        Returns:
+            tuple: Boolean masks of shape (n_copies, n_robots) with the robots available to host a task
+            and the robots whose switch to operating has been delayed.
+        """
+        battery_before = self.battery_level.copy()
+        stats_before = self.stats.copy()
+        status_before = self.status.copy()
+        hosting_at_turn = self.is_hosting()
+
+        # Tick every robot assuming that no robot changes status
+        self._tick_all()
+
+        just_charged = np.zeros(self.battery_level.shape, dtype=bool)
+        operate_branch = np.zeros(self.battery_level.shape, dtype=bool)
+        delayed = np.zeros(self.battery_level.shape, dtype=bool)
+        delay_taken = np.zeros(self.n_copies, dtype=bool)
+
+        percentage = self.get_battery_percentage()
+        candidates = ((percentage <= charging_threshold) & (self.status != CHARGING)) | ((percentage >= operating_threshold) & (self.status != OPERATING))
+        queue = np.flatnonzero(candidates.any(axis=0)).tolist()
+        queued = set(queue)
+
+        # Status changes are applied robot by robot (as in src.utils.tick). When a robot changes status
+        # it can modify the tasks of a robot that follows it, whose tick must then be recomputed.
+        while queue:
+            i = heapq.heappop(queue)
+
+            percentage = self.battery_level[:, i] / self.total_battery[i]
+            to_charge = (percentage <= charging_threshold) & (self.status[:, i] != CHARGING)
+            to_operate = ~to_charge & (percentage >= operating_threshold) & (self.status[:, i] != OPERATING)
+
+            if to_operate.any():
+                operate_branch[:, i] = to_operate
+                if delay_enabled:
+                    delayed[:, i] = to_operate & ~delay_taken
+                    delay_taken |= to_operate
+                    to_operate = to_operate & ~delayed[:, i]
+
+            if to_charge.any():
+                just_charged[:, i] = to_charge
+                r = np.flatnonzero(to_charge)
+                self.status[r, i] = CHARGING
+                self.stats[r, i, N_CHARGING] += 1
+
+                # if the robot task was offloaded, unoffload it
+                host = self.offload_to[r, i]
+                offloaded = host != i
+                r, host = r[offloaded], host[offloaded]
+                self.hosted_from[r, host] = -1
+                self.offload_to[r, i] = i
+
+                later = host > i
+                hosting_at_turn[r[later], host[later]] = False
+                self._tick_robots(r[later], host[later], battery_before, stats_before)
+                for h in np.unique(host[later]).tolist():
+                    if h not in queued:
+                        queued.add(h)
+                        heapq.heappush(queue, h)
+
+            if to_operate.any():
+                r = np.flatnonzero(to_operate)
+                self.status[r, i] = OPERATING
+                self.stats[r, i, N_OPERATING] += 1
+
+                # if the robot is hosting a task, unoffload it
+                source = self.hosted_from[r, i]
+                hosting = source >= 0
+                self.hosted_from[r, i] = -1
+                r, source = r[hosting], source[hosting]
+                self.offload_to[r, source] = source
+
+                later = source > i
+                self._tick_robots(r[later], source[later], battery_before, stats_before)
+                for s in np.unique(source[later]).tolist():
+                    if s not in queued:
+                        queued.add(s)
+                        heapq.heappush(queue, s)
+
+        available = just_charged | ((status_before == CHARGING) & ~operate_branch & ~hosting_at_turn)
+
+        return available, delayed
+
+    def _rates(self):
+        """
+        Per tick variation of the battery level of every robot while it keeps its status and tasks.
+        """
+        rows, cols = np.indices(self.battery_level.shape)
+        self_cons, hosted_cons = self._consumptions(rows, cols)
+        return np.where(self.status == CHARGING, self.charge_rate, -(self.discharge_rate + self_cons + hosted_cons))
+
+    def ticks_to_threshold(self, operating_threshold, charging_threshold):
+        """
+        Number of ticks until the tick after which each robot meets the condition to change status
+        (as checked by tick). Between two status changes the battery levels change linearly. Exact for
+        integer battery levels, rates and task demands (floating point values are accumulated
+        differently than tick by tick).
+
+        Returns:
+            np.ndarray: Number of ticks of each robot, of shape (n_copies, n_robots) (np.inf if never).
+        """
+        charging = self.status == CHARGING
+        rate = -self._rates()
+        battery = self.battery_level
+        total = self.total_battery
+
+        def operating_event(k):
+            return (battery - k * rate) / total <= charging_threshold
+
+        def charging_event(k):
+            return np.minimum(battery + k * self.charge_rate, total) / total >= operating_threshold
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k_operating = np.ceil((battery - charging_threshold * total) / rate)
+            k_charging = np.ceil((operating_threshold * total - battery) / self.charge_rate)
+
+        # Without a rate the battery level does not change: the condition holds at the next tick if it
+        # already holds, and never otherwise
+        k_operating = np.where(rate > 0, np.maximum(k_operating, 1), np.where(operating_event(1), 1, np.inf))
+        k_charging = np.where((self.charge_rate > 0) & (operating_threshold <= 1), np.maximum(k_charging, 1), np.where(charging_event(1), 1, np.inf))
+        k = np.where(charging, k_charging, k_operating)
+
+        # The closed form can be off by one because of the floating point division
+        finite = np.isfinite(k)
+        k_safe = np.where(finite, k, 1)
+        before = np.where(charging, charging_event(k_safe - 1), operating_event(k_safe - 1))
+        k = np.where(finite & (k_safe > 1) & before, k - 1, k)
+        k_safe = np.where(finite, k, 1)
+        at = np.where(charging, charging_event(k_safe), operating_event(k_safe))
+        k = np.where(finite & ~at, k + 1, k)
+
+        return k
+
+    def has_pending_match(self, labels):
+        """
+        True for the copies where a charging robot that is not hosting can reach an operating robot that
+        has not offloaded its task, i.e. where the next move_computation would not be a no-op: some
+        connected component of the topology has both kinds of robots.
+
+        Args:
+            labels (np.ndarray): Connected component of each robot (see src.utils.component_labels).
+        """
+        free = (self.offload_to == self.ids) & (self.status == OPERATING)
+        can_host = (self.status == CHARGING) & ~self.is_hosting()
+        
+        # robots of each component in each copy, counted with one bincount over (copy, label) pairs
+        bins = np.arange(self.n_copies)[:, None] * self.n_robots + labels
+        size = self.n_copies * self.n_robots
+        has_free = np.bincount(bins[free], minlength=size) > 0
+        has_host = np.bincount(bins[can_host], minlength=size) > 0
+        return (has_free & has_host).reshape(self.n_copies, self.n_robots).any(axis=1)
+
+    def steps_to_event(self, operating_threshold, charging_threshold, labels=None):
+        """
+        Number of ticks until the first tick that changes the status of a robot, for each copy of the
+        fleet (see ticks_to_threshold).
+
+        Args:
+            labels (np.ndarray): If given, connected component of each robot: the copies with a pending
+                match (see has_pending_match) have an event at the next tick.
+
+        Returns:
+            np.ndarray: Number of ticks of each copy (np.inf if no event will ever happen).
+        """
+        steps = self.ticks_to_threshold(operating_threshold, charging_threshold).min(axis=1)
+
+        if labels is not None:
+            steps = np.where(self.has_pending_match(labels), 1, steps)
+
+        return steps
+
+    def battery_trace(self, steps, row=0, offset=0):
+        """
+        Battery percentage of every robot of one copy of the fleet after each of the next steps ticks,
+        assuming that no robot changes status in the meantime. If offset is given, the first offset
+        ticks are skipped (the trace continues the one of the previous offset ticks).
+
+        Returns:
+            np.ndarray: Battery percentages of shape (steps, n_robots).
+        """
+        k = np.arange(offset + 1, offset + steps + 1)[:, None]
+        battery = np.minimum(self.battery_level[row] + k * self._rates()[row], self.total_battery)
+        return battery / self.total_battery
+
+    def advance(self, steps):
+        """
+        Advance each copy of the fleet by the given number of ticks, assuming that no robot changes
+        status in the meantime (see steps_to_event).
+
+        Args:
+            steps (np.ndarray): Number of ticks of each copy of the fleet.
+        """
+        k = np.asarray(steps, dtype=np.int64)[:, None]
+        rows, cols = np.indices(self.battery_level.shape)
+        charging = self.status == CHARGING
+        operating = ~charging
+        self_cons, hosted_cons = self._consumptions(rows, cols)
+
+        charged = np.minimum(self.battery_level + k * self.charge_rate, self.total_battery)
+        discharged = self.battery_level - k * (self.discharge_rate + self_cons + hosted_cons)
+        self.battery_level = np.where(charging, charged, discharged)
+
+        self.stats[..., CHARGING_TIME] += k * charging
+        self.stats[..., OPERATION_TIME] += k * operating
+        self.stats[..., SELF_COMPUTING] += k * self_cons
+        self.stats[..., FREE_COMPUTING] += k * np.where(charging, hosted_cons, 0)
+        self.stats[..., OFFLOAD_COMPUTING] += k * np.where(operating, hosted_cons, 0)
+
+    def apply_allocations(self, allocations):
+        """
+        Assign the tasks of each copy of the fleet according to one allocation per copy. Same semantic
+        used by the ProcessPool workers: every robot is unhosted and unoffloaded, then robot i
+        offloads its task to allocation[i], which hosts it if it is not already hosting a task.
+
+        Args:
+            allocations (np.ndarray): Allocations of shape (n_copies, n_robots).
+        """
+        allocations = np.asarray(allocations, dtype=np.int64)
+        rows = np.arange(self.n_copies)
+
+        self.hosted_from[:] = -1
+        self.offload_to[:] = self.ids
+
+        for i in range(self.n_robots):
+            target = allocations[:, i]
+            self.offload_to[:, i] = target
+            self.stats[:, i, N_OFFLOADED] += 1
+
+            free = self.hosted_from[rows, target] < 0
+            self.hosted_from[rows[free], target[free]] = i
+            self.stats[rows[free], target[free], N_HOSTED] += 1
+
+    def operate(self, row, id):
+        """
+        Same as Robot.operate, for robot id of the given copy of the fleet.
+        """
+        self.status[row, id] = OPERATING
+        source = self.hosted_from[row, id]
+        if source >= 0:
+            self.offload_to[row, source] = source
+            self.hosted_from[row, id] = -1
+        self.stats[row, id, N_OPERATING] += 1
+
+    def move_computation(self, available, adjacency_matrix):
+        """
+        Same as src.utils.move_computation, applied to every copy of the fleet.
+
+        Args:
+            available (np.ndarray): Boolean mask of the available robots, as returned by tick.
+            adjacency_matrix (np.ndarray): Adjacency matrix of the robots, or its NeighbourOrder (see
+                src.utils.neighbour_order).
+        """
+        columns = np.flatnonzero(available.any(axis=0)).tolist()
+        if len(columns) == 0:
+            return
+        
+        neighbours = neighbour_order(adjacency_matrix)
+        for i in columns:
+            # Skip the copies where the robot is already hosting a task
+            r = np.flatnonzero(available[:, i] & ~self.is_hosting()[:, i])
+            if len(r) == 0:
+                continue
+
+            # Nearest robots first, in the same order used by src.utils.move_computation
+            order = neighbours[i]
+            if len(order) == 0:
+                continue
+
+            free = (self.offload_to[r][:, order] == order) & (self.status[r][:, order] == OPERATING)
+            found = free.any(axis=1)
+            r = r[found]
+            target = order[np.argmax(free[found], axis=1)]
+
+            self.offload_to[r, target] = i
+            self.stats[r, target, N_OFFLOADED] += 1
+            self.hosted_from[r, i] = target
+            self.stats[r, i, N_HOSTED] += 1
+
+    def update_computation(self, steps=1):
+        """
+        Same as Robot.update_computation, for every robot, repeated steps times.
+
+        Returns:
+            np.ndarray: Number of computed tasks of each copy, of shape (n_copies,).
+        """
+        hosting = self.is_hosting()
+        own = ~self.has_offloaded()
+        self.stats[..., COMPUTATION] += steps * hosting
+        self.stats[..., COMPUTATION] += steps * own
+        return steps * (hosting.sum(axis=-1) + own.sum(axis=-1))
@@ -0,0 +1,170 @@
+import itertools
+import numpy as np
+
+class CSRGraph:
+    """
+    Sparse undirected topology of the robots, in compressed sparse row format: the neighbours of robot i
+    are indices[indptr[i]:indptr[i+1]], sorted by id. It can be used wherever an adjacency matrix is
+    expected (dijkstra, move_computation, the rollouts and the process pool).
+    """
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+
+    def __len__(self):
+        return self.n_nodes
+
+    @property
+    def n_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self):
+        return len(self.indices) // 2
+
+    @classmethod
+    def from_edges(cls, n_nodes, rows, columns):
+        """
+        Graph with an edge between rows[k] and columns[k], in both directions. Duplicated edges and
+        self loops are dropped.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = np.asarray(columns, dtype=np.int64)
+        keep = rows != columns
+        rows, columns = np.concatenate([rows[keep], columns[keep]]), np.concatenate([columns[keep], rows[keep]])
+
+        keys = np.unique(rows * n_nodes + columns)
+        rows, columns = keys // n_nodes, keys % n_nodes
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_nodes), out=indptr[1:])
+
+        return cls(indptr, columns)
+
+    @classmethod
+    def from_dense(cls, adjacency_matrix):
+        """
+        Same edges used by dijkstra (elements equal to 1) of a dense adjacency matrix.
+        """
+        rows, columns = np.nonzero(np.asarray(adjacency_matrix) == 1)
+        return cls.from_edges(len(adjacency_matrix), rows, columns)
+
+    def toarray(self):
+        adjacency_matrix = np.zeros((self.n_nodes, self.n_nodes))
+        adjacency_matrix[np.repeat(np.arange(self.n_nodes), np.diff(self.indptr)), self.indices] = 1
+        return adjacency_matrix
+
+    def to_arrays(self):
+        return {"indptr": self.indptr, "indices": self.indices}
+
+    def neighbours(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def neighbours_of(self, nodes):
+        """
+        Neighbours of all the nodes, concatenated (with repetitions).
+        """
+        starts = self.indptr[nodes]
+        counts = self.indptr[np.asarray(nodes) + 1] - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.indices[np.repeat(starts, counts) + offsets]
+
+    def hop_distances(self, source):
+        """
+        Number of hops from source to every node (np.inf if unreachable), by breadth-first search.
+        """
+        distances = np.full(self.n_nodes, np.inf)
+        distances[source] = 0
+        frontier = np.array([source])
+
+        hops = 0
+        while len(frontier) > 0:
+            hops += 1
+            candidates = self.neighbours_of(frontier)
+            frontier = np.unique(candidates[np.isinf(distances[candidates])])
+            distances[frontier] = hops
+
+        return distances
+
+    def components(self):
+        """
+        Label of the connected component of each node (the lowest id in the component).
+        """
+        labels = np.full(self.n_nodes, -1, dtype=np.int64)
+        isolated = np.flatnonzero(np.diff(self.indptr) == 0)
+        labels[isolated] = isolated
+        for source in range(self.n_nodes):
+            if labels[source] != -1:
+                continue
+
+            # breadth-first search of the unlabelled nodes, so that each node and edge is visited once
+            labels[source] = source
+            frontier = np.array([source])
+            while len(frontier) > 0:
+                candidates = self.neighbours_of(frontier)
+                frontier = np.unique(candidates[labels[candidates] == -1])
+                labels[frontier] = source
+
+        return labels
+
+def random_graph(n_robots, probability, seed=None):
+    """
+    Vectorized G(n, p) random graph: each of the n*(n-1)/2 pairs of robots is connected with the given
+    probability. Only the edges are sampled, so the memory is proportional to their number.
+
+    Returns:
+        CSRGraph: Topology of the robots.
+    """
+    rng = np.random.default_rng(seed)
+    n_pairs = n_robots * (n_robots - 1) // 2
+    n_edges = rng.binomial(n_pairs, probability)
+    pairs = rng.choice(n_pairs, size=n_edges, replace=False) if n_edges < n_pairs else np.arange(n_pairs)
+
+    # pair k is (i, j) with j < i and k = i*(i-1)/2 + j
+    rows = ((1 + np.sqrt(1 + 8 * pairs.astype(np.float64))) // 2).astype(np.int64)
+    rows -= rows * (rows - 1) // 2 > pairs
+    rows += (rows + 1) * rows // 2 <= pairs
+    columns = pairs - rows * (rows - 1) // 2
+
+    return CSRGraph.from_edges(n_robots, rows, columns)
+
+def geometric_graph(positions, communication_range):
+    """
+    Range based topology: two robots are connected if their euclidean distance is at most
+    communication_range. The robots are binned in a grid of cells of side communication_range, so only
+    the pairs in neighbouring cells are compared.
+
+    Args:
+        positions (np.ndarray): Position of each robot, of shape (n_robots, n_dimensions).
+        communication_range (float): Maximum distance between two connected robots.
+
+    Returns:
+        CSRGraph: Topology of the robots.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    n_robots, n_dimensions = positions.shape
+    cells = np.floor((positions - positions.min(axis=0)) / communication_range).astype(np.int64)
+    shape = cells.max(axis=0) + 3
+
+    # cell keys with a border of empty cells, so that the neighbouring cells of every cell exist
+    def key(cells):
+        return np.ravel_multi_index((cells + 1).T, shape)
+
+    order = np.argsort(key(cells), kind="stable")
+    sorted_keys = key(cells)[order]
+
+    rows = []
+    columns = []
+    for offset in itertools.product([-1, 0, 1], repeat=n_dimensions):
+        target = key(cells + np.array(offset))
+        start = np.searchsorted(sorted_keys, target, side="left")
+        counts = np.searchsorted(sorted_keys, target, side="right") - start
+
+        source = np.repeat(np.arange(n_robots), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        other = order[np.repeat(start, counts) + offsets]
+
+        close = (source < other) & (np.sum((positions[source] - positions[other]) ** 2, axis=1) <= communication_range ** 2)
+        rows.append(source[close])
+        columns.append(other[close])
+
+    return CSRGraph.from_edges(n_robots, np.concatenate(rows), np.concatenate(columns))
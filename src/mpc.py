@@ -1,57 +1,305 @@
 import copy
+import time
+import queue
+import itertools
 from enum import Enum
 import numpy as np
-from src.utils import tick, move_computation
+from src.utils import tick, move_computation, component_labels, min_cost_assignment
+from src.fleet import FleetState, CHARGING, OPERATING
+from src.graph import CSRGraph
+from src.robot import RobotIndex, snapshot_robots, restore_robots, clone_robots
+from src.cache import RolloutCache, rollout_prefix, allocation_key, topology_key
+from src.profiling import Profiler
 import sys
 import multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+
+# Number of time instants between two checks of the pruning bound
+PRUNING_INTERVAL = 25
+
+# Number of allocations looked up in the rollout cache at once by a worker
+CACHE_BATCH = 256
 
 class AllocationPolicy(Enum):
     BRUTE_FORCE = 1
     MOVE1 = 2
     MOVE2 = 3
     MOVE3 = 4
+    GREEDY = 5
+    LOCAL_SEARCH = 6
+    MATCHING = 7
+
+# Maximum number of robots that can move their task for each MOVE policy
+MOVE_N = {AllocationPolicy.MOVE1: 1, AllocationPolicy.MOVE2: 2, AllocationPolicy.MOVE3: 3}
+
+# Policies that do not enumerate the candidates: operating robots offload their task to charging robots,
+# and the allocations are evaluated in this process with the batched rollout
+HEURISTICS = (AllocationPolicy.GREEDY, AllocationPolicy.LOCAL_SEARCH, AllocationPolicy.MATCHING)
+
+class SharedArrays:
+    """
+    Numpy arrays published in shared memory. The descriptor (names, shapes and dtypes of the segments)
+    is small and can be sent to the workers, which attach to the segments without copying the data.
+    """
+    def __init__(self, arrays):
+        self.segments = []
+        self.descriptor = {}
+        
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            self.segments.append(shm)
+            self.descriptor[name] = (shm.name, array.shape, array.dtype.str)
+            
+    def release(self):
+        for shm in self.segments:
+            shm.close()
+            shm.unlink()
+        self.segments = []
+        
+    @staticmethod
+    def read(descriptor):
+        """
+        Read the arrays of a descriptor, by name. The arrays are copied once out of shared memory.
+        """
+        arrays = {}
+        for name, (shm_name, shape, dtype) in descriptor.items():
+            shm = shared_memory.SharedMemory(name=shm_name)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+            shm.close()
+        return arrays
 
 class ProcessPool:
-    def __init__(self, n_processes) -> None:
+    """
+    Worker processes that evaluate the allocations submitted by an Allocator. The pool can outlive the
+    Allocator: a pool created once (e.g. with a with statement) can be passed to several Allocators
+    (or Simulators), that do not terminate it. The workers keep the topology and the snapshot of the
+    robots they received (see broadcast), so each one is sent once per simulation or optimization.
+    """
+    def __init__(self, n_processes, shared_memory=False, pruning=False, cache=None) -> None:
         self.n_processes = n_processes
 
         self.queue = mp.Queue()
         self.result_queue = mp.Queue()
         self.n_submitted = 0
+        
+        # If shared_memory, the fleet and the adjacency matrix are published once per optimization
+        # (see publish) and only the allocations are sent through the queue
+        self.shared_memory = shared_memory
+        self.shared = None
+        self.n_published = 0
+        if shared_memory:
+            # the workers must share the resource tracker of this process, which owns the segments
+            resource_tracker.ensure_running()
+        
+        # Best cost found so far in the current optimization. If pruning, the workers stop evaluating an
+        # allocation as soon as it cannot beat it
+        self.pruning = pruning
+        self.best_bound = mp.Value("d", np.inf)
+        
+        # Rollout cache of the workers (see src.cache) and prefix of the keys of the current optimization
+        self.cache = cache
+        self.cache_prefix = None
+
+        # Data sent to every worker (see broadcast), with the key of the last value of each name
+        self.controls = [mp.Queue() for _ in range(n_processes)]
+        self.broadcasted = {}
+        self.n_broadcasts = 0
+        self.robots = None
+        self.adjacency_matrix = None
+
+        # Wall time spent putting the messages in the queue and waiting for the results, time the workers
+        # spent evaluating allocations and number of allocations they evaluated (see pop_timings). The
+        # work of an optimization spans from its first message to its last result
+        self.timings = {"submit": 0.0, "wait": 0.0, "busy": 0.0, "span": 0.0, "evaluated": 0, "messages": 0}
+        self.first_submit = None
 
         # Create and start the worker processes
         self.processes = []
-        for _ in range(n_processes):
-            p = mp.Process(target=self.work, args=(self.queue, self.result_queue))
+        for control in self.controls:
+            p = mp.Process(target=self.work, args=(self.queue, self.result_queue, self.best_bound, control))
             p.start()
             self.processes.append(p)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.terminate()
+
     def terminate(self):
-        for _ in range(self.n_processes):
+        """
+        Stop the workers once they have evaluated the allocations already submitted. The results that were
+        not read (e.g. of an optimization interrupted by an exception) are discarded, since a worker
+        cannot exit before its results are read. Terminating the pool again does nothing.
+        """
+        for _ in range(len(self.processes)):
             self.queue.put(None)
 
         for p in self.processes:
-            p.join()
-
-    def submit(self, rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, alloc, time_instants):
+            p.join(0.1)
+            while p.is_alive():
+                try:
+                    while True:
+                        self.result_queue.get_nowait()
+                except queue.Empty:
+                    pass
+                p.join(0.1)
+        self.processes = []
+        self.n_submitted = 0
+            
+        self.release()
+        
+    def broadcast(self, name, key, value):
+        """
+        Send a value to every worker, that keeps the last value of each name. The submitted data refer
+        to it by key (see work).
+        """
+        if self.broadcasted.get(name) == key:
+            return
+        for control in self.controls:
+            control.put((name, key, value))
+        self.broadcasted[name] = key
+        self.n_broadcasts += 1
+        
+    def share_robots(self, rob):
+        """
+        Key of a snapshot of the robots, broadcast if it is not the last one sent.
+        """
+        if rob is not self.robots:
+            self.robots = rob
+            self.broadcast("robots", ("robots", self.n_broadcasts), rob)
+        return self.broadcasted["robots"]
+    
+    def share_topology(self, adjacency_matrix):
+        """
+        Key of a topology, broadcast only if it differs from the last one sent (e.g. in a new simulation).
+        """
+        if adjacency_matrix is not self.adjacency_matrix:
+            self.adjacency_matrix = adjacency_matrix
+            self.broadcast("topology", topology_key(adjacency_matrix), adjacency_matrix)
+        return self.broadcasted["topology"]
+            
+    def publish(self, robots, adjacency_matrix, candidates=None):
+        """
+        Publish the fleet, the adjacency matrix and (optionally) the candidate allocations in shared
+        memory, for the allocations submitted until the next call to get_best_result.
+        """
+        self.release()
+        
+        arrays = FleetState.from_robots(robots).to_arrays()
+        if isinstance(adjacency_matrix, CSRGraph):
+            arrays["adjacency_indptr"] = adjacency_matrix.indptr
+            arrays["adjacency_indices"] = adjacency_matrix.indices
+        else:
+            arrays["adjacency_matrix"] = np.asarray(adjacency_matrix)
+        if candidates is not None:
+            arrays["candidates"] = np.asarray(candidates, dtype=np.int64)
+        self.shared = SharedArrays(arrays)
+        self.n_published += 1
+        
+    def release(self):
+        if self.shared is not None:
+            self.shared.release()
+            self.shared = None
+            
+    def _put(self, data):
+        data["cache_prefix"] = self.cache_prefix
         self.n_submitted += 1
-        self.queue.put({"robots": rob, "charging_threshold": charging_threshold, "operating_threshold": operating_threshold, "move_computation_enabled": move_computation_enabled, "adjacency_matrix": adjacency_matrix, "alloc": alloc, "time_instants": time_instants})
+        start = time.perf_counter()
+        if self.first_submit is None:
+            self.first_submit = start
+        self.queue.put(data)
+        self.timings["submit"] += time.perf_counter() - start
+            
+    def submit_allocation(self, charging_threshold, operating_threshold, move_computation_enabled, alloc, time_instants, event_driven=False):
+        self.submit_chunk(None, charging_threshold, operating_threshold, move_computation_enabled, None, [alloc], time_instants, event_driven)
+        
+    def submit_range(self, charging_threshold, operating_threshold, move_computation_enabled, start, stop, time_instants, event_driven=False):
+        """
+        Submit the published candidates from start to stop (excluded), evaluated by the same worker.
+        """
+        self._put({"shared": self.shared.descriptor, "key": self.n_published, "start": start, "stop": stop, "charging_threshold": charging_threshold, "operating_threshold": operating_threshold, "move_computation_enabled": move_computation_enabled, "time_instants": time_instants, "event_driven": event_driven})
+
+    def submit(self, rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, alloc, time_instants, event_driven=False):
+        self.submit_chunk(rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, [alloc], time_instants, event_driven)
+        
+    def submit_chunk(self, rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, allocs, time_instants, event_driven=False):
+        """
+        Submit several allocations, evaluated by the same worker that returns only the best one. rob is a
+        snapshot of the fleet (see src.robot.snapshot_robots). If rob is None, the fleet and the adjacency
+        matrix published in shared memory are used.
+        """
+        if rob is None:
+            self._put({"shared": self.shared.descriptor, "key": self.n_published, "allocs": allocs, "charging_threshold": charging_threshold, "operating_threshold": operating_threshold, "move_computation_enabled": move_computation_enabled, "time_instants": time_instants, "event_driven": event_driven})
+        else:
+            self._put({"robots": self.share_robots(rob), "allocs": allocs, "charging_threshold": charging_threshold, "operating_threshold": operating_threshold, "move_computation_enabled": move_computation_enabled, "adjacency_matrix": self.share_topology(adjacency_matrix), "time_instants": time_instants, "event_driven": event_driven})
+
+    def submit_prefix(self, rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, prefix, constrained_allocation, time_instants, event_driven=False, classes=None):
+        """
+        Submit the BRUTE_FORCE allocations starting with prefix, enumerated lazily by the worker (see
+        Allocator.iter_custom_powerset). If rob is None, the fleet published in shared memory is used.
+        If classes is given, only the canonical allocations are evaluated (see Allocator.canonical_allocation).
+        """
+        if rob is None:
+            self._put({"shared": self.shared.descriptor, "key": self.n_published, "prefix": prefix, "constrained": constrained_allocation, "classes": classes, "charging_threshold": charging_threshold, "operating_threshold": operating_threshold, "move_computation_enabled": move_computation_enabled, "time_instants": time_instants, "event_driven": event_driven})
+        else:
+            self._put({"robots": self.share_robots(rob), "prefix": prefix, "constrained": constrained_allocation, "classes": classes, "charging_threshold": charging_threshold, "operating_threshold": operating_threshold, "move_computation_enabled": move_computation_enabled, "adjacency_matrix": self.share_topology(adjacency_matrix), "time_instants": time_instants, "event_driven": event_driven})
 
     def get_best_result(self):
         best_cost = np.inf
         best_alloc = None
 
         for _ in range(self.n_submitted):
+            start = time.perf_counter()
             result = self.result_queue.get()
+            self.timings["wait"] += time.perf_counter() - start
+            self.timings["busy"] += result["busy"]
+            self.timings["evaluated"] += result["evaluated"]
+            if isinstance(self.cache, RolloutCache):
+                # each worker has its own copy of the cache
+                self.cache.count(result["hits"], result["misses"])
             if result["cost"] < best_cost:
                 best_cost = result["cost"]
                 best_alloc = result["alloc"]
 
+        if self.first_submit is not None:
+            self.timings["span"] += time.perf_counter() - self.first_submit
+            self.timings["messages"] += self.n_submitted
+            self.first_submit = None
         self.n_submitted = 0
+        self.best_cost = best_cost
+        self.best_bound.value = np.inf
+        self.release()
 
         return best_alloc
 
-    def work(self, queue, result_queue):
+    def pop_timings(self):
+        """
+        Timings of the optimizations since the last call (see timings), that are reset.
+        """
+        timings = self.timings
+        self.timings = {name: type(value)() for name, value in timings.items()}
+        return timings
+
+    def work(self, queue, result_queue, best_bound, control):
+        # fleet published in shared memory: (key, fleet, adjacency matrix, candidates, snapshot of the robots)
+        published = None
+        
+        # last broadcast value of each name, with its key
+        received = {}
+        
+        def get_bound():
+            return best_bound.value
+        
+        def lookup(name, key):
+            # the broadcasts reach the control queue in order, before the data that refer to them
+            while name not in received or received[name][0] != key:
+                n, k, value = control.get()
+                received[n] = (k, value)
+            return received[name][1]
+        
         while True:
             # Get data from the queue
             data = queue.get()
@@ -59,38 +307,159 @@ class ProcessPool:
             # If data is None, the worker will exit
             if data is None:
                 break
+            start = time.perf_counter()
 
-            rob = data["robots"]
+            if "shared" in data:
+                if published is None or published[0] != data["key"]:
+                    arrays = SharedArrays.read(data["shared"])
+                    if "adjacency_indptr" in arrays:
+                        adjacency_matrix = CSRGraph(arrays.pop("adjacency_indptr"), arrays.pop("adjacency_indices"))
+                    else:
+                        adjacency_matrix = arrays.pop("adjacency_matrix")
+                    candidates = arrays.pop("candidates", None)
+                    fleet = FleetState(**arrays)
+                    published = (data["key"], fleet, adjacency_matrix, candidates, snapshot_robots(fleet.make_robots()))
+                    
+                adjacency_matrix = published[2]
+                snapshot = published[4]
+                if "start" in data:
+                    allocs = published[3][data["start"]:data["stop"]].tolist()
+            else:
+                adjacency_matrix = lookup("topology", data["adjacency_matrix"])
+                snapshot = lookup("robots", data["robots"])
+            n_robots = len(snapshot)
+                
+            if "allocs" in data:
+                allocs = data["allocs"]
+            elif "prefix" in data:
+                # the worker enumerates its own subtree of the BRUTE_FORCE allocations
+                allocs = Allocator(n_robots, AllocationPolicy.BRUTE_FORCE, batched=True, lazy=True).iter_custom_powerset(data["constrained"], data["prefix"])
+                if data["classes"] is not None:
+                    allocs = Allocator.filter_canonical(allocs, data["classes"])
+                
             charging_threshold = data["charging_threshold"]
             operating_threshold = data["operating_threshold"]
             move_computation_enabled = data["move_computation_enabled"]
-            adjacency_matrix = data["adjacency_matrix"]
-            alloc = data["alloc"]
             time_instants = data["time_instants"]
-
-            for r in rob:
-                r.unhost()
-                r.unoffload()
+            event_driven = data["event_driven"]
+            
+            prefix = data["cache_prefix"] if self.cache is not None else None
+            
+            best_cost = np.inf
+            best_alloc = None
+            hits = 0
+            misses = 0
+            evaluated = 0
+            
+            # every allocation starts from the snapshot, restored in the same robots
+            rob = clone_robots(snapshot)
+            allocs = iter(allocs)
+            while True:
+                group = list(itertools.islice(allocs, CACHE_BATCH))
+                if len(group) == 0:
+                    break
+                evaluated += len(group)
                 
-            for i, id in enumerate(alloc):     
-                # if rob[id] != robots[i]:
-                rob[i].offload(rob[id])
-                rob[id].host(rob[i].get_self_task()) 
+                cached = [None] * len(group)
+                if prefix is not None:
+                    keys = [allocation_key(prefix, alloc) for alloc in group]
+                    cached = self.cache.get_many(keys)
+                    new = []
+                
+                for k, alloc in enumerate(group):
+                    cost = cached[k]
+                    if cost is None:
+                        restore_robots(rob, snapshot)
 
-            # cost = Allocator.optimize_missed_chanches(rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants)
-            cost = Allocator.optimize_operation_time(rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants)
+                        for r in rob:
+                            r.unhost()
+                            r.unoffload()
+                            
+                        for i, id in enumerate(alloc):     
+                            # if rob[id] != robots[i]:
+                            rob[i].offload(rob[id])
+                            rob[id].host(rob[i].get_self_task()) 
+
+                        bound = get_bound if self.pruning else None
+                        
+                        # cost = Allocator.optimize_missed_chanches(rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants)
+                        if event_driven:
+                            cost = Allocator.event_optimize_operation_time(rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, bound)
+                        else:
+                            cost = Allocator.optimize_operation_time(rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, bound)
+                        
+                        # the cost of a pruned rollout depends on the bound and is not cached
+                        if prefix is not None and cost != np.inf:
+                            new.append((keys[k], cost))
+                        
+                    if cost < best_cost:
+                        best_cost = cost
+                        best_alloc = alloc
+                        
+                    if self.pruning and cost < best_bound.value:
+                        with best_bound.get_lock():
+                            best_bound.value = min(best_bound.value, cost)
+                
+                if prefix is not None:
+                    hits += len(group) - cached.count(None)
+                    misses += cached.count(None)
+                    if len(new) > 0:
+                        self.cache.put_many(new)
 
             # Push the result to the result_queue
-            result_queue.put({"alloc": alloc, "cost": cost})
+            result_queue.put({"alloc": best_alloc, "cost": best_cost, "hits": hits, "misses": misses, "evaluated": evaluated, "busy": time.perf_counter() - start})
 
 class Allocator:
-    def __init__(self, n_robots, alloc_policy=AllocationPolicy.BRUTE_FORCE, n_processes=4):
+    def __init__(self, n_robots, alloc_policy=AllocationPolicy.BRUTE_FORCE, n_processes=4, batched=False, batch_size=1024, event_driven=False, shared_memory=False, chunk_size=1, pruning=False, lazy=False, shard_depth=2, symmetry_bands=None, time_budget=None, search_iterations=50, search_batch=32, seed=None, warm_start=False, cache=None, prefix_sharing=False, process_pool=None, profiler=None):
         self.n_robots = n_robots
         self.allocation_policy = alloc_policy
         self.alloc_options = None
+        self.move_catalog = {}
+        self.event_driven = event_driven
+        
+        # If batched, the candidates are evaluated in this process, batch_size at a time, through FleetState.
+        # If prefix_sharing, the candidates share the rollout of the current allocation (see shared_rollout)
+        self.batched = batched
+        self.batch_size = batch_size
+        self.prefix_sharing = prefix_sharing
+        
+        # Number of allocations sent to the process pool in each message
+        self.chunk_size = chunk_size
+        
+        # If lazy, the BRUTE_FORCE allocations are never stored: they are enumerated while they are
+        # evaluated, and the process pool workers enumerate the subtrees of the prefixes of length shard_depth
+        self.lazy = lazy
+        self.shard_depth = shard_depth
+        
+        # If symmetry_bands is given, robots in the same class (see symmetry_classes) are treated as
+        # interchangeable, and only one allocation is evaluated for each group of allocations that are the
+        # same up to a permutation within the classes. Approximate: the robots of a class can differ by up
+        # to one band of battery percentage
+        self.symmetry_bands = symmetry_bands
+        
+        # Heuristic policies: time_budget (in seconds) limits the local search of each optimization, that
+        # otherwise runs for search_iterations iterations evaluating search_batch neighbours each
+        self.time_budget = time_budget
+        self.search_iterations = search_iterations
+        self.search_batch = search_batch
+        self.rng = np.random.default_rng(seed)
+        
+        # If warm_start, the best allocation is reused while no robot changes status and the constraints
+        # are the same, and otherwise it seeds the next optimization (see find_best_allocation)
+        self.warm_start = warm_start
+        self.previous = None
+        self.n_reused = 0
+        
+        # Rollout cache (see src.cache), in front of every evaluation of an allocation
+        self.cache = cache
+        self.cache_quantum = cache.get_quantum() if cache is not None else None
+        
+        # Wall time of the phases of the optimizations and number of evaluated candidates (see src.profiling)
+        self.profiler = profiler if profiler is not None else Profiler(False)
                 
         if alloc_policy is AllocationPolicy.BRUTE_FORCE:
-            self.alloc_options = self.custom_powerset()
+            if not lazy:
+                self.alloc_options = self.custom_powerset()
             
         # shound be computed at every optimization request. Just check if the allocation policy is consistent
         elif alloc_policy is AllocationPolicy.MOVE1:
@@ -99,14 +468,22 @@ class Allocator:
             pass
         elif alloc_policy is AllocationPolicy.MOVE3:
             pass
+        elif alloc_policy in HEURISTICS:
+            pass
         else:
             print(f"Allocation policy {alloc_policy} not supported")
             sys.exit(1)
 
-        self.process_pool = ProcessPool(n_processes)
+        # A process pool given by the caller is used with its own settings (shared_memory, pruning and
+        # cache of the workers) and is not terminated by this allocator
+        self.process_pool = None
+        self.owns_pool = process_pool is None
+        if not batched and alloc_policy not in HEURISTICS:
+            self.process_pool = process_pool if process_pool is not None else ProcessPool(n_processes, shared_memory, pruning, cache)
 
     def terminate(self):
-        self.process_pool.terminate()
+        if self.process_pool is not None and self.owns_pool:
+            self.process_pool.terminate()
             
     def move_n_powerset(self, n, constrained_allocation):
         res = []
@@ -128,6 +505,40 @@ class Allocator:
         self._rec_custom_powerser(current, res, 0)
         return res
     
+    def iter_custom_powerset(self, constrained_allocation=None, prefix=()):
+        """
+        Lazily yield the allocations of custom_powerset that are consistent with the constraints, in the
+        same order. The constraints are checked while walking the tree, so the subtrees of inconsistent
+        prefixes are never visited.
+
+        Args:
+            constrained_allocation (list): Constraints (-1 for unconstrained robots).
+            prefix (tuple): Only the allocations starting with prefix are enumerated.
+        """
+        current = [-1] * self.n_robots
+        current[:len(prefix)] = prefix
+        yield from self._iter_custom_powerset(current, len(prefix), constrained_allocation)
+        
+    def shard_prefixes(self, depth, constrained_allocation=None):
+        """
+        Consistent prefixes of length depth. The subtrees of the prefixes (see iter_custom_powerset)
+        cover, in order, all the allocations.
+        """
+        depth = min(depth, self.n_robots)
+        current = [-1] * self.n_robots
+        return [tuple(alloc[:depth]) for alloc in self._iter_custom_powerset(current, 0, constrained_allocation, depth)]
+    
+    def _iter_custom_powerset(self, current, index, constrained_allocation, depth=None):
+        if index == (self.n_robots if depth is None else depth):
+            yield list(current)
+            return
+        
+        for i in range(self.n_robots):
+            current[index] = i
+            if self._is_consistent(current, index + 1) and self._validate_with_constraints(current, constrained_allocation, index + 1):
+                yield from self._iter_custom_powerset(current, index + 1, constrained_allocation, depth)
+            current[index] = -1
+    
     def print_powerset(self):
         for i in self.alloc_options:
             print(i)
@@ -243,40 +654,831 @@ class Allocator:
         
         return True
     
+    def get_candidates(self, costrained_allocation=None, classes=None):
+        """
+        Candidate allocations consistent with the constraints, in the order in which they are evaluated.
+        If classes is given, only the canonical allocations are kept (see canonical_allocation).
+        """
+        if self.allocation_policy in MOVE_N:
+            candidates = self.constrained_move_n(MOVE_N[self.allocation_policy], costrained_allocation).tolist()
+        elif self.lazy:
+            candidates = self.iter_custom_powerset(costrained_allocation)
+            if classes is not None:
+                return Allocator.filter_canonical(candidates, classes)
+            return candidates
+        else:
+            candidates = [alloc for alloc in self.alloc_options if self._validate_with_constraints(alloc, costrained_allocation)]
+        
+        if classes is not None:
+            candidates = list(Allocator.filter_canonical(candidates, classes))
+        return candidates
+    
+    @staticmethod
+    def symmetry_classes(robots, adjacency_matrix, move_computation_enabled, bands, constrained_allocation=None):
+        """
+        Split the robots in classes of robots treated as interchangeable: same status, battery band (the
+        battery percentage split in bands equal intervals), hosting and offloading state, capacity, rates
+        and task demand, no constraint on their allocation and, if move_computation_enabled, the same
+        neighbours in the graph (apart from each other).
+
+        Returns:
+            list: Class of each robot (the lowest id in the class), or None if every class has one robot.
+        """
+        n_robots = len(robots)
+        classes = list(range(n_robots))
+        members = {}
+        neighbours = {}
+        
+        def twins(i, j):
+            for k in (i, j):
+                if k not in neighbours:
+                    if isinstance(adjacency_matrix, CSRGraph):
+                        neighbours[k] = set(adjacency_matrix.neighbours(k).tolist())
+                    else:
+                        neighbours[k] = set(np.flatnonzero(np.asarray(adjacency_matrix[k]) == 1).tolist())
+            return neighbours[i] - {j} == neighbours[j] - {i}
+        
+        for i, r in enumerate(robots):
+            if constrained_allocation is not None and constrained_allocation[i] != -1:
+                continue
+            
+            band = min(int(r.get_battery_percentage() * bands), bands - 1)
+            key = (r.get_status(), band, r.is_hosting(), r.has_offloaded(), r.total_battery, r.get_charge_rate(), r.get_discharge_rate(), r.get_self_task().get_consumption())
+            for j in members.get(key, []):
+                if move_computation_enabled and not twins(i, j):
+                    continue
+                classes[i] = classes[j]
+                break
+            members.setdefault(key, []).append(i)
+            
+        if len(set(classes)) == n_robots:
+            return None
+        return classes
+    
+    @staticmethod
+    def canonical_allocation(allocation, classes):
+        """
+        Representative of the allocations that are the same as allocation up to a permutation of the robots
+        within their classes. A valid allocation (see _validate_count) is made of chains of robots, each
+        one offloading to the next and the last executing its own task, and (for MOVE-n) of loops. The
+        chains and loops are sorted by the classes of their robots and relabelled in that order with the
+        lowest free ids of each class, so the representative is itself a candidate with concrete ids.
+        """
+        n_robots = len(allocation)
+        offloaded_to = [False] * n_robots
+        for i, id in enumerate(allocation):
+            if i != id:
+                offloaded_to[id] = True
+        
+        components = []
+        visited = [False] * n_robots
+        for start in range(n_robots):
+            if offloaded_to[start]:
+                continue
+            chain = [start]
+            while allocation[chain[-1]] != chain[-1]:
+                chain.append(allocation[chain[-1]])
+            for i in chain:
+                visited[i] = True
+            components.append((0, [classes[i] for i in chain], chain))
+            
+        # the remaining robots are in loops, that start from the rotation with the lowest classes
+        for start in range(n_robots):
+            if visited[start]:
+                continue
+            loop = [start]
+            while allocation[loop[-1]] != start:
+                loop.append(allocation[loop[-1]])
+            for i in loop:
+                visited[i] = True
+            labels = [classes[i] for i in loop]
+            k = min(range(len(loop)), key=lambda k: labels[k:] + labels[:k])
+            components.append((1, labels[k:] + labels[:k], loop[k:] + loop[:k]))
+            
+        free = {}
+        for i in reversed(range(n_robots)):
+            free.setdefault(classes[i], []).append(i)
+            
+        relabel = [-1] * n_robots
+        for _, _, component in sorted(components, key=lambda c: (c[0], c[1])):
+            for i in component:
+                relabel[i] = free[classes[i]].pop()
+                
+        canonical = [-1] * n_robots
+        for i, id in enumerate(allocation):
+            canonical[relabel[i]] = relabel[id]
+        return canonical
+    
+    @staticmethod
+    def filter_canonical(allocations, classes):
+        """
+        Lazily yield the allocations that are their own canonical_allocation, one for each group of
+        equivalent allocations.
+        """
+        for alloc in allocations:
+            if Allocator.canonical_allocation(alloc, classes) == list(alloc):
+                yield alloc
+    
+    def move_n_catalog(self, n):
+        """
+        All the allocations in which at most n robots do not execute their own task, in lexicographic
+        order. No other check is done. Computed once and cached.
+
+        Returns:
+            np.ndarray: Allocations of shape (n_allocations, n_robots).
+        """
+        if n not in self.move_catalog:
+            choices = np.arange(self.n_robots, dtype=np.int16)
+            catalog = np.zeros((1, 0), dtype=np.int16)
+            
+            for index in range(self.n_robots):
+                catalog = np.hstack([np.repeat(catalog, self.n_robots, axis=0), np.tile(choices, len(catalog))[:, None]])
+                catalog = catalog[np.count_nonzero(catalog != choices[:index + 1], axis=1) <= n]
+                
+            self.move_catalog[n] = catalog
+            
+        return self.move_catalog[n]
+    
+    def constrained_move_n(self, n, constrained_allocation=None):
+        """
+        Same allocations of move_n_powerset that are consistent with the constraints, filtered out of
+        the catalog. The constrained robots that do not execute their own task are not counted in n.
+        """
+        catalog = self.move_n_catalog(n)
+        if constrained_allocation is None:
+            constrained_allocation = [-1] * self.n_robots
+        
+        constrained = np.asarray(constrained_allocation)
+        fixed = np.flatnonzero(constrained != -1)
+        
+        # the constrained positions must be left to the robot itself in the catalog, then replaced
+        candidates = catalog[(catalog[:, fixed] == fixed).all(axis=1)]
+        candidates[:, fixed] = constrained[fixed]
+        
+        return candidates[self._validate_count_batch(candidates)]
+    
+    def _validate_count_batch(self, allocations):
+        """
+        Same as _validate_count on complete allocations, for an array of allocations.
+        """
+        rows = np.arange(len(allocations))[:, None]
+        occurrences = np.bincount((rows * self.n_robots + allocations).ravel(), minlength=len(allocations) * self.n_robots).reshape(len(allocations), self.n_robots)
+        self_hosting = allocations == np.arange(self.n_robots)
+        
+        # at most two tasks per robot, and if two one of them must be its own
+        return ((occurrences <= 2) & ((occurrences < 2) | self_hosting)).all(axis=1)
+    
     def find_best_allocation(self, time_instants, robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, costrained_allocation=None):
+        """
+        If warm_start, the previous best allocation is returned again when no robot changed status and the
+        constraints did not change since it was computed. Otherwise, if it is still a candidate, it is
+        evaluated first: its cost is the initial bound (the other candidates must be strictly better, and
+        with pruning the workers stop as soon as they cannot be) and the candidates that differ from it in
+        fewer robots are evaluated first.
+        """
+        signature = None
+        seed = None
+        if self.warm_start:
+            signature = (tuple(r.status_code for r in robots), None if costrained_allocation is None else tuple(costrained_allocation))
+            if self.previous is not None:
+                if self.previous[0] == signature:
+                    self.n_reused += 1
+                    self.profiler.count("reused_allocations")
+                    return self.previous[1]
+                if self.is_candidate(self.previous[1], costrained_allocation):
+                    seed = list(self.previous[1])
+                    
+        best_solution = self._find_best_allocation(time_instants, robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, costrained_allocation, seed)
+        
+        if self.warm_start:
+            self.previous = (signature, best_solution)
+        return best_solution
+    
+    def is_candidate(self, allocation, constrained_allocation=None):
+        """
+        True if allocation is one of the allocations of the policy that are consistent with the constraints.
+        """
+        if len(allocation) != self.n_robots or not self._validate_with_constraints(allocation, constrained_allocation):
+            return False
+        
+        if self.allocation_policy in MOVE_N:
+            moved = [i for i in range(self.n_robots) if allocation[i] != i and (constrained_allocation is None or constrained_allocation[i] == -1)]
+            return self._validate_count(allocation, self.n_robots) and len(moved) <= MOVE_N[self.allocation_policy]
+        
+        return self._is_consistent(allocation, self.n_robots)
+    
+    @staticmethod
+    def sort_by_distance(candidates, allocation):
+        """
+        Candidates sorted by the number of robots allocated differently than in allocation (stable).
+        """
+        if len(candidates) == 0:
+            return candidates
+        
+        distance = np.count_nonzero(np.asarray(candidates) != np.asarray(allocation), axis=1)
+        return [candidates[k] for k in np.argsort(distance, kind="stable")]
+    
+    def _find_best_allocation(self, time_instants, robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, costrained_allocation=None, seed=None):
         best_cost = np.inf
         best_solution = None
         
-        if self.alloc_options is None:
-            if self.allocation_policy is AllocationPolicy.MOVE1:
-                self.alloc_options = self.move_n_powerset(1, costrained_allocation)
-            elif self.allocation_policy is AllocationPolicy.MOVE2:
-                self.alloc_options = self.move_n_powerset(2, costrained_allocation)
-            elif self.allocation_policy is AllocationPolicy.MOVE3:
-                self.alloc_options = self.move_n_powerset(3, costrained_allocation)
+        if self.allocation_policy in HEURISTICS:
+            return self.find_heuristic_allocation(time_instants, robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, costrained_allocation, seed)
         
-        # for a in self.alloc_options:
+        # with lazy candidates, most of the enumeration happens while they are evaluated
+        with self.profiler.phase("candidates"):
+            classes = None
+            if self.symmetry_bands is not None:
+                classes = Allocator.symmetry_classes(robots, adjacency_matrix, move_computation_enabled, self.symmetry_bands, costrained_allocation)
+            
+            candidates = self.get_candidates(costrained_allocation, classes)
+        
+        # for a in candidates:
         #     print(a)        
         # sys.exit(1)
         
-        for alloc in self.alloc_options:
-            if not self._validate_with_constraints(alloc, costrained_allocation):
-                continue
-                        
-            self.process_pool.submit(copy.deepcopy(robots), charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, alloc, time_instants)               
+        prefix = self.cache_prefix(robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants)
+        if self.process_pool is not None:
+            self.process_pool.cache_prefix = prefix
+        
+        if seed is not None:
+            best_cost = self.rollout_costs(robots, [seed], charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, prefix)[0]
+            best_solution = seed
+            if isinstance(candidates, list):
+                candidates = Allocator.sort_by_distance(candidates, seed)
+            if self.process_pool is not None and self.process_pool.pruning:
+                self.process_pool.best_bound.value = best_cost
+        
+        if self.batched:
+            candidates = iter(candidates)
+            while True:
+                batch = list(itertools.islice(candidates, self.batch_size))
+                if len(batch) == 0:
+                    break
+                
+                costs = self.rollout_costs(robots, batch, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, prefix)
+                
+                id = np.argmin(costs)
+                if costs[id] < best_cost:
+                    best_cost = costs[id]
+                    best_solution = batch[id]
+        elif self.lazy and self.allocation_policy is AllocationPolicy.BRUTE_FORCE:
+            if self.process_pool.shared_memory:
+                self.process_pool.publish(robots, adjacency_matrix)
+            snapshot = snapshot_robots(robots)
+                
+            for prefix in self.shard_prefixes(self.shard_depth, costrained_allocation):
+                rob = None if self.process_pool.shared_memory else snapshot
+                self.process_pool.submit_prefix(rob, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, prefix, costrained_allocation, time_instants, self.event_driven, classes)
+                
+            best_solution = self.keep_best(self.process_pool.get_best_result(), best_solution, best_cost)
+        elif self.process_pool.shared_memory:
+            self.process_pool.publish(robots, adjacency_matrix, candidates)
             
-        best_solution = self.process_pool.get_best_result()
+            for start in range(0, len(candidates), self.chunk_size):
+                self.process_pool.submit_range(charging_threshold, operating_threshold, move_computation_enabled, start, min(start + self.chunk_size, len(candidates)), time_instants, self.event_driven)
                 
-        if self.allocation_policy is not AllocationPolicy.BRUTE_FORCE:
-            self.alloc_options = None
+            best_solution = self.keep_best(self.process_pool.get_best_result(), best_solution, best_cost)
+        else:
+            snapshot = snapshot_robots(robots)
+            for start in range(0, len(candidates), self.chunk_size):
+                self.process_pool.submit_chunk(snapshot, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, candidates[start:start + self.chunk_size], time_instants, self.event_driven)               
                 
+            best_solution = self.keep_best(self.process_pool.get_best_result(), best_solution, best_cost)
+        
+        if not self.batched:
+            self.record_pool()
         return best_solution
     
+    def record_pool(self):
+        """
+        Add the timings of the process pool (see ProcessPool.pop_timings) to the profiler: the wall time
+        spent sending messages to the workers and waiting for their results, the time the workers spent
+        evaluating the candidates and the time they could have spent (for their utilization).
+        """
+        if not self.profiler.enabled:
+            return
+        
+        timings = self.process_pool.pop_timings()
+        self.profiler.add_time("pool_submit", timings["submit"], timings["messages"])
+        self.profiler.add_time("pool_wait", timings["wait"], timings["messages"])
+        self.profiler.add_time("pool_busy", timings["busy"], timings["messages"])
+        self.profiler.count("candidates", timings["evaluated"])
+        self.profiler.count("pool_capacity_s", timings["span"] * self.process_pool.n_processes)
+    
+    def cache_prefix(self, robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants):
+        """
+        Prefix of the rollout cache keys of the allocations of this optimization, None without a cache.
+        """
+        if self.cache is None:
+            return None
+        return rollout_prefix(robots, "operation_time", charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, self.cache_quantum)
+    
+    def rollout_costs(self, robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, prefix=None):
+        """
+        Same as batch_optimize_operation_time. If prefix is given (see cache_prefix), the costs in the
+        rollout cache are reused and only the other allocations are rolled out.
+        """
+        self.profiler.count("candidates", len(allocations))
+        with self.profiler.phase("rollout"):
+            return self._rollout_costs(robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, prefix)
+    
+    def _rollout_costs(self, robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, prefix=None):
+        if prefix is None:
+            return Allocator.batch_optimize_operation_time(robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, self.event_driven, self.prefix_sharing)
+        
+        keys = [allocation_key(prefix, a) for a in allocations]
+        costs = self.cache.get_many(keys)
+        missing = [k for k, cost in enumerate(costs) if cost is None]
+        if len(missing) > 0:
+            new = Allocator.batch_optimize_operation_time(robots, [allocations[k] for k in missing], charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, self.event_driven, self.prefix_sharing)
+            for k, cost in zip(missing, new):
+                costs[k] = cost
+            self.cache.put_many([(keys[k], cost) for k, cost in zip(missing, new)])
+            
+        return np.asarray(costs, dtype=np.float64)
+    
+    def keep_best(self, pool_solution, seed, seed_cost):
+        """
+        Best allocation of the process pool, or seed if the pool did not find a strictly better one.
+        """
+        if seed is not None and not self.process_pool.best_cost < seed_cost:
+            return seed
+        return pool_solution
+    
+    def find_heuristic_allocation(self, time_instants, robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, costrained_allocation=None, seed=None):
+        """
+        Allocation of the GREEDY, MATCHING and LOCAL_SEARCH policies. The operating robots without
+        constraints offload their task to the charging robots that are not hosting. GREEDY and MATCHING
+        pair them (see greedy_pairs and matching_pairs) and keep the best number of pairs, LOCAL_SEARCH
+        improves the GREEDY allocation by simulated annealing. The costs are the ones of
+        batch_optimize_operation_time. If a seed allocation is given, it is evaluated with the others.
+        """
+        prefix = self.cache_prefix(robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants)
+        
+        def evaluate(allocations):
+            costs = []
+            for start in range(0, len(allocations), self.batch_size):
+                costs.extend(self.rollout_costs(robots, allocations[start:start + self.batch_size], charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, prefix))
+            return np.asarray(costs)
+        
+        base, offloaders, hosts = Allocator.offload_options(robots, costrained_allocation)
+        if self.allocation_policy is AllocationPolicy.MATCHING:
+            pairs = Allocator.matching_pairs(robots, base, offloaders, hosts, charging_threshold, operating_threshold, time_instants)
+        else:
+            pairs = Allocator.greedy_pairs(robots, base, offloaders, hosts, charging_threshold, operating_threshold)
+            
+        # the first k pairs, for every k
+        candidates = [list(base)]
+        for i, host in pairs:
+            candidates.append(list(candidates[-1]))
+            candidates[-1][i] = host
+        if seed is not None:
+            candidates.append(seed)
+            
+        costs = evaluate(candidates)
+        best = int(np.argmin(costs))
+        
+        if self.allocation_policy is AllocationPolicy.LOCAL_SEARCH:
+            return self.local_search(candidates[best], costs[best], offloaders, hosts, evaluate)
+        return candidates[best]
+    
+    def local_search(self, allocation, cost, offloaders, hosts, evaluate):
+        """
+        Simulated annealing over the offloads of the operating robots. At every iteration search_batch
+        random neighbours of the current allocation (an offloader is added, removed, moved to another
+        free host or swaps its host with another offloader) are evaluated together, and the best one is
+        accepted if it is better or, with a probability that decreases with the temperature, if it is
+        worse. Stops after time_budget seconds or search_iterations iterations.
+
+        Returns:
+            list: Best allocation found.
+        """
+        start = time.perf_counter()
+        current, current_cost = list(allocation), cost
+        best, best_cost = list(allocation), cost
+        if len(offloaders) == 0 or len(hosts) == 0:
+            return best
+        
+        iteration = 0
+        while True:
+            if self.time_budget is not None:
+                progress = (time.perf_counter() - start) / self.time_budget
+            else:
+                progress = iteration / self.search_iterations
+            if progress >= 1:
+                break
+            
+            neighbours = [self._random_neighbour(current, offloaders, hosts) for _ in range(self.search_batch)]
+            costs = evaluate(neighbours)
+            id = int(np.argmin(costs))
+            
+            # relative worsening accepted with probability exp(-worsening / temperature)
+            temperature = 0.01 * (1 - progress)
+            worsening = (costs[id] - current_cost) / current_cost
+            if worsening <= 0 or (temperature > 0 and self.rng.random() < np.exp(-worsening / temperature)):
+                current, current_cost = neighbours[id], costs[id]
+                
+            if current_cost < best_cost:
+                best, best_cost = list(current), current_cost
+            iteration += 1
+            
+        return best
+    
+    def _random_neighbour(self, allocation, offloaders, hosts):
+        neighbour = list(allocation)
+        offloaded = [i for i in offloaders if neighbour[i] != i]
+        used = set(neighbour[i] for i in offloaded)
+        free = [h for h in hosts if h not in used]
+        
+        moves = []
+        if len(offloaded) < len(offloaders) and len(free) > 0:
+            moves.append("add")
+        if len(offloaded) > 0:
+            moves.append("remove")
+        if len(offloaded) > 0 and len(free) > 0:
+            moves.append("move")
+        if len(offloaded) > 1:
+            moves.append("swap")
+            
+        move = moves[self.rng.integers(len(moves))]
+        if move == "add":
+            i = self.rng.choice([i for i in offloaders if neighbour[i] == i])
+            neighbour[i] = int(self.rng.choice(free))
+        elif move == "remove":
+            i = self.rng.choice(offloaded)
+            neighbour[i] = int(i)
+        elif move == "move":
+            i = self.rng.choice(offloaded)
+            neighbour[i] = int(self.rng.choice(free))
+        else:
+            i, j = self.rng.choice(offloaded, 2, replace=False)
+            neighbour[i], neighbour[j] = neighbour[j], neighbour[i]
+            
+        return neighbour
+    
+    @staticmethod
+    def offload_options(robots, constrained_allocation=None):
+        """
+        Returns:
+            tuple: The allocation in which every unconstrained robot executes its own task, the operating
+            robots that can offload their task (no constraint) and the charging robots that can host it
+            (executing their own task and not hosting a constrained task).
+        """
+        if constrained_allocation is None:
+            constrained_allocation = [-1] * len(robots)
+            
+        base = [i if id == -1 else id for i, id in enumerate(constrained_allocation)]
+        taken = set(id for i, id in enumerate(base) if id != i)
+        offloaders = [i for i, r in enumerate(robots) if r.get_status() == "operating" and constrained_allocation[i] == -1]
+        hosts = [i for i, r in enumerate(robots) if r.get_status() == "charging" and base[i] == i and i not in taken]
+        
+        return base, offloaders, hosts
+    
+    @staticmethod
+    def greedy_pairs(robots, base, offloaders, hosts, charging_threshold, operating_threshold):
+        """
+        The operating robots with the lowest battery are paired with the charging robots that will charge
+        for the longest time.
+        """
+        fleet = FleetState.from_robots(robots)
+        fleet.apply_allocations([base])
+        ticks = fleet.ticks_to_threshold(operating_threshold, charging_threshold)[0]
+        
+        offloaders = sorted(offloaders, key=lambda i: robots[i].get_battery_percentage())
+        hosts = sorted(hosts, key=lambda i: -ticks[i])
+        return list(zip(offloaders, hosts))
+    
+    @staticmethod
+    def matching_pairs(robots, base, offloaders, hosts, charging_threshold, operating_threshold, time_instants):
+        """
+        Pairs of a min-cost bipartite matching between the operating and the charging robots, that
+        maximizes the computation moved to the charging robots in the window: a charging robot hosts the
+        task until it starts operating, and the operating robot offloads it until it goes charging. The
+        pairs are sorted by decreasing computation moved.
+        """
+        if len(offloaders) == 0 or len(hosts) == 0:
+            return []
+        
+        fleet = FleetState.from_robots(robots)
+        fleet.apply_allocations([base])
+        ticks = fleet.ticks_to_threshold(operating_threshold, charging_threshold)[0]
+        
+        demand = np.array([robots[i].get_self_task().get_consumption() for i in offloaders])
+        overlap = np.minimum(np.minimum(ticks[offloaders][:, None], ticks[hosts][None, :]), time_instants)
+        moved = demand[:, None] * overlap
+        
+        assignment = min_cost_assignment(-moved)
+        pairs = [(offloaders[k], hosts[h]) for k, h in enumerate(assignment) if h != -1 and moved[k, h] > 0]
+        return sorted(pairs, key=lambda pair: -moved[offloaders.index(pair[0]), hosts.index(pair[1])])
+    
+    @staticmethod
+    def rollout_fleet(fleet, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven=False, prune=None, elapsed=None):
+        """
+        Roll forward every copy of the fleet for time_instants time instants.
+
+        Args:
+            fleet (FleetState): Fleet at the beginning of the window (modified in place).
+            time_instants (int): Length of the window.
+            event_driven (bool): If True, the linear spans between two status changes are applied in
+                one go (see FleetState.steps_to_event) and move_computation runs only at the events.
+            prune (callable): Called with the partial sums and the remaining time instants of each copy,
+                returns the copies whose rollout can be stopped.
+            elapsed (np.ndarray): Time instants of the window already elapsed for each copy (0 if None),
+                only the remaining ones are summed.
+
+        Returns:
+            tuple: For each copy, the sum over the window of the number of operating robots and of
+            the squared difference between charging and operating robots, and whether it was pruned.
+        """
+        # computed once for the topology, and shared by the rollouts of every optimization
+        labels = component_labels(adjacency_matrix) if event_driven and move_computation_enabled else None
+        
+        operating_sum = np.zeros(fleet.n_copies, dtype=np.int64)
+        missed_sum = np.zeros(fleet.n_copies, dtype=np.int64)
+        t = np.zeros(fleet.n_copies, dtype=np.int64) if elapsed is None else np.array(elapsed, dtype=np.int64)
+        pruned = np.zeros(fleet.n_copies, dtype=bool)
+        
+        while (t < time_instants).any():
+            if prune is not None:
+                pruned |= (t < time_instants) & prune(operating_sum, missed_sum, time_instants - t)
+                t[pruned] = time_instants
+                if not (t < time_instants).any():
+                    break
+                
+            active = t < time_instants
+            charging = fleet.count_status(CHARGING)
+            operating = fleet.count_status(OPERATING)
+            operating_sum += np.where(active, operating, 0)
+            missed_sum += np.where(active, (charging - operating) ** 2, 0)
+            
+            available, _ = fleet.tick(operating_threshold, charging_threshold, False)
+            
+            if move_computation_enabled:
+                fleet.move_computation(available, adjacency_matrix)
+            t += 1
+                
+            if event_driven:
+                # skip the time instants before the next event (the status of the robots does not change)
+                remaining = np.maximum(time_instants - t, 0)
+                skip = np.minimum(fleet.steps_to_event(operating_threshold, charging_threshold, labels) - 1, remaining).astype(np.int64)
+                
+                charging = fleet.count_status(CHARGING)
+                operating = fleet.count_status(OPERATING)
+                operating_sum += skip * operating
+                missed_sum += skip * (charging - operating) ** 2
+                
+                fleet.advance(skip)
+                t += skip
+                
+        return operating_sum, missed_sum, pruned
+    
+    @staticmethod
+    def batch_rollout(robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven=False, prefix_sharing=False):
+        """
+        Roll forward one copy of the fleet per allocation, all together (see rollout_fleet).
+
+        Args:
+            robots (list): Robots at the beginning of the window.
+            allocations (list): Candidate allocations, one per copy of the fleet.
+            prefix_sharing (bool): If True, use shared_rollout (same results).
+        """
+        if prefix_sharing:
+            return Allocator.shared_rollout(robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven)
+        
+        fleet = FleetState.from_robots(robots, n_copies=len(allocations))
+        fleet.apply_allocations(allocations)
+        
+        return Allocator.rollout_fleet(fleet, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven)
+    
+    @staticmethod
+    def shared_rollout(robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven=False):
+        """
+        Same as batch_rollout. The current allocation of the robots (the baseline) is rolled forward once.
+        For each allocation, only the robots whose tasks differ from the baseline, and the robots that share
+        a task with them (see FleetState.linked), are rolled forward: the other robots evolve as in the
+        baseline. An allocation continues with the full rollout (see rollout_fleet) from the first
+        move_computation that could involve its robots, and takes the remaining sums of the baseline as
+        soon as its robots are back to the baseline state. MOVE-n allocations move the tasks of a few
+        robots, so most of the work is the rollout of the baseline.
+        """
+        fleet = FleetState.from_robots(robots, n_copies=len(allocations))
+        fleet.apply_allocations(allocations)
+        base = FleetState.from_robots(robots)
+        base.apply_allocations(base.offload_to.copy())
+        
+        # Robots of each allocation that do not evolve as in the baseline
+        moved = (fleet.offload_to != base.offload_to) | (fleet.hosted_from != base.hosted_from)
+        while True:
+            linked = base.linked(fleet.linked(moved))
+            if (linked == moved).all():
+                break
+            moved = linked
+        
+        # Baseline: status at the beginning of each time instant, state after the tick (with the available
+        # robots) and after move_computation
+        start, ticked, ended, available = [], [], [], []
+        for t in range(time_instants):
+            start.append(base.status[0].copy())
+            base_available, _ = base.tick(operating_threshold, charging_threshold, False)
+            ticked.append(base.copy())
+            available.append(base_available[0])
+            if move_computation_enabled:
+                base.move_computation(base_available, adjacency_matrix)
+            ended.append(base.copy())
+        
+        start = np.array(start).reshape(time_instants, base.n_robots)
+        ticked = FleetState.concatenate(ticked) if time_instants > 0 else base
+        ended = FleetState.concatenate(ended) if time_instants > 0 else base
+        available = np.array(available, dtype=bool).reshape(time_instants, base.n_robots)
+        
+        operating = (start == OPERATING).sum(axis=1)
+        charging = (start == CHARGING).sum(axis=1)
+        # sums over the time instants before t, and from t to the end of the window
+        operating_before = np.append(0, np.cumsum(operating))
+        difference_before = np.append(0, np.cumsum(charging - operating))
+        missed_before = np.append(0, np.cumsum((charging - operating) ** 2))
+        operating_left = operating_before[-1] - operating_before
+        missed_left = missed_before[-1] - missed_before
+        
+        # Robots of the baseline that move_computation could match after the tick of each time instant
+        can_host = available & ~ticked.is_hosting()
+        free = ~ticked.has_offloaded() & (ticked.status == OPERATING)
+        any_host = can_host.any(axis=1)
+        
+        if event_driven:
+            # number of time instants from t in which the status of each robot of the baseline (and whether it
+            # can be matched) stays the same, and in which no robot of the baseline can host
+            code = start + 2 * can_host + 4 * free if move_computation_enabled else start
+            steady = np.ones((time_instants, base.n_robots), dtype=np.int64)
+            no_host = np.zeros(time_instants + 1, dtype=np.int64)
+            for t in range(time_instants - 1, -1, -1):
+                if t < time_instants - 1:
+                    steady[t] = np.where(code[t] == code[t + 1], steady[t + 1] + 1, 1)
+                no_host[t] = 0 if any_host[t] else no_host[t + 1] + 1
+        
+        operating_sum = np.full(fleet.n_copies, operating_left[0], dtype=np.int64)
+        missed_sum = np.full(fleet.n_copies, missed_left[0], dtype=np.int64)
+        diverged = []
+        
+        def follow(copies, columns):
+            """
+            Roll forward the given robots of the given copies, that have the same constants. As in
+            rollout_fleet, each copy has its own time instant t.
+            """
+            sub = fleet.select(copies).extract(columns)
+            t = np.zeros(len(copies), dtype=np.int64)
+            partial_operating = np.zeros(len(copies), dtype=np.int64)
+            partial_missed = np.zeros(len(copies), dtype=np.int64)
+            
+            while len(copies) > 0:
+                # difference between the number of operating (charging) robots of the copy and of the baseline
+                rows = t[:, None]
+                delta_operating = sub.count_status(OPERATING) - (start[rows, columns] == OPERATING).sum(axis=1)
+                delta_charging = sub.count_status(CHARGING) - (start[rows, columns] == CHARGING).sum(axis=1)
+                partial_operating += operating[t] + delta_operating
+                partial_missed += (charging[t] + delta_charging - operating[t] - delta_operating) ** 2
+                
+                sub_available, _ = sub.tick(operating_threshold, charging_threshold, False)
+                
+                leave = np.zeros(len(copies), dtype=bool)
+                if move_computation_enabled:
+                    sub_free = (~sub.has_offloaded() & (sub.status == OPERATING)).any(axis=1)
+                    leave = (sub_available & ~sub.is_hosting()).any(axis=1) | can_host[rows, columns].any(axis=1)
+                    leave |= any_host[t] & (sub_free | free[rows, columns].any(axis=1))
+                    
+                    # the whole fleet is rebuilt and continues with the full rollout
+                    if leave.any():
+                        d = np.flatnonzero(leave)
+                        full = ticked.select(t[d])
+                        full.embed(sub.select(d), columns[d])
+                        full_available = available[t[d]]
+                        full_available[np.arange(len(d))[:, None], columns[d]] = sub_available[d]
+                        full.move_computation(full_available, adjacency_matrix)
+                        diverged.append((full, copies[d], t[d] + 1, partial_operating[d], partial_missed[d]))
+                
+                back = (sub.battery_level == ended.battery_level[rows, columns]).all(axis=1) & ~leave
+                if back.any():
+                    offload_to, hosted_from = sub.original_tasks(columns)
+                    back &= ((sub.status == ended.status[rows, columns]) & (offload_to == ended.offload_to[rows, columns]) & (hosted_from == ended.hosted_from[rows, columns])).all(axis=1)
+                operating_sum[copies[back]] = partial_operating[back] + operating_left[t[back] + 1]
+                missed_sum[copies[back]] = partial_missed[back] + missed_left[t[back] + 1]
+                
+                t += 1
+                if event_driven:
+                    # skip the time instants in which neither the robots of the copy nor the ones of the
+                    # baseline change status, and the checks above cannot succeed
+                    rows = np.minimum(t, time_instants - 1)[:, None]
+                    skip = np.minimum(sub.steps_to_event(operating_threshold, charging_threshold) - 1, time_instants - t)
+                    skip = np.minimum(skip, steady[rows, columns].min(axis=1)).astype(np.int64)
+                    if move_computation_enabled:
+                        waiting = (sub.status == CHARGING) & ~sub.is_hosting()
+                        skip = np.where(waiting.any(axis=1) | can_host[rows, columns].any(axis=1), 0, skip)
+                        matchable = (~sub.has_offloaded() & (sub.status == OPERATING)).any(axis=1) | free[rows, columns].any(axis=1)
+                        skip = np.where(matchable, np.minimum(skip, no_host[rows[:, 0]]), skip)
+                    skip = np.where(leave | back, 0, skip)
+                    
+                    delta_operating = sub.count_status(OPERATING) - (start[rows, columns] == OPERATING).sum(axis=1)
+                    delta_charging = sub.count_status(CHARGING) - (start[rows, columns] == CHARGING).sum(axis=1)
+                    excess = delta_charging - delta_operating
+                    difference = difference_before[t + skip] - difference_before[t]
+                    partial_operating += operating_before[t + skip] - operating_before[t] + skip * delta_operating
+                    partial_missed += missed_before[t + skip] - missed_before[t] + 2 * excess * difference + skip * excess ** 2
+                    
+                    sub.advance(skip)
+                    t += skip
+                
+                done = (t >= time_instants) & ~leave & ~back
+                operating_sum[copies[done]] = partial_operating[done]
+                missed_sum[copies[done]] = partial_missed[done]
+                
+                keep = ~(leave | back | done)
+                if not keep.all():
+                    sub = sub.select(keep)
+                    copies, columns, t = copies[keep], columns[keep], t[keep]
+                    partial_operating, partial_missed = partial_operating[keep], partial_missed[keep]
+        
+        # the allocations are grouped by number and constants of the moved robots
+        constants = np.stack([base.total_battery, base.charge_rate, base.discharge_rate, base.task_demand], axis=1)
+        kind = np.unique(constants, axis=0, return_inverse=True)[1].ravel()
+        size = moved.sum(axis=1)
+        for k in np.unique(size[size > 0]).tolist():
+            copies = np.flatnonzero(size == k)
+            columns = np.nonzero(moved[copies])[1].reshape(-1, k)
+            group = np.unique(kind[columns], axis=0, return_inverse=True)[1].ravel()
+            for g in np.unique(group).tolist():
+                follow(copies[group == g], columns[group == g])
+        
+        if len(diverged) > 0:
+            full = FleetState.concatenate([d[0] for d in diverged])
+            copies, elapsed, partial_operating, partial_missed = (np.concatenate([d[k] for d in diverged]) for k in range(1, 5))
+            rest_operating, rest_missed, _ = Allocator.rollout_fleet(full, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven, elapsed=elapsed)
+            operating_sum[copies] = partial_operating + rest_operating
+            missed_sum[copies] = partial_missed + rest_missed
+        
+        return operating_sum, missed_sum, np.zeros(fleet.n_copies, dtype=bool)
+    
+    @staticmethod
+    def batch_optimize_missed_chanches(robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven=False, prefix_sharing=False):
+        """
+        Same as optimize_missed_chanches, for every allocation. Returns an array with one cost per allocation.
+        """
+        _, missed_sum, _ = Allocator.batch_rollout(robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven, prefix_sharing)
+        return missed_sum
+    
+    @staticmethod
+    def batch_optimize_operation_time(robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven=False, prefix_sharing=False):
+        """
+        Same as optimize_operation_time, for every allocation. Returns an array with one cost per allocation.
+        """
+        operating_sum, _, _ = Allocator.batch_rollout(robots, allocations, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven, prefix_sharing)
+        return 1/operating_sum
+    
+    @staticmethod
+    def event_optimize_missed_chanches(robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, bound=None):
+        """
+        Same as optimize_missed_chanches, computed with the event-driven rollout.
+        """
+        def prune(operating_sum, missed_sum, remaining):
+            return missed_sum >= bound()
+        
+        fleet = FleetState.from_robots(robots)
+        _, missed_sum, pruned = Allocator.rollout_fleet(fleet, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven=True, prune=prune if bound is not None else None)
+        return np.inf if pruned[0] else missed_sum[0]
+    
+    @staticmethod
+    def event_optimize_operation_time(robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, bound=None):
+        """
+        Same as optimize_operation_time, computed with the event-driven rollout.
+        """
+        def prune(operating_sum, missed_sum, remaining):
+            return Allocator.operation_time_lower_bound(operating_sum, remaining, len(robots)) >= bound()
+        
+        fleet = FleetState.from_robots(robots)
+        operating_sum, _, pruned = Allocator.rollout_fleet(fleet, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, event_driven=True, prune=prune if bound is not None else None)
+        return np.inf if pruned[0] else 1/operating_sum[0]
+    
+    @staticmethod
+    def operation_time_lower_bound(operating_sum, remaining, n_robots):
+        """
+        Lowest cost of optimize_operation_time that can still be reached, i.e. if every robot operates
+        for the remaining time instants.
+        """
+        return 1/(operating_sum + remaining*n_robots)
+    
     @staticmethod
-    def optimize_missed_chanches(robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants):
+    def optimize_missed_chanches(robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, bound=None):
+        """
+        If bound is given (a function returning the best cost found so far), the rollout is stopped and
+        np.inf is returned as soon as the cost cannot be lower than the bound.
+        """
+        RobotIndex(robots)
         res = []
 
-        for _ in range(time_instants):
+        for t in range(time_instants):
+            if bound is not None and t%PRUNING_INTERVAL == 0 and np.sum(res) >= bound():
+                return np.inf
+            
             charging = 0
             operating = 0
             for r in robots:
@@ -294,10 +1496,18 @@ class Allocator:
         return np.sum(res)   
 
     @staticmethod
-    def optimize_operation_time(robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants):
+    def optimize_operation_time(robots, charging_threshold, operating_threshold, move_computation_enabled, adjacency_matrix, time_instants, bound=None):
+        """
+        If bound is given (a function returning the best cost found so far), the rollout is stopped and
+        np.inf is returned as soon as the cost cannot be lower than the bound.
+        """
+        RobotIndex(robots)
         res = []
 
-        for _ in range(time_instants):
+        for t in range(time_instants):
+            if bound is not None and t%PRUNING_INTERVAL == 0 and Allocator.operation_time_lower_bound(np.sum(res), time_instants - t, len(robots)) >= bound():
+                return np.inf
+            
             charging = 0
             operating = 0
             for r in robots:
@@ -316,25 +1526,22 @@ class Allocator:
     
 
 if __name__ == "__main__":
-    # Example usage
-    task_requirements = [20, 20]
-    battery_levels = [80, 20]
-    battery_status = ['operating', 'operating']
-    discharge_rate = [5, 5]
-    charge_rate = [5, 5]
-    costrained_allocation = [-1, -1, 0, -1, -1, -1]
-    time_instants = 5
-
-    # bf = Allocator(8, AllocationPolicy.BRUTE_FORCE)
-    # bf.print_powerset_count()
+    # Example usage: best MOVE1 allocation of 6 robots over the next 10 epochs, with the task of robot 2
+    # constrained to robot 0 (a charging robot)
+    from src.robot import Robot
+    from src.utils import compute_adjacency_matrix
     
-    bf = Allocator(6, AllocationPolicy.MOVE1)
-    bf.find_best_allocation(10, {}, 0.15, 0.85, True, [], costrained_allocation)
+    battery_levels = [80, 20, 60, 40, 90, 30]
+    battery_status = ['charging', 'operating', 'operating', 'charging', 'operating', 'operating']
+    costrained_allocation = [0, -1, 0, 3, -1, -1]
+    time_instants = 10
     
-    # bf = Allocator(8, AllocationPolicy.MOVE2)
+    robots = [Robot(i, battery_level=bl, total_battery=100, status=status, charge_rate=5, disharge_rate=5, task_demand=20) for i, (bl, status) in enumerate(zip(battery_levels, battery_status))]
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+
+    # bf = Allocator(8, AllocationPolicy.BRUTE_FORCE)
     # bf.print_powerset_count()
     
-    # bf = Allocator(8, AllocationPolicy.MOVE3)
-    # bf.print_powerset_count()
-    # bf.print_powerset()
-    #print(bf.find_best_allocation(task_requirements, battery_levels, battery_status, discharge_rate, charge_rate, time_instants, costrained_allocation))
\ No newline at end of file
+    bf = Allocator(len(robots), AllocationPolicy.MOVE1, n_processes=2)
+    print(bf.find_best_allocation(time_instants, robots, 0.15, 0.85, True, adjacency_matrix, costrained_allocation))
+    bf.terminate()
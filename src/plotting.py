@@ -0,0 +1,148 @@
+import os
+import multiprocessing as mp
+from enum import Enum
+import numpy as np
+import matplotlib.pyplot as plt
+
+class PlotMode(Enum):
+    OFF = 1         # no plot
+    INLINE = 2      # plotted at the end of Simulator.run
+    BACKGROUND = 3  # plotted by a separate process, Simulator.run does not wait for it (see Simulator.wait_plot)
+
+# Percentiles of the battery levels of the fleet shown as bands (pairs of lower and upper percentiles)
+PERCENTILE_BANDS = ((5, 95), (25, 75))
+
+def bucket_bounds(n, max_points):
+    """
+    Boundaries of the buckets of consecutive samples used to downsample n samples to about max_points
+    points (one bucket per sample if n is small enough).
+    """
+    n_buckets = max(1, min(n, max_points // 2))
+    return np.linspace(0, n, n_buckets + 1).astype(np.int64)
+
+def downsample(values, max_points=2000):
+    """
+    Downsample a series keeping, for each bucket of consecutive samples, its minimum and its maximum
+    in time order, so that peaks and valleys survive (unlike plain decimation).
+
+    Returns:
+        tuple: Indices of the kept samples and their values.
+    """
+    values = np.asarray(values)
+    if len(values) <= max_points:
+        return np.arange(len(values)), values
+
+    bounds = bucket_bounds(len(values), max_points)
+    starts = bounds[:-1]
+    lows = np.minimum.reduceat(values, starts)
+    highs = np.maximum.reduceat(values, starts)
+
+    # position of the minimum and of the maximum in each bucket
+    index = np.arange(len(values))
+    bucket = np.repeat(np.arange(len(starts)), np.diff(bounds))
+    low_at = np.full(len(starts), len(values))
+    high_at = np.full(len(starts), len(values))
+    np.minimum.at(low_at, bucket[values == lows[bucket]], index[values == lows[bucket]])
+    np.minimum.at(high_at, bucket[values == highs[bucket]], index[values == highs[bucket]])
+
+    kept = np.unique(np.concatenate([low_at, high_at]))
+    return kept, values[kept]
+
+def fleet_percentiles(levels, chunk_size=4096):
+    """
+    Percentiles of the battery levels of the robots at each epoch (see PERCENTILE_BANDS), plus the
+    median, computed chunk_size epochs at a time.
+
+    Args:
+        levels (np.ndarray): Battery levels of shape (epochs, n_robots), e.g. a memory map.
+
+    Returns:
+        dict: Series of shape (epochs,) by percentile.
+    """
+    percentiles = sorted({p for band in PERCENTILE_BANDS for p in band} | {50})
+    result = {p: np.empty(len(levels)) for p in percentiles}
+    for start in range(0, len(levels), chunk_size):
+        chunk = np.asarray(levels[start:start + chunk_size])
+        for p, values in zip(percentiles, np.percentile(chunk, percentiles, axis=1)):
+            result[p][start:start + chunk_size] = values
+    return result
+
+def plot_robots(directory, levels, robot_names, max_points=2000):
+    """
+    One subplot per robot with its battery level over time (downsampled), saved as battery_levels.png.
+    """
+    num_robots = len(robot_names)
+    _, axs = plt.subplots(num_robots, 1, figsize=(8, 6*num_robots), squeeze=False)
+
+    for i, robot in enumerate(robot_names):
+        x, y = downsample(levels[:, i], max_points)
+        ax = axs[i, 0]
+        ax.plot(x, y, label=robot)
+        ax.set_xlabel('Time')
+        ax.set_ylabel('Battery Level')
+        ax.set_title(f'Battery Levels of {robot} Over Time')
+        ax.legend()
+
+    plt.savefig(os.path.join(directory, "battery_levels.png"))
+    plt.close()
+
+def plot_fleet(directory, levels, status, max_points=2000):
+    """
+    Percentile bands of the battery levels of the fleet and number of charging and operating robots
+    over time, saved as fleet_status.png. Each bucket of epochs is drawn with the lowest lower
+    percentile and the highest upper percentile it contains.
+
+    Args:
+        levels (np.ndarray): Battery levels of shape (epochs, n_robots).
+        status (np.ndarray): Rows of epoch, charging and operating robots (see src.results).
+    """
+    percentiles = fleet_percentiles(levels)
+    bounds = bucket_bounds(len(levels), 2 * max_points)
+    starts = bounds[:-1]
+
+    _, (ax_battery, ax_status) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+    for alpha, (low, high) in zip((0.2, 0.4), PERCENTILE_BANDS):
+        ax_battery.fill_between(starts, np.minimum.reduceat(percentiles[low], starts), np.maximum.reduceat(percentiles[high], starts), alpha=alpha, color="tab:blue", label=f"p{low}-p{high}")
+    median = np.add.reduceat(percentiles[50], starts) / np.diff(bounds)
+    ax_battery.plot(starts, median, color="tab:blue", label="median")
+    ax_battery.set_ylabel('Battery Level')
+    ax_battery.set_title(f'Battery Levels of the Fleet ({levels.shape[1]} robots)')
+    ax_battery.legend()
+
+    for column, name in ((1, "charging"), (2, "operating")):
+        x, y = downsample(np.asarray(status[:, column]), max_points)
+        ax_status.plot(np.asarray(status[x, 0]), y, label=name)
+    ax_status.set_xlabel('Time')
+    ax_status.set_ylabel('Robots')
+    ax_status.legend()
+
+    plt.savefig(os.path.join(directory, "fleet_status.png"))
+    plt.close()
+
+def plot_results(directory, robot_names=None, max_points=2000, max_robots=16):
+    """
+    Plot the results saved by a simulation in directory (see src.results): the fleet view, and the
+    battery levels of each robot if the fleet has at most max_robots robots.
+
+    Args:
+        robot_names (list): Names of the robots, in the order of the columns (their index if None).
+        max_points (int): Maximum number of points of each series.
+    """
+    levels = np.load(os.path.join(directory, "battery_levels.npy"), mmap_mode="r")
+    status = np.load(os.path.join(directory, "robot_status.npy"), mmap_mode="r")
+    if robot_names is None:
+        robot_names = list(range(levels.shape[1]))
+
+    if len(levels) == 0:
+        return
+    plot_fleet(directory, levels, status, max_points)
+    if len(robot_names) <= max_robots:
+        plot_robots(directory, levels, robot_names, max_points)
+
+def start_plot_process(directory, robot_names=None, max_points=2000, max_robots=16):
+    """
+    Run plot_results in a separate process, that the caller must join.
+    """
+    p = mp.Process(target=plot_results, args=(directory, robot_names, max_points, max_robots))
+    p.start()
+    return p
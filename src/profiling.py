@@ -0,0 +1,151 @@
+import os
+import time
+from collections import defaultdict
+import pandas as pd
+
+class Phase:
+    """
+    Context manager that adds its wall time to a phase of a Profiler.
+    """
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+
+class NullPhase:
+    """
+    Context manager that does nothing, used by disabled profilers.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NULL_PHASE = NullPhase()
+
+class Profiler:
+    """
+    Wall time of the phases of a simulation (e.g. tick, move_computation, optimize_computation,
+    rollout), counters (e.g. evaluated candidates) and their value in each epoch. A disabled profiler
+    records nothing: phase returns a shared context manager that does nothing and count returns at once.
+
+    The phases can be nested, so their times do not add up to the time of the run.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.stop = None
+
+        # total time and number of calls of each phase
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+
+        # total of each counter, and counters and phase times of each epoch in which they changed
+        self.counters = defaultdict(float)
+        self.epoch = None
+        self.epochs = {}
+
+    def phase(self, name):
+        """
+        Context manager that measures the wall time of a phase, e.g. with profiler.phase("tick"): ...
+        """
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+    def add_time(self, name, seconds, calls=1):
+        """
+        Add seconds of wall time (measured elsewhere, e.g. by the process pool workers) to a phase.
+        """
+        if not self.enabled:
+            return
+        self.times[name] += seconds
+        self.calls[name] += calls
+        if self.epoch is not None:
+            row = self.epochs.setdefault(self.epoch, defaultdict(float))
+            row[name + "_s"] += seconds
+
+    def count(self, name, value=1):
+        """
+        Add value to a counter, in total and in the current epoch (see set_epoch).
+        """
+        if not self.enabled:
+            return
+        self.counters[name] += value
+        if self.epoch is not None:
+            row = self.epochs.setdefault(self.epoch, defaultdict(float))
+            row[name] += value
+
+    def begin(self):
+        """
+        Start of the profiled run: its wall time is measured from now.
+        """
+        self.start = time.perf_counter()
+        self.stop = None
+
+    def set_epoch(self, epoch):
+        """
+        Epoch of the times and counters recorded from now on (None to record only the totals).
+        """
+        self.epoch = epoch
+
+    def finish(self):
+        """
+        End of the profiled run: its wall time is measured up to now.
+        """
+        self.stop = time.perf_counter()
+
+    def wall_time(self):
+        return (self.stop if self.stop is not None else time.perf_counter()) - self.start
+
+    def summary(self, epochs=None):
+        """
+        Totals of the run: wall time, counters and their rates, and utilization of the process pool
+        workers (the time they spent evaluating allocations over the time they were given work, see
+        ProcessPool.pop_timings).
+
+        Args:
+            epochs (int): Number of simulated epochs, for the epochs/sec rate.
+        """
+        wall_time = self.wall_time()
+        summary = {"wall_time_s": wall_time}
+        if epochs is not None:
+            summary["epochs"] = epochs
+            summary["epochs_per_s"] = epochs / wall_time if wall_time > 0 else 0.0
+        for name, value in self.counters.items():
+            summary[name] = value
+        if "candidates" in self.counters and self.times.get("optimize_computation", 0) > 0:
+            summary["candidates_per_s"] = self.counters["candidates"] / self.times["optimize_computation"]
+        if self.counters.get("pool_capacity_s", 0) > 0:
+            summary["worker_utilization"] = self.times.get("pool_busy", 0) / self.counters["pool_capacity_s"]
+        return summary
+
+    def dump(self, directory, epochs=None):
+        """
+        Write the timing report in directory:
+        - profile.csv: calls, total and mean time of each phase, and share of the wall time of the run
+        - profile_summary.csv: see summary
+        - profile_epochs.csv: counters and phase times of each epoch in which they changed
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        wall_time = self.wall_time()
+        phases = [{"phase": name, "calls": self.calls[name], "total_s": total, "mean_ms": 1000 * total / max(1, self.calls[name]), "share": total / wall_time if wall_time > 0 else 0.0} for name, total in sorted(self.times.items(), key=lambda item: -item[1])]
+        pd.DataFrame(phases, columns=["phase", "calls", "total_s", "mean_ms", "share"]).to_csv(os.path.join(directory, "profile.csv"), index=False)
+        pd.DataFrame([self.summary(epochs)]).to_csv(os.path.join(directory, "profile_summary.csv"), index=False)
+
+        rows = [dict(row, epoch=epoch) for epoch, row in sorted(self.epochs.items())]
+        columns = ["epoch"] + sorted({name for row in self.epochs.values() for name in row})
+        pd.DataFrame(rows, columns=columns).fillna(0).to_csv(os.path.join(directory, "profile_epochs.csv"), index=False)
@@ -0,0 +1,151 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Columns of the status counts, as in robot_status.csv
+STATUS_COLUMNS = ("epoch", "charging", "operating")
+
+def staging_directory(directory):
+    """
+    Hidden directory in which the results of directory are written until they are complete.
+    """
+    head, name = os.path.split(os.path.normpath(directory))
+    return os.path.join(head, "." + name + ".tmp")
+
+class ResultsSink:
+    """
+    Per-epoch traces of a simulation, written to disk in chunks so that the memory used does not grow
+    with the number of epochs. The traces are stored in the directory of the simulation as .npy files
+    (one row per epoch), opened as memory maps:
+    - battery_levels.npy: battery percentage of each robot, of shape (epochs, n_robots)
+    - robot_status.npy: epoch, number of charging and number of operating robots, of shape (epochs, 3)
+
+    At most chunk_size epochs are buffered in memory before being written.
+
+    While the simulation runs, the files are written in a hidden staging directory next to the final one
+    (e.g. res/.reference.tmp for res/reference), that commit moves into place and discard deletes, so
+    that a failed run leaves no partial results among the complete ones.
+    """
+    def __init__(self, directory, robot_names, epochs, chunk_size=4096):
+        self.target = directory
+        self.directory = staging_directory(directory)
+        if os.path.exists(self.directory):
+            # left by a run that was killed
+            shutil.rmtree(self.directory)
+        os.makedirs(self.directory)
+
+        self.robot_names = list(robot_names)
+        self.epochs = epochs
+        self.chunk_size = chunk_size
+
+        self.battery = np.lib.format.open_memmap(os.path.join(self.directory, "battery_levels.npy"), mode="w+", dtype=np.float64, shape=(epochs, len(self.robot_names)))
+        self.status = np.lib.format.open_memmap(os.path.join(self.directory, "robot_status.npy"), mode="w+", dtype=np.int64, shape=(epochs, len(STATUS_COLUMNS)))
+
+        # buffered rows of each trace, and first epoch that has not been written yet
+        self.battery_buffer = np.zeros((chunk_size, len(self.robot_names)), dtype=np.float64)
+        self.status_buffer = np.zeros((chunk_size, len(STATUS_COLUMNS)), dtype=np.int64)
+        self.battery_written = 0
+        self.battery_buffered = 0
+        self.status_written = 0
+        self.status_buffered = 0
+
+    def add_battery(self, values):
+        """
+        Battery percentages of the robots at the next epoch.
+        """
+        self.add_battery_trace(np.asarray(values, dtype=np.float64)[None, :])
+
+    def add_battery_trace(self, trace):
+        """
+        Battery percentages of the robots at the next epochs, of shape (steps, n_robots).
+        """
+        self.battery_written, self.battery_buffered = self._add(self.battery, self.battery_buffer, self.battery_written, self.battery_buffered, trace)
+
+    def add_status(self, first_epoch, charging, operating, steps=1):
+        """
+        Number of charging and operating robots, the same for steps epochs starting at first_epoch.
+        """
+        rows = np.empty((steps, len(STATUS_COLUMNS)), dtype=np.int64)
+        rows[:, 0] = np.arange(first_epoch, first_epoch + steps)
+        rows[:, 1] = charging
+        rows[:, 2] = operating
+        self.status_written, self.status_buffered = self._add(self.status, self.status_buffer, self.status_written, self.status_buffered, rows)
+
+    def _add(self, target, buffer, written, buffered, rows):
+        """
+        Append rows to a buffer, writing the buffer to the target memory map every time it is full.
+        Returns the new number of written and buffered rows.
+        """
+        start = 0
+        while start < len(rows):
+            n = min(len(rows) - start, len(buffer) - buffered)
+            buffer[buffered:buffered + n] = rows[start:start + n]
+            buffered += n
+            start += n
+            if buffered == len(buffer):
+                written = self._write(target, buffer, written, buffered)
+                buffered = 0
+        return written, buffered
+
+    @staticmethod
+    def _write(target, buffer, written, buffered):
+        if buffered == 0:
+            return written
+        target[written:written + buffered] = buffer[:buffered]
+        target.flush()
+        return written + buffered
+
+    def flush(self):
+        """
+        Write the buffered rows.
+        """
+        self.battery_written = self._write(self.battery, self.battery_buffer, self.battery_written, self.battery_buffered)
+        self.battery_buffered = 0
+        self.status_written = self._write(self.status, self.status_buffer, self.status_written, self.status_buffered)
+        self.status_buffered = 0
+
+    def commit(self):
+        """
+        Move the staging directory to the final one, replacing the results of a previous run, if any.
+        The files written from now on (e.g. the plots) go directly to the final directory.
+        """
+        self.flush()
+        self.battery = None
+        self.status = None
+        if os.path.exists(self.target):
+            shutil.rmtree(self.target)
+        os.replace(self.directory, self.target)
+        self.directory = self.target
+
+    def discard(self):
+        """
+        Delete the staging directory and everything written in it.
+        """
+        self.battery = None
+        self.status = None
+        if self.directory != self.target and os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+
+    def battery_levels(self):
+        """
+        Battery percentages written so far, of shape (epochs, n_robots) (a read only memory map).
+        """
+        self.flush()
+        return np.load(os.path.join(self.directory, "battery_levels.npy"), mmap_mode="r")[:self.battery_written]
+
+    def status_counts(self):
+        """
+        Status counts written so far, of shape (epochs, 3) (a read only memory map).
+        """
+        self.flush()
+        return np.load(os.path.join(self.directory, "robot_status.npy"), mmap_mode="r")[:self.status_written]
+
+    def write_status_csv(self, path):
+        """
+        Write the status counts as a CSV file (same format of robot_status.csv), chunk_size rows at a time.
+        """
+        counts = self.status_counts()
+        pd.DataFrame(columns=list(STATUS_COLUMNS)).to_csv(path, index=False)
+        for start in range(0, len(counts), self.chunk_size):
+            pd.DataFrame(np.asarray(counts[start:start + self.chunk_size]), columns=list(STATUS_COLUMNS)).to_csv(path, mode="a", header=False, index=False)
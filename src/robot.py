@@ -1,6 +1,57 @@
 from src.task import Task
 
+CHARGING = 0
+OPERATING = 1
+
+STATUS_CODES = {"charging": CHARGING, "operating": OPERATING}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+STAT_KEYS = ("operation_time", "charging_time", "n_charging", "n_operating", "n_offloaded", "n_hosted", "computation", "free_computing", "self_computing", "offload_computing")
+
+class RobotStats:
+    """
+    Fixed layout record of the stats of a robot, with one slot for each key of STAT_KEYS. It can be read
+    and updated as a dict (stats["n_hosted"] += 1) or by attribute.
+    """
+    __slots__ = STAT_KEYS
+
+    def __init__(self, values=None):
+        self.set_values((0,) * len(STAT_KEYS) if values is None else values)
+
+    def __getstate__(self):
+        return tuple(self.values())
+
+    def __setstate__(self, state):
+        self.set_values(state)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(STAT_KEYS)
+
+    def __len__(self):
+        return len(STAT_KEYS)
+
+    def keys(self):
+        return STAT_KEYS
+
+    def values(self):
+        return [getattr(self, key) for key in STAT_KEYS]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in STAT_KEYS]
+
+    def set_values(self, values):
+        for key, value in zip(STAT_KEYS, values):
+            setattr(self, key, value)
+
 class Robot:
+    __slots__ = ("name", "battery_level", "total_battery", "status_code", "charge_rate", "discharge_rate", "hosted_task", "index", "self_task", "stats")
+
     def __init__(self, name, battery_level=50, total_battery=100, status="operating", charge_rate=5, disharge_rate=1, task_demand=1):
         self.name = int(name)
         self.battery_level = battery_level
@@ -9,6 +60,7 @@ class Robot:
         self.charge_rate = charge_rate
         self.discharge_rate = disharge_rate
         self.hosted_task = None
+        self.index = None
         self.self_task = Task(self, task_demand)
         self.self_task.assign_to(self)
         
@@ -17,9 +69,25 @@ class Robot:
     def __str__(self) -> str:
         return f"{self.name} ({self.battery_level})"
     
+    # pickled as a tuple of the slot values, in the order of __slots__
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in Robot.__slots__)
+    
+    def __setstate__(self, state):
+        for slot, value in zip(Robot.__slots__, state):
+            setattr(self, slot, value)
+    
     def __eq__(self, value: object) -> bool:
         return self.name == value.name
     
+    @property
+    def status(self):
+        return STATUS_NAMES[self.status_code]
+    
+    @status.setter
+    def status(self, status):
+        self.status_code = STATUS_CODES[status] if isinstance(status, str) else status
+    
     def get_name(self):
         return self.name
     
@@ -39,24 +107,24 @@ class Robot:
         return self.charge_rate
     
     def initialize_stats(self):
-        self.stats = {}
-        self.stats["operation_time"] = 0 # done
-        self.stats["charging_time"] = 0 # done
-        self.stats["n_charging"] = 0 # done
-        self.stats["n_operating"] = 0 # done
-        self.stats["n_offloaded"] = 0 # done
-        self.stats["n_hosted"] = 0 # done
-        self.stats["computation"] = 0 # done
-        self.stats["free_computing"] = 0 # done
-        self.stats["self_computing"] = 0 # done
-        self.stats["offload_computing"] = 0 # done
+        self.stats = RobotStats()
         
     def update_computation(self):
+        """
+        Compute the hosted task and, if not offloaded, the own task of the robot for one epoch.
+
+        Returns:
+            int: Number of computed tasks.
+        """
+        computed = 0
         if self.hosted_task is not None:
-            self.stats["computation"] += 1
+            computed += 1
             
         if not self.has_offloaded():
-            self.stats["computation"] += 1
+            computed += 1
+            
+        self.stats.computation += computed
+        return computed
             
     def get_stats(self):
         return self.stats
@@ -65,11 +133,13 @@ class Robot:
         if self.hosted_task is not None:
             return False
         self.hosted_task = task
-        self.stats["n_hosted"] += 1
+        self.stats.n_hosted += 1
+        self.update_index()
         return True 
     
     def unhost(self):
         self.hosted_task = None
+        self.update_index()
     
     def get_hosted_task(self):
         return self.hosted_task
@@ -81,10 +151,10 @@ class Robot:
         return self.status
     
     def charge(self):
-        self.status = "charging"
+        self.status_code = CHARGING
         
         # if the robot task was offloaded, unoffload it
-        if self.self_task.get_to() != self:
+        if self.has_offloaded():
             self.self_task.get_to().unhost()
             self.self_task.assign_to(self)
             
@@ -92,62 +162,142 @@ class Robot:
         #     self.hosted_task.get_from().unoffload()
         #     self.hosted_task = None
         
-        self.stats["n_charging"] += 1
+        self.stats.n_charging += 1
+        self.update_index()
         
     def operate(self):  
-        self.status = "operating"
+        self.status_code = OPERATING
         
         # if the robot is hosting a task, unoffload it
         if self.hosted_task is not None:
             self.hosted_task.get_from().unoffload()
             self.hosted_task = None
             
-        self.stats["n_operating"] += 1
+        self.stats.n_operating += 1
+        self.update_index()
         
     def offload(self, robot):
         self.self_task.assign_to(robot)
-        self.stats["n_offloaded"] += 1
+        self.stats.n_offloaded += 1
+        self.update_index()
         
     def get_self_task(self):
         return self.self_task
         
     def has_offloaded(self):
-        return self.self_task.get_to() != self
+        return self.self_task.to_robot.name != self.name
         
     def unoffload(self):
         self.self_task.assign_to(self)
+        self.update_index()
+        
+    def update_index(self):
+        if self.index is not None:
+            self.index.update(self)
+            
+    def snapshot(self):
+        """
+        Flat tuple with the state of the robot: name, battery level, total battery, status, charge rate,
+        discharge rate, task demand, name of the robot executing its task, name of the robot whose task
+        it is hosting (-1 if none) and stats (in the order of STAT_KEYS).
+        """
+        source = -1 if self.hosted_task is None else self.hosted_task.get_from().get_name()
+        return (self.name, self.battery_level, self.total_battery, self.status_code, self.charge_rate, self.discharge_rate, self.self_task.get_consumption(), self.self_task.get_to().get_name(), source, tuple(self.stats.values()))
+    
+    def restore(self, snapshot, robots):
+        """
+        Restore the state of a snapshot of the same robot. The tasks are linked to the robots of the
+        fleet (a list in which the position matches the robot name).
+        """
+        _, self.battery_level, _, self.status_code, _, _, _, to, source, stats = snapshot
+        self.self_task.assign_to(robots[to])
+        self.hosted_task = None if source == -1 else robots[source].get_self_task()
+        self.stats.set_values(stats)
+        self.update_index()
 
     def tick(self):
-        if self.status == "charging":
-            self.stats["charging_time"] += 1
+        stats = self.stats
+        if self.status_code == CHARGING:
+            stats.charging_time += 1
             # charge the battery
             self.battery_level += self.charge_rate
             
             # if the robot is hosting a task, consume the battery
             if self.hosted_task is not None:
-                self.stats["free_computing"] += self.hosted_task.get_consumption()
+                stats.free_computing += self.hosted_task.consumption
                 # self.battery_level -= self.hosted_task.get_consumption()
                                 
             # TODO: might be removed in future. If the device is charging we can assume that the self task is not executed
             if not self.has_offloaded():
-                self.stats["self_computing"] += self.self_task.get_consumption()
+                stats.self_computing += self.self_task.consumption
                 
             # check if the battery level is greater than the total battery
             if self.battery_level > self.total_battery:
                 self.battery_level = self.total_battery
-        elif self.status == "operating":
-            self.stats["operation_time"] += 1
+        elif self.status_code == OPERATING:
+            stats.operation_time += 1
             # discharge the battery
             self.battery_level -= self.discharge_rate
             
             # if the robot is hosting its own task, consume the battery
             if not self.has_offloaded():
-                self.battery_level -= self.self_task.get_consumption()
-                self.stats["self_computing"] += self.self_task.get_consumption()
+                self.battery_level -= self.self_task.consumption
+                stats.self_computing += self.self_task.consumption
                 
             if self.hosted_task is not None:
-                self.battery_level -= self.hosted_task.get_consumption()
-                self.stats["offload_computing"] += self.hosted_task.get_consumption()
+                self.battery_level -= self.hosted_task.consumption
+                stats.offload_computing += self.hosted_task.consumption
                 
         return self.battery_level / self.total_battery 
         
+
+def snapshot_robots(robots):
+    """
+    Snapshot of a fleet: a tuple with the snapshot of each robot, that can be restored (restore_robots) or
+    cloned (clone_robots) any number of times.
+    """
+    return tuple(r.snapshot() for r in robots)
+
+def restore_robots(robots, snapshot):
+    """
+    Restore the state of the fleet (the same robots of the snapshot) in place.
+    """
+    for r, s in zip(robots, snapshot):
+        r.restore(s, robots)
+        
+def clone_robots(snapshot):
+    """
+    New robots with the state of a snapshot, with their own RobotIndex.
+    """
+    robots = []
+    for name, battery_level, total_battery, status, charge_rate, discharge_rate, task_demand, _, _, _ in snapshot:
+        robots.append(Robot(name, battery_level=battery_level, total_battery=total_battery, status=status, charge_rate=charge_rate, disharge_rate=discharge_rate, task_demand=task_demand))
+        
+    RobotIndex(robots)
+    restore_robots(robots, snapshot)
+    return robots
+
+class RobotIndex:
+    """
+    Incremental indexes of a fleet, kept up to date by the methods of the robots that change their status
+    or their tasks: the names of the operating robots that have not offloaded their task and of the
+    charging robots that are not hosting a task.
+    """
+    def __init__(self, robots):
+        self.free_operating = set()
+        self.free_hosts = set()
+        
+        for r in robots:
+            r.index = self
+            self.update(r)
+            
+    def update(self, robot):
+        if robot.status_code == OPERATING and not robot.has_offloaded():
+            self.free_operating.add(robot.name)
+        else:
+            self.free_operating.discard(robot.name)
+            
+        if robot.status_code == CHARGING and robot.hosted_task is None:
+            self.free_hosts.add(robot.name)
+        else:
+            self.free_hosts.discard(robot.name)
@@ -1,17 +1,27 @@
 import copy
-from src.robot import Robot
+from src.robot import Robot, RobotIndex, snapshot_robots, restore_robots, clone_robots
 from src.mpc import Allocator, AllocationPolicy
 import random
 import pandas as pd
-from src.utils import compute_adjacency_matrix, move_computation, tick
+from src.utils import compute_adjacency_matrix, component_labels, neighbour_order, move_computation, tick
+from src.fleet import FleetState, CHARGING, OPERATING, COMPUTATION
+from src.results import ResultsSink
+from src.plotting import PlotMode, plot_results, start_plot_process
+from src.profiling import Profiler
+import numpy as np
 import os
 from tqdm import tqdm
 import sys
+import heapq
+from enum import Enum
 
-import matplotlib.pyplot as plt
+class ValidationMode(Enum):
+    OFF = 1      # the invariant of the computations is never checked
+    SAMPLED = 2  # checked every validation_interval epochs
+    FULL = 3     # checked every epoch
 
 class Simulator:
-    def __init__(self, run_number, sim_name, charging_threshold=0.05, operating_threshold=0.95, probability=1, move_computation_enabled=True, config=None, delay_operation_enabled=False, optimize_computation_frequency=None, optimize_computation_window=50, allocation_policy=AllocationPolicy.BRUTE_FORCE, num_processes=1) -> None:
+    def __init__(self, run_number, sim_name, charging_threshold=0.05, operating_threshold=0.95, probability=1, move_computation_enabled=True, config=None, delay_operation_enabled=False, optimize_computation_frequency=None, optimize_computation_window=50, allocation_policy=AllocationPolicy.BRUTE_FORCE, num_processes=1, vectorized=False, batched_evaluation=False, event_driven_rollout=False, event_driven=False, shared_memory=False, chunk_size=1, pruning=False, lazy_candidates=False, symmetry_bands=None, time_budget=None, adjacency_matrix=None, warm_start=False, rollout_cache=None, prefix_sharing=False, process_pool=None, results_chunk_size=4096, plot_mode=PlotMode.INLINE, plot_max_points=2000, plot_max_robots=16, profile=False, validation=ValidationMode.FULL, validation_interval=100, results_root="res") -> None:
         if config is None:
             print("ERROR: No configuration provided.")
             sys.exit(1)
@@ -20,14 +30,41 @@ class Simulator:
         self.operating_threshold = operating_threshold
         self.robots = []
         self.move_computation_enabled = move_computation_enabled
-        self.sim_name = "res/" + sim_name
+        # Results are written in <results_root>/<sim_name> (res/ by default, where plot/plot_result.ipynb reads them)
+        self.sim_name = results_root + "/" + sim_name
         self.delay_operation_enabled = delay_operation_enabled
         self.optimize_computation_frequency = optimize_computation_frequency
         self.optimize_computation_window = optimize_computation_window
+        self.event_driven = event_driven
+        
+        # Per-epoch traces, streamed to res/<sim_name> in chunks of results_chunk_size epochs (see
+        # src.results). Created by run.
+        self.results_chunk_size = results_chunk_size
+        self.results = None
+
+        # Plots of the results (see src.plotting): rendered at the end of run, by a separate process or
+        # not at all. The series are downsampled to plot_max_points points, and the battery levels of
+        # each robot are plotted only for fleets of at most plot_max_robots robots.
+        self.plot_mode = plot_mode
+        self.plot_max_points = plot_max_points
+        self.plot_max_robots = plot_max_robots
+        self.plot_process = None
+
+        # If profile, the wall time of the phases of each epoch and of the optimizations, and the number of
+        # evaluated candidates, are written to res/<sim_name> (see src.profiling)
+        self.profiler = Profiler(profile)
+
+        # Invariant of the computations: every task is computed once per epoch, so the total computation of
+        # the robots is a multiple of their number. The total is kept up to date by update_computation and
+        # checked according to validation (see validate). Every validation_interval epochs it is also
+        # compared with the stats of the robots
+        self.validation = validation
+        self.validation_interval = validation_interval
+        self.computation_total = 0
 
         self.allocator = None
         if optimize_computation_frequency is not None:
-            self.allocator = Allocator(config["n_robots"], allocation_policy, num_processes)
+            self.allocator = Allocator(config["n_robots"], allocation_policy, num_processes, batched=batched_evaluation, event_driven=event_driven_rollout, shared_memory=shared_memory, chunk_size=chunk_size, pruning=pruning, lazy=lazy_candidates, symmetry_bands=symmetry_bands, time_budget=time_budget, seed=run_number, warm_start=warm_start, cache=rollout_cache, prefix_sharing=prefix_sharing, process_pool=process_pool, profiler=self.profiler)
         
         self.initialize_stats()
         
@@ -49,11 +86,27 @@ class Simulator:
                 # self.robots.append(Robot(i, battery_level=bl, total_battery=tb, charge_rate=cr, disharge_rate=dr, task_demand=td, status="operating"))
 
             
+        # Operating robots that have not offloaded and free charging hosts, updated by the robots
+        RobotIndex(self.robots)
+            
         if probability != 1:
             print("WARNING: The code has not being tested with probability != 1. Unexpected results may arise.")
         
-        # Compute probability-defined adjacency matrix 
-        self.adjacency_matrix = compute_adjacency_matrix(config["n_robots"], probability)   
+        # Compute probability-defined adjacency matrix, unless a topology is given (a dense adjacency matrix
+        # or a CSRGraph, see src.graph)
+        if adjacency_matrix is None:
+            self.adjacency_matrix = compute_adjacency_matrix(config["n_robots"], probability)   
+        else:
+            self.adjacency_matrix = adjacency_matrix
+        
+        # Order in which move_computation visits the neighbours of each robot, computed once for the topology
+        self.neighbours = neighbour_order(self.adjacency_matrix) if move_computation_enabled else None
+        
+        # If vectorized, the state of the robots is kept in a FleetState and the Robot objects are
+        # synchronized only when needed (optimization, delayed operation, report)
+        self.fleet = None
+        if vectorized or event_driven:
+            self.fleet = FleetState.from_robots(self.robots)
         
         print(f"Initialized simulation with {tb} total battery, {config['n_robots']} robots, charge rate {cr}, discharge rate {dr}.")
         
@@ -64,11 +117,6 @@ class Simulator:
         self.stats = {}
         self.stats["wasted_charging"] = 0
         self.stats["wasted_operating"] = 0
-        
-        self.stats_status_robot = {}
-        self.stats_status_robot["epoch"] = []
-        self.stats_status_robot["charging"] = []
-        self.stats_status_robot["operating"] = []
             
     def run(self, epochs):
         """
@@ -77,33 +125,153 @@ class Simulator:
         Args:
             epochs (int): Number of epochs to run the simulation.
         """
-        res = {}
         self.epochs = epochs
+        # the plot of a previous run reads the results that this run replaces
+        self.wait_plot()
         
-        # Initialize a dictionary to store battery levels for each robot
-        for r in self.robots:
-            res[r.name] = []
+        # Battery levels of each robot and status counts, written while the simulation runs
+        self.results = ResultsSink(self.sim_name, [r.name for r in self.robots], epochs, self.results_chunk_size)
+        self.profiler.begin()
+        try:
+            self.computation_total = self.count_computation()
             
-        for ep in tqdm(range(epochs), desc = 'Simulating epoch: ', smoothing=0):
-            # if ep == 2200:
-            #     self.print_infrastructure(ep)
+            if self.event_driven:
+                self.run_events(epochs)
+            else:
+                for ep in tqdm(range(epochs), desc = 'Simulating epoch: ', smoothing=0):
+                    # if ep == 2200:
+                    #     self.print_infrastructure(ep)
                 
-            self.progress_simulation(res, self.robots, ep)
+                    self.progress_simulation(self.robots, ep)
                 
-            for r in self.robots:
-                r.update_computation()
+                    with self.profiler.phase("update_computation"):
+                        self.update_computation()
             
-            assert self.check_infrastructure(), self.print_infrastructure(ep)
-            self.update_stats(ep)
+                    with self.profiler.phase("validate"):
+                        self.validate(ep)
+                    with self.profiler.phase("update_stats"):
+                        self.update_stats(ep)
 
-        if self.allocator is not None:
-            self.allocator.terminate()
+            if self.allocator is not None and self.allocator.cache is not None:
+                stats = self.allocator.cache.stats()
+                print(f"Rollout cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%}), {stats['entries']} entries, {stats['evictions']} evictions.")
+            
+            if self.fleet is not None:
+                self.fleet.to_robots(self.robots)
+            
+            with self.profiler.phase("dump_report"):
+                self.dump_report() 
+        except BaseException:
+            # the results of a failed run are deleted, so that only complete runs are in res/
+            self.results.discard()
+            raise
+        finally:
+            # also after a failure, otherwise the workers keep the interpreter from exiting (a pool given by
+            # the caller is left to it)
+            if self.allocator is not None:
+                self.allocator.terminate()
+        self.results.commit()
+        
+        with self.profiler.phase("plot"):
+            self.plot_results()
+            
+        self.profiler.finish()
+        if self.profiler.enabled:
+            self.profiler.dump(self.sim_name, epochs)
+            summary = self.profiler.summary(epochs)
+            print(f"Profile: {summary['wall_time_s']:.2f} s, {summary['epochs_per_s']:.1f} epochs/s, {int(summary.get('candidates', 0))} candidates (report in {self.sim_name}/profile.csv).")
+        
+    def run_events(self, epochs):
+        """
+        Event-driven version of the main loop of run. A full epoch is simulated only when a robot meets
+        the condition to change status, when an optimization is scheduled or when move_computation has
+        something to do. The epochs in between change the battery levels linearly and are applied in
+        bulk. The results are the same of the epoch by epoch simulation.
+
+        Args:
+            epochs (int): Number of epochs to run the simulation.
+        """
+        labels = component_labels(self.adjacency_matrix) if self.move_computation_enabled else None
+        
+        # Priority queue of (epoch, robot id, version) with the epoch at which each robot will cross a
+        # threshold. Entries with an old version are outdated and skipped.
+        queue = []
+        version = [0 for _ in self.robots]
+        previous = None
+        
+        progress = tqdm(total=epochs, desc = 'Simulating epoch: ', smoothing=0)
+        ep = 0
+        while ep < epochs:
+            self.progress_simulation(self.robots, ep)
+            with self.profiler.phase("update_computation"):
+                self.update_computation()
+            with self.profiler.phase("validate"):
+                self.validate(ep)
+            with self.profiler.phase("update_stats"):
+                self.update_stats(ep)
+            
+            # The crossing epoch is recomputed only for the robots whose event was due and for the ones
+            # whose status or tasks changed in this epoch
+            state = np.concatenate([self.fleet.status[0:1], self.fleet.offload_to[0:1], self.fleet.hosted_from[0:1]])
+            if previous is None:
+                update = set(range(len(self.robots)))
+            else:
+                update = set(np.flatnonzero((state != previous).any(axis=0)).tolist())
+            previous = state
             
-        self.dump_report() 
-        self.plot_results(res)
+            while len(queue) > 0 and queue[0][0] <= ep:
+                update.add(heapq.heappop(queue)[1])
+                
+            ticks = self.fleet.ticks_to_threshold(self.operating_threshold, self.charging_threshold)[0]
+            for id in update:
+                version[id] += 1
+                if np.isfinite(ticks[id]):
+                    heapq.heappush(queue, (ep + int(ticks[id]), id, version[id]))
+                    
+            while len(queue) > 0 and queue[0][2] != version[queue[0][1]]:
+                heapq.heappop(queue)
+                
+            # Next epoch that must be fully simulated
+            next_ep = epochs
+            if len(queue) > 0:
+                next_ep = min(next_ep, queue[0][0])
+            if self.optimize_computation_frequency is not None:
+                next_ep = min(next_ep, (ep//self.optimize_computation_frequency + 1)*self.optimize_computation_frequency)
+            if labels is not None and self.fleet.has_pending_match(labels)[0]:
+                next_ep = ep + 1
+                
+            skip = next_ep - ep - 1
+            if skip > 0:
+                with self.profiler.phase("skip_epochs"):
+                    self.skip_epochs(ep + 1, skip)
+                self.profiler.count("skipped_epochs", skip)
+                self.validate(next_ep - 1, skip)
+                
+            progress.update(skip + 1)
+            ep = next_ep
+            
+        progress.close()
         
-    def progress_simulation(self, res, robots, ep):
-        available_robots_ids, target_for_operating = tick(res, robots, self.operating_threshold, self.charging_threshold, self.delay_operation_enabled)
+    def skip_epochs(self, first_epoch, steps):
+        """
+        Apply steps epochs in which no robot changes status or tasks.
+        """
+        for start in range(0, steps, self.results_chunk_size):
+            self.results.add_battery_trace(self.fleet.battery_trace(min(self.results_chunk_size, steps - start), offset=start))
+            
+        self.fleet.advance(np.array([steps]))
+        self.update_computation(steps)
+        self.update_fleet_stats(first_epoch, steps)
+        
+    def progress_simulation(self, robots, ep):
+        if self.fleet is not None:
+            self.progress_fleet(ep)
+            return
+        
+        battery = {}
+        with self.profiler.phase("tick"):
+            available_robots_ids, target_for_operating = tick(battery, robots, self.operating_threshold, self.charging_threshold, self.delay_operation_enabled)
+        self.results.add_battery([battery[r.name][0] for r in robots])
                     
         if len(target_for_operating) > 0:
             if self.delay_operation_enabled:
@@ -114,12 +282,63 @@ class Simulator:
                                 
         # Use available robots to host tasks
         if self.move_computation_enabled:
-            move_computation(available_robots_ids, robots, self.adjacency_matrix)
+            with self.profiler.phase("move_computation"):
+                move_computation(available_robots_ids, robots, self.neighbours)
+            
+        if self.optimize_computation_frequency is not None and ep%self.optimize_computation_frequency == 0:
+            self.optimize_computation(ep)
+            
+    def progress_fleet(self, ep):
+        """
+        Same as progress_simulation, but the robots are advanced through the FleetState.
+        """
+        with self.profiler.phase("tick"):
+            available, delayed = self.fleet.tick(self.operating_threshold, self.charging_threshold, self.delay_operation_enabled)
+        
+        self.results.add_battery(self.fleet.get_battery_percentage()[0])
+            
+        # Delayed operation and optimization work on the Robot objects
+        target_for_operating = np.flatnonzero(delayed[0]).tolist()
+        if len(target_for_operating) > 0:
+            self.fleet.to_robots(self.robots)
+            self.delay_operation(target_for_operating, self.robots)
+            self.fleet = FleetState.from_robots(self.robots)
+            
+        # Use available robots to host tasks
+        if self.move_computation_enabled:
+            with self.profiler.phase("move_computation"):
+                self.fleet.move_computation(available, self.neighbours)
             
         if self.optimize_computation_frequency is not None and ep%self.optimize_computation_frequency == 0:
+            self.fleet.to_robots(self.robots)
             self.optimize_computation(ep)
+            self.fleet = FleetState.from_robots(self.robots)
+            
+    def snapshot(self):
+        """
+        Snapshot of the state of the robots (see src.robot.snapshot_robots), that can be restored with restore.
+        """
+        if self.fleet is not None:
+            self.fleet.to_robots(self.robots)
+        return snapshot_robots(self.robots)
+    
+    def restore(self, snapshot):
+        """
+        Restore the state of the robots from a snapshot.
+        """
+        restore_robots(self.robots, snapshot)
+        if self.fleet is not None:
+            self.fleet = FleetState.from_robots(self.robots)
+        self.computation_total = self.count_computation()
             
     def optimize_computation(self, ep=0):
+        # the times and counters of the optimization are also recorded per epoch
+        self.profiler.set_epoch(ep)
+        with self.profiler.phase("optimize_computation"):
+            self._optimize_computation(ep)
+        self.profiler.set_epoch(None)
+        
+    def _optimize_computation(self, ep=0):
         constrained_allocation = [-1 for _ in range(len(self.robots))]
                 
         for id, r in enumerate(self.robots):
@@ -132,7 +351,7 @@ class Simulator:
             
         window = min(self.optimize_computation_window, self.epochs - ep)
         
-        offloading_decision_brute = self.allocator.find_best_allocation(window, copy.deepcopy(self.robots), self.charging_threshold, self.operating_threshold, self.move_computation_enabled, self.adjacency_matrix, constrained_allocation)
+        offloading_decision_brute = self.allocator.find_best_allocation(window, self.robots, self.charging_threshold, self.operating_threshold, self.move_computation_enabled, self.adjacency_matrix, constrained_allocation)
         
         for r in self.robots:
             r.unhost()
@@ -175,9 +394,13 @@ class Simulator:
         
         # print(len(target_for_operating))
         
+        # every solution starts from the snapshot, restored in the same robots
+        snapshot = snapshot_robots(robots)
+        rob = clone_robots(snapshot)
+        
         for id, s in enumerate(sol):
-            rob = copy.deepcopy(robots)
-            s_backup = copy.deepcopy(s)
+            restore_robots(rob, snapshot)
+            s_backup = list(s)
             cur_best = 0
             
             for _ in range(duration*5):
@@ -190,7 +413,7 @@ class Simulator:
                         
                 available_robot_ids, _ = tick({}, rob, self.operating_threshold, self.charging_threshold, False)
                 if self.move_computation_enabled:
-                    move_computation(available_robot_ids, rob, self.adjacency_matrix)
+                    move_computation(available_robot_ids, rob, self.neighbours)
                 
                 charging = 0
                 operating = 0
@@ -210,13 +433,59 @@ class Simulator:
             if s == 0:
                 robots[target_for_operating[id]].operate()
         
-    def check_infrastructure(self): 
+    def update_computation(self, steps=1):
+        """
+        Compute the tasks of the robots for steps epochs (one without the FleetState), adding the number of
+        computed tasks to computation_total.
+        """
+        if self.fleet is not None:
+            self.computation_total += int(self.fleet.update_computation(steps)[0])
+            return
+        
+        for r in self.robots:
+            self.computation_total += r.update_computation()
+            
+    def count_computation(self):
+        """
+        Total computation of the robots, recomputed from their stats.
+        """
+        if self.fleet is not None:
+            return int(self.fleet.stats[0, :, COMPUTATION].sum())
+        
         count = 0
         for r in self.robots:   
             count += r.stats["computation"]
-        return count%len(self.robots) == 0
+        return count
+    
+    def check_infrastructure(self): 
+        return self.computation_total%len(self.robots) == 0
+    
+    def validate(self, ep, steps=1):
+        """
+        Check the invariant of the computations after epoch ep (the last of steps epochs) according to
+        validation. If one of the steps epochs is a multiple of validation_interval, computation_total is
+        also compared with the stats of the robots. If a check fails, the state of the robots is printed
+        and an AssertionError is raised.
+        """
+        if self.validation == ValidationMode.OFF:
+            return
+        
+        sampled = ep//self.validation_interval != (ep - steps)//self.validation_interval
+        if self.validation == ValidationMode.SAMPLED and not sampled:
+            return
+        
+        if not self.check_infrastructure():
+            self.print_infrastructure(ep)
+            raise AssertionError(f"Epoch {ep}: total computation {self.computation_total} is not a multiple of the number of robots.")
+        
+        if sampled and self.computation_total != self.count_computation():
+            self.print_infrastructure(ep)
+            raise AssertionError(f"Epoch {ep}: total computation {self.computation_total} differs from the one of the stats of the robots ({self.count_computation()}).")
     
     def print_infrastructure(self, ep):
+        if self.fleet is not None:
+            self.fleet.to_robots(self.robots)
+            
         print("Epoch: ", ep)
         for r in self.robots:
             print(r, "\t", r.get_self_task(), "\t", r.get_hosted_task())
@@ -226,6 +495,10 @@ class Simulator:
         """
         Update the simulation statistics.
         """
+        if self.fleet is not None:
+            self.update_fleet_stats(time_instant)
+            return
+        
         charging = 0
         operating = 0
         
@@ -240,9 +513,19 @@ class Simulator:
             elif robot.get_status() == "operating":
                 operating += 1
                 
-        self.stats_status_robot["epoch"].append(time_instant)
-        self.stats_status_robot["charging"].append(charging)
-        self.stats_status_robot["operating"].append(operating)
+        self.results.add_status(time_instant, charging, operating)
+
+    def update_fleet_stats(self, time_instant, steps=1):
+        """
+        Same as update_stats, computed on the FleetState, for steps epochs starting at time_instant.
+        """
+        charging = self.fleet.status[0] == CHARGING
+        operating = self.fleet.status[0] == OPERATING
+        
+        self.stats["wasted_charging"] += steps*np.count_nonzero(charging & ~self.fleet.is_hosting()[0])
+        self.stats["wasted_operating"] += steps*np.count_nonzero(operating & ~self.fleet.has_offloaded()[0])
+        
+        self.results.add_status(time_instant, np.count_nonzero(charging), np.count_nonzero(operating), steps)
 
     def dump_report(self):
         """
@@ -265,31 +548,33 @@ class Simulator:
             d["robot_" + str(robot.name) + "_self_computing"] = stat["self_computing"]
             d["robot_" + str(robot.name) + "_offload_computing"] = stat["offload_computing"]
             
-        # Create the directory if it doesn't exist
-        if not os.path.exists(self.sim_name):
-            os.makedirs(self.sim_name)
-
-        # Save the dataframes as CSV files in the directory
-        pd.DataFrame([d]).to_csv(f"{self.sim_name}/simulation_stats.csv", index=False)
-        pd.DataFrame([self.stats]).to_csv(f"{self.sim_name}/missed_chances.csv", index=False)
-        pd.DataFrame(self.stats_status_robot).to_csv(f"{self.sim_name}/robot_status.csv", index=False)
+        # Save the dataframes as CSV files in the directory of the results (the staging one until the
+        # run is complete, see ResultsSink)
+        directory = self.results.directory
+        pd.DataFrame([d]).to_csv(f"{directory}/simulation_stats.csv", index=False)
+        pd.DataFrame([self.stats]).to_csv(f"{directory}/missed_chances.csv", index=False)
+        self.results.write_status_csv(f"{directory}/robot_status.csv")
              
-    def plot_results(self, data):
+    def plot_results(self):
+        """
+        Plot the results saved in res/<sim_name> according to plot_mode: the battery levels of the fleet
+        and the status counts over time (fleet_status.png), and the battery levels of each robot
+        (battery_levels.png) for small fleets.
         """
-        Plot the battery levels of each robot over time.
+        if self.plot_mode == PlotMode.OFF:
+            return
 
-        Args:
-            data (dict): Dictionary containing battery levels for each robot.
+        self.results.flush()
+        robot_names = [r.name for r in self.robots]
+        if self.plot_mode == PlotMode.BACKGROUND:
+            self.plot_process = start_plot_process(self.sim_name, robot_names, self.plot_max_points, self.plot_max_robots)
+        else:
+            plot_results(self.sim_name, robot_names, self.plot_max_points, self.plot_max_robots)
+            
+    def wait_plot(self):
+        """
+        Wait for the plot process started by the last run (with PlotMode.BACKGROUND), if any.
         """
-        num_robots = len(data)
-        _, axs = plt.subplots(num_robots, 1, figsize=(8, 6*num_robots))
-        
-        for i, (robot, values) in enumerate(data.items()):
-            axs[i].plot(values, label=robot)
-            axs[i].set_xlabel('Time')
-            axs[i].set_ylabel('Battery Level')
-            axs[i].set_title(f'Battery Levels of {robot} Over Time')
-            axs[i].legend()
-        
-        # Save the plot as an image file
-        plt.savefig(self.sim_name + "/battery_levels.png")
\ No newline at end of file
+        if self.plot_process is not None:
+            self.plot_process.join()
+            self.plot_process = None
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from src.mpc import AllocationPolicy, HEURISTICS
+from src.simulator import Simulator
+
+# Files written by Simulator.dump_report: a simulation is complete when all of them exist
+REPORT_FILES = ("simulation_stats.csv", "missed_chances.csv", "robot_status.csv")
+
+def sweep_jobs(configs, seeds, variants, epochs, name="{config}-{variant}-{seed}"):
+    """
+    One job per combination of configuration, seed and variant. The results of each job are saved in
+    <results_root>/<sim_name> (res/ unless the variant sets results_root), next to the ones of the other
+    simulations.
+
+    Args:
+        configs (dict): Robot configurations (see main.py), by name.
+        seeds (list): Run numbers, used as seeds of the simulations.
+        variants (dict): Keyword arguments of Simulator (e.g. allocation_policy,
+            optimize_computation_window, num_processes), by name. A sim_name among them is used as it is.
+        epochs (int): Number of epochs of every simulation.
+        name (str): Format of the sim_name of the jobs, with the fields config, variant and seed (e.g.
+            "{variant}" keeps the names of the simulations run one by one, as in res/reference).
+
+    Returns:
+        list: Jobs, as dictionaries with the arguments of Simulator and the number of epochs.
+    """
+    jobs = []
+    for (config_name, config), seed, (variant_name, kwargs) in itertools.product(configs.items(), seeds, variants.items()):
+        job = dict(kwargs)
+        job["run_number"] = seed
+        job.setdefault("sim_name", name.format(config=config_name, variant=variant_name, seed=seed))
+        job["config"] = config
+        job["epochs"] = epochs
+        jobs.append(job)
+        
+    names = [job["sim_name"] for job in jobs]
+    duplicated = sorted({sim_name for sim_name in names if names.count(sim_name) > 1})
+    if len(duplicated) > 0:
+        raise ValueError(f"Jobs with the same sim_name would write the same results: {duplicated}")
+    return jobs
+
+def is_complete(job):
+    """
+    True if the results of the job are already in <results_root>/<sim_name>.
+    """
+    return all(os.path.exists(os.path.join(job.get("results_root", "res"), job["sim_name"], f)) for f in REPORT_FILES)
+
+def job_cores(job, n_cores):
+    """
+    Number of cores used by a job: the simulation itself and the workers of its ProcessPool (at most
+    n_cores), or one if the allocations are not evaluated by a process pool.
+    """
+    uses_pool = job.get("optimize_computation_frequency") is not None and not job.get("batched_evaluation", False) and job.get("allocation_policy", AllocationPolicy.BRUTE_FORCE) not in HEURISTICS
+    if not uses_pool:
+        return 1
+    return max(1, min(job.get("num_processes", 1) + 1, n_cores))
+
+def run_job(job):
+    """
+    Run the simulation of a job (in a worker process of run_sweep). A plot in the background is waited
+    for, so that the worker is given the next job only once it is done.
+    """
+    kwargs = dict(job)
+    epochs = kwargs.pop("epochs")
+    s = Simulator(**kwargs)
+    s.run(epochs)
+    s.wait_plot()
+    return job["sim_name"]
+
+def run_sweep(jobs, n_cores=None, resume=True):
+    """
+    Run the simulations of the jobs in parallel. The jobs are started in order as long as the cores
+    they use (see job_cores) fit in n_cores, so that the outer simulations and the workers of their
+    process pools share the cores: the num_processes of a job is lowered to n_cores - 1 if needed, to
+    leave a core to the simulation.
+
+    Args:
+        jobs (list): Jobs returned by sweep_jobs.
+        n_cores (int): Number of cores of the sweep (all the cores of the machine if None).
+        resume (bool): If True, the jobs whose results already exist (see is_complete) are skipped.
+
+    Returns:
+        list: Names of the simulations that failed.
+    """
+    if n_cores is None:
+        n_cores = os.cpu_count()
+
+    pending = []
+    for job in jobs:
+        if resume and is_complete(job):
+            print(f"Skipping {job['sim_name']}: already completed.")
+            continue
+        job = dict(job)
+        if "num_processes" in job:
+            job["num_processes"] = max(1, min(job["num_processes"], n_cores - 1))
+        pending.append(job)
+    pending.reverse()
+
+    failed = []
+    running = {}
+    used = 0
+    # the workers of the executor are not daemonic, so the simulations can start their process pools
+    with ProcessPoolExecutor(max_workers=n_cores) as executor:
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and (len(running) == 0 or used + job_cores(pending[-1], n_cores) <= n_cores):
+                job = pending.pop()
+                cores = job_cores(job, n_cores)
+                running[executor.submit(run_job, job)] = (job, cores)
+                used += cores
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, cores = running.pop(future)
+                used -= cores
+                if future.exception() is not None:
+                    print(f"ERROR: simulation {job['sim_name']} failed: {future.exception()!r}")
+                    failed.append(job["sim_name"])
+
+    return failed
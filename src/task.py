@@ -1,4 +1,12 @@
 class Task:
+    __slots__ = ("from_robot", "to_robot", "consumption")
+
+    def __getstate__(self):
+        return (self.from_robot, self.to_robot, self.consumption)
+
+    def __setstate__(self, state):
+        self.from_robot, self.to_robot, self.consumption = state
+
     def __init__(self, from_robot, consumption):
         self.from_robot = from_robot
         self.to_robot = None
@@ -1,5 +1,8 @@
+import weakref
 import numpy as np
 import heapq
+from src.graph import CSRGraph
+from src.robot import CHARGING, OPERATING
 
 def compute_adjacency_matrix(n_robots, probability):
     adjacency_matrix = np.zeros((n_robots, n_robots))
@@ -24,12 +27,16 @@ def dijkstra(adjacency_matrix, source):
             continue
         visited.add(current_node)
 
-        for neighbor in range(n_nodes):
-            if adjacency_matrix[current_node][neighbor] == 1:
-                distance = current_distance + 1
-                if distance < distances[neighbor]:
-                    distances[neighbor] = distance
-                    heapq.heappush(queue, (distance, neighbor))
+        if isinstance(adjacency_matrix, CSRGraph):
+            neighbors = adjacency_matrix.neighbours(current_node).tolist()
+        else:
+            neighbors = [neighbor for neighbor in range(n_nodes) if adjacency_matrix[current_node][neighbor] == 1]
+            
+        for neighbor in neighbors:
+            distance = current_distance + 1
+            if distance < distances[neighbor]:
+                distances[neighbor] = distance
+                heapq.heappush(queue, (distance, neighbor))
 
     distance_dict = {}
     for node, distance in distances.items():
@@ -40,6 +47,211 @@ def dijkstra(adjacency_matrix, source):
 
     return distance_dict
 
+def per_topology(name, adjacency_matrix, compute):
+    """
+    Value of compute(adjacency_matrix), computed once for each topology object and name, so that the
+    rollouts of every optimization share it: a topology must not be changed in place after it is used.
+    """
+    key = (name, id(adjacency_matrix))
+    entry = _TOPOLOGY_CACHE.get(key)
+    if entry is not None and entry[0]() is adjacency_matrix:
+        return entry[1]
+    
+    value = compute(adjacency_matrix)
+    try:
+        ref = weakref.ref(adjacency_matrix)
+    except TypeError:
+        # e.g. a list of lists, that cannot be recognized later
+        return value
+
+    if len(_TOPOLOGY_CACHE) >= _TOPOLOGY_CACHE_SIZE:
+        _TOPOLOGY_CACHE.pop(next(iter(_TOPOLOGY_CACHE)))
+    _TOPOLOGY_CACHE[key] = (ref, value)
+    return value
+
+def _component_labels(adjacency_matrix):
+    if not isinstance(adjacency_matrix, CSRGraph):
+        adjacency_matrix = CSRGraph.from_dense(adjacency_matrix)
+    labels = adjacency_matrix.components()
+    # shared by the callers through per_topology
+    labels.flags.writeable = False
+    return labels
+
+def component_labels(adjacency_matrix):
+    """
+    Connected component of each robot, labelled with the lowest id in the component, with the same edges
+    used by dijkstra (elements equal to 1). The topology is undirected, so two robots can reach each other
+    if and only if they have the same label. Computed once for each topology object (see per_topology).
+    """
+    return per_topology("component_labels", adjacency_matrix, _component_labels)
+
+def hop_distances(adjacency_matrix):
+    """
+    All-pairs number of hops (breadth-first search from every robot at once), with the same edges used by
+    dijkstra (elements equal to 1).
+
+    Returns:
+        np.ndarray: Matrix of the distances from each robot to each other robot (np.inf if unreachable).
+    """
+    if isinstance(adjacency_matrix, CSRGraph):
+        return np.array([adjacency_matrix.hop_distances(i) for i in range(len(adjacency_matrix))])
+    
+    # float32 products go through BLAS, and count the paths exactly up to 2**24 robots
+    edges = (np.asarray(adjacency_matrix) == 1).astype(np.float32)
+    n_nodes = len(edges)
+    distances = np.full((n_nodes, n_nodes), np.inf)
+    frontier = np.eye(n_nodes, dtype=bool)
+    visited = frontier.copy()
+    
+    hops = 0
+    while frontier.any():
+        distances[frontier] = hops
+        frontier = ((frontier.astype(np.float32) @ edges) > 0) & ~visited
+        visited |= frontier
+        hops += 1
+        
+    return distances
+
+# Values computed once for each topology (see per_topology): (weak reference to the topology, value) by
+# name and identity of the topology
+_TOPOLOGY_CACHE = {}
+_TOPOLOGY_CACHE_SIZE = 16
+
+# Maximum number of robots whose order is kept for each sparse topology
+_SPARSE_ORDERS_SIZE = 4096
+
+def _bucket_order(distances, source):
+    """
+    Robots reachable from source, in the order of the distance buckets returned by dijkstra (the order of
+    the lowest id at each distance), each one sorted by id.
+    """
+    targets = np.flatnonzero(np.isfinite(distances))
+    targets = targets[targets != source]
+    # the first target at each distance (targets are sorted by id) gives the position of the bucket
+    _, first, bucket = np.unique(distances[targets], return_index=True, return_inverse=True)
+    return targets[np.lexsort((targets, first[bucket]))]
+
+class NeighbourOrder:
+    """
+    Orders returned by neighbour_order: order[i] is the array of the robots reachable from robot i, in the
+    order in which move_computation visits them. For a CSRGraph the order of each robot is computed (with
+    a breadth-first search) the first time it is requested, and at most _SPARSE_ORDERS_SIZE of them are kept.
+    """
+    def __init__(self, adjacency_matrix):
+        self.n_robots = len(adjacency_matrix)
+        self.graph = None
+        self.orders = {}
+        self.ranks = {}
+        
+        if isinstance(adjacency_matrix, CSRGraph):
+            self.graph = adjacency_matrix
+        else:
+            self.orders = {i: _bucket_order(row, i) for i, row in enumerate(hop_distances(adjacency_matrix))}
+        
+    def __len__(self):
+        return self.n_robots
+        
+    def __getitem__(self, source):
+        if source not in self.orders:
+            if len(self.orders) >= _SPARSE_ORDERS_SIZE:
+                oldest = next(iter(self.orders))
+                self.orders.pop(oldest)
+                self.ranks.pop(oldest, None)
+            self.orders[source] = _bucket_order(self.graph.hop_distances(source), source)
+        return self.orders[source]
+    
+    def rank(self, source):
+        """
+        Position of each robot in the order of source (n_robots if unreachable).
+        """
+        order = self[source]
+        if source not in self.ranks:
+            rank = np.full(self.n_robots, self.n_robots, dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            self.ranks[source] = rank
+        return self.ranks[source]
+    
+    def nearest(self, source, ids):
+        """
+        First robot of ids in the order of source (None if none is reachable).
+        """
+        if len(ids) == 0:
+            return None
+        
+        ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        rank = self.rank(source)[ids]
+        k = np.argmin(rank)
+        return None if rank[k] == self.n_robots else int(ids[k])
+
+def neighbour_order(adjacency_matrix):
+    """
+    For each robot, the other reachable robots in the order in which move_computation visits them: the
+    distance buckets returned by dijkstra, in the same order (the order of the lowest id at each distance),
+    each one sorted by id. Computed once for each topology object (see per_topology), and a NeighbourOrder
+    is returned as it is (e.g. the one kept by the Simulator).
+
+    Returns:
+        NeighbourOrder: Array of robot ids for each robot.
+    """
+    if isinstance(adjacency_matrix, NeighbourOrder):
+        return adjacency_matrix
+    
+    return per_topology("neighbour_order", adjacency_matrix, lambda topology: NeighbourOrder(topology if isinstance(topology, CSRGraph) else np.asarray(topology)))
+
+def min_cost_assignment(cost):
+    """
+    Hungarian algorithm: assign each row of the cost matrix to a different column with the minimum
+    total cost. If there are more rows than columns, some rows are left unassigned.
+
+    Returns:
+        np.ndarray: Column assigned to each row (-1 if unassigned).
+    """
+    cost = np.asarray(cost, dtype=float)
+    if cost.shape[0] > cost.shape[1]:
+        columns = min_cost_assignment(cost.T)
+        rows = np.full(cost.shape[0], -1)
+        rows[columns] = np.arange(cost.shape[1])
+        return rows
+    
+    n_rows, n_columns = cost.shape
+    u = np.zeros(n_rows + 1)
+    v = np.zeros(n_columns + 1)
+    # row assigned to each column (1-based, 0 if none) and previous column in the augmenting path
+    match = np.zeros(n_columns + 1, dtype=np.int64)
+    way = np.zeros(n_columns + 1, dtype=np.int64)
+    
+    for i in range(1, n_rows + 1):
+        match[0] = i
+        j0 = 0
+        min_value = np.full(n_columns + 1, np.inf)
+        used = np.zeros(n_columns + 1, dtype=bool)
+        
+        while match[j0] != 0:
+            used[j0] = True
+            i0 = match[j0]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            update = ~used[1:] & (reduced < min_value[1:])
+            min_value[1:][update] = reduced[update]
+            way[1:][update] = j0
+            
+            j1 = np.argmin(np.where(used[1:], np.inf, min_value[1:])) + 1
+            delta = min_value[j1]
+            u[match[used]] += delta
+            v[used] -= delta
+            min_value[~used] -= delta
+            j0 = j1
+            
+        # augment along the path
+        while j0 != 0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+            
+    rows = np.full(n_rows, -1)
+    assigned = np.flatnonzero(match[1:])
+    rows[match[1:][assigned] - 1] = assigned
+    return rows
+
 if __name__ == "__main__":
     adjacency_matrix = compute_adjacency_matrix(10, 0.1)
     print(dijkstra(adjacency_matrix, 0))
@@ -52,8 +264,20 @@ def count_missed_offload(allocation, battery_level, status):
     return missed_offload
 
 def tick(res, robots, operating_threshold, charging_threshold, delay_enabled):
+    """
+    Advance the robots by one time instant, switching the status of the ones that cross a threshold.
+
+    Returns:
+        tuple: Ids of the robots available to host a task (charging and not hosting at their turn), and
+        ids of the robots whose switch to operating has been delayed.
+    """
     available_robots_ids = []
     target_for_operating = []
+    
+    # With a RobotIndex the available robots are the free hosts after the tick, except the ones that were
+    # still hosting at their turn (freed by a robot that follows them) and the delayed one
+    index = robots[0].index if len(robots) > 0 else None
+    hosting_at_turn = set()
         
     # Iterate over each robot
     for id, robot in enumerate(robots):
@@ -61,25 +285,31 @@ def tick(res, robots, operating_threshold, charging_threshold, delay_enabled):
         if robot.name not in res:
             res[robot.name] = []
         res[robot.name].append(battery)
-        r_status = robot.get_status()
+        r_status = robot.status_code
             
         # If battery level is below charging threshold and the robot is not already charging, start charging
-        if battery <= charging_threshold and r_status != "charging":
+        if battery <= charging_threshold and r_status != CHARGING:
+            if index is not None and robot.has_offloaded() and robot.get_self_task().get_to().name < robot.name:
+                hosting_at_turn.add(robot.get_self_task().get_to().name)
             robot.charge()
-            available_robots_ids.append(id)    
+            if index is None:
+                available_robots_ids.append(id)    
         # If battery level is above operating threshold and the robot is not already operating, set it to operate
-        elif battery >= operating_threshold and r_status != "operating":
+        elif battery >= operating_threshold and r_status != OPERATING:
             # Set the robot to operate
             #robot.operate()
             if len(target_for_operating) < 1 and delay_enabled:
                 target_for_operating.append(id)
             else:
                 robot.operate()
-        else:
+        elif index is None:
             # If the robot is not hosting a task and it is currently charging, add it to the available robots list
-            if not robot.is_hosting() and r_status == "charging":
+            if not robot.is_hosting() and r_status == CHARGING:
                 available_robots_ids.append(id)
     
+    if index is not None:
+        available_robots_ids = sorted(index.free_hosts - hosting_at_turn - set(target_for_operating))
+    
     return available_robots_ids, target_for_operating
 
 def move_computation(available_robots_ids, robots, adjacency_matrix):
@@ -88,7 +318,12 @@ def move_computation(available_robots_ids, robots, adjacency_matrix):
 
     Args:
         available_robots_ids (list): List of available robot IDs.
+        adjacency_matrix (np.ndarray): Topology of the robots, or its NeighbourOrder (see neighbour_order).
     """
+    if len(available_robots_ids) == 0:
+        return
+    
+    neighbours = neighbour_order(adjacency_matrix)
     for i in available_robots_ids:
         robot = robots[i]
         
@@ -96,17 +331,16 @@ def move_computation(available_robots_ids, robots, adjacency_matrix):
         if robot.is_hosting():
             continue
             
-        # Find the nearest robot that is operating
-        distances = dijkstra(adjacency_matrix, i)
+        # Find the nearest robot that is operating, among the ones in the index if the fleet has one
+        if robot.index is not None:
+            id = neighbours.nearest(i, robot.index.free_operating)
+            if id is not None:
+                robots[id].offload(robot)
+                assert robot.host(robots[id].get_self_task()) != False
+            continue
             
-        found = False
-        for _, ids in distances.items():
-            if found:
-                break
-                
-            for id in ids:
-                if not robots[id].has_offloaded() and robots[id].get_status() == "operating":
-                    robots[id].offload(robot)
-                    assert robot.host(robots[id].get_self_task()) != False
-                    found = True
-                    break
\ No newline at end of file
+        for id in neighbours[i].tolist():
+            if not robots[id].has_offloaded() and robots[id].get_status() == "operating":
+                robots[id].offload(robot)
+                assert robot.host(robots[id].get_self_task()) != False
+                break
\ No newline at end of file
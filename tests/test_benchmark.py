@@ -0,0 +1,54 @@
+import os
+import pytest
+from src.mpc import Allocator, AllocationPolicy
+from src.benchmark import GROUPS, MAX_ROBOTS, benchmark_cases, compare, load_report, run_benchmarks, run_case, save_report
+
+@pytest.mark.parametrize("quick", [False, True])
+def test_benchmark_cases(quick):
+    cases = benchmark_cases(quick=quick)
+    names = [case["name"] for case in cases]
+    assert len(set(names)) == len(names)
+
+    for group, spec in GROUPS.items():
+        params = [case["params"] for case in cases if case["group"] == group]
+        assert spec["defaults"] in params
+        dimensions = spec["quick"] if quick else spec["dimensions"]
+        for param, values in dimensions.items():
+            assert {p[param] for p in params} <= set(values) | {spec["defaults"][param]}
+    for case in cases:
+        params = case["params"]
+        assert "policy" not in params or params["n_robots"] <= MAX_ROBOTS[params["policy"]]
+
+    assert len(benchmark_cases(quick=True)) < len(benchmark_cases())
+    assert {case["group"] for case in benchmark_cases(["mpc"], quick)} == {"mpc"}
+
+def report(**rates):
+    return {"results": {name: {"epochs_per_s": rate} for name, rate in rates.items()}}
+
+def test_compare_reports_regressions_beyond_tolerance():
+    baseline = report(a=100.0, b=100.0, c=100.0, d=0.0)
+    new = report(a=95.0, b=80.0, c=150.0, d=10.0, e=1.0)
+    assert compare(new, baseline, tolerance=0.1) == [("b", "epochs_per_s", 100.0, 80.0)]
+    assert compare(new, baseline, tolerance=0.01) == [("a", "epochs_per_s", 100.0, 95.0), ("b", "epochs_per_s", 100.0, 80.0)]
+
+def test_report_round_trip(tmp_path):
+    path = str(tmp_path / "bench" / "results.json")
+    saved = report(a=1.5)
+    save_report(saved, path)
+    assert load_report(path) == saved
+
+def test_run_cases(tmp_path, monkeypatch):
+    """
+    The candidates case counts the candidates of the policy, and the simulations write nothing in res/.
+    """
+    monkeypatch.chdir(tmp_path)
+    candidates = {"name": "candidates", "group": "candidates", "params": dict(policy="MOVE2", n_robots=8)}
+    result = run_case(candidates)
+    assert result["candidates"] == len(Allocator(8, AllocationPolicy.MOVE2, batched=True).get_candidates([-1] * 8))
+
+    mpc = {"name": "mpc", "group": "mpc", "params": dict(GROUPS["mpc"]["defaults"], epochs=400)}
+    simulator = {"name": "simulator", "group": "simulator", "params": dict(GROUPS["simulator"]["defaults"], epochs=200)}
+    results = run_benchmarks([mpc, simulator], repeat=2)["results"]
+    assert results["mpc"]["candidates"] > 0 and results["mpc"]["epochs"] == 400
+    assert results["simulator"]["epochs_per_s"] > 0
+    assert os.listdir(tmp_path) == []
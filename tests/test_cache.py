@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from src.robot import Robot
+from src.mpc import Allocator, AllocationPolicy
+from src.cache import ENTRY_OVERHEAD, RolloutCache, allocation_key, rollout_prefix, shared_rollout_cache
+from src.utils import compute_adjacency_matrix
+
+WINDOW = 100
+
+def make_fleet(seed, n_robots=5):
+    rng = np.random.default_rng(seed)
+    return [Robot(i, int(rng.integers(100, 1000)), 1000, str(rng.choice(["operating", "charging"])), int(rng.integers(20, 80)), int(rng.integers(5, 30)), 20) for i in range(n_robots)]
+
+def test_rollout_cache_evicts_least_recently_used():
+    key_bytes = len(allocation_key(b"p" * 16, [0, 1]))
+    cache = RolloutCache(max_bytes=3 * (key_bytes + ENTRY_OVERHEAD))
+    keys = [allocation_key(b"p" * 16, [0, i]) for i in range(4)]
+
+    cache.put_many([(keys[0], 1), (keys[1], 2), (keys[2], 3)])
+    assert cache.get_many([keys[0], keys[3]]) == [1.0, None]
+    cache.put_many([(keys[3], 4)])
+
+    assert cache.get_many(keys) == [1.0, None, 3.0, 4.0]
+    assert cache.stats() == {"hits": 4, "misses": 2, "hit_rate": 4/6, "evictions": 1, "entries": 3, "bytes": 3 * (key_bytes + ENTRY_OVERHEAD)}
+
+def test_rollout_prefix_depends_on_the_state():
+    robots = make_fleet(0)
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    args = ("operation_time", 0.05, 0.95, True, adjacency_matrix, WINDOW)
+    prefix = rollout_prefix(robots, *args)
+
+    assert rollout_prefix(make_fleet(0), *args) == prefix
+    assert rollout_prefix(robots, "operation_time", 0.05, 0.95, True, adjacency_matrix, WINDOW + 1) != prefix
+
+    # with a quantum, close battery levels share the prefix
+    other = make_fleet(0)
+    robots[0].battery_level = 500
+    other[0].battery_level = 510
+    assert rollout_prefix(robots, *args) != rollout_prefix(other, *args)
+    assert rollout_prefix(robots, *args, quantum=50) == rollout_prefix(other, *args, quantum=50)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_cached_costs_match_uncached(seed):
+    """
+    The costs read from the rollout cache are the ones of the rollouts, and the second optimization of
+    the same state only reads the cache.
+    """
+    robots = make_fleet(seed)
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    args = (0.05, 0.95, True, adjacency_matrix, WINDOW)
+    cache = RolloutCache()
+    allocator = Allocator(len(robots), AllocationPolicy.BRUTE_FORCE, batched=True, cache=cache)
+    candidates = allocator.get_candidates()
+
+    expected = Allocator.batch_optimize_operation_time(robots, candidates, *args)
+    prefix = allocator.cache_prefix(robots, *args)
+    np.testing.assert_array_equal(allocator.rollout_costs(robots, candidates, *args, prefix), expected)
+    assert cache.stats()["misses"] == len(candidates) and cache.stats()["hits"] == 0
+    np.testing.assert_array_equal(allocator.rollout_costs(robots, candidates, *args, prefix), expected)
+    assert cache.stats()["hits"] == len(candidates)
+
+    allocation = allocator.find_best_allocation(WINDOW, robots, *args[:-1])
+    assert Allocator.batch_optimize_operation_time(robots, [allocation], *args)[0] == expected.min()
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_pool_with_rollout_cache_matches_default_pool(shared):
+    robots = make_fleet(1)
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    args = (WINDOW, robots, 0.05, 0.95, True, adjacency_matrix)
+    cache = shared_rollout_cache() if shared else RolloutCache()
+
+    costs = []
+    for kwargs in ({}, {"cache": cache}, {"cache": cache}):
+        allocator = Allocator(len(robots), AllocationPolicy.BRUTE_FORCE, 2, **kwargs)
+        try:
+            allocator.find_best_allocation(*args)
+            costs.append(allocator.process_pool.best_cost)
+        finally:
+            allocator.terminate()
+    assert costs[0] == costs[1] == costs[2]
+    if shared:
+        assert cache.stats()["hits"] > 0
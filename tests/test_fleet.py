@@ -0,0 +1,165 @@
+import random
+import filecmp
+import numpy as np
+import pytest
+from src.robot import Robot, snapshot_robots
+from src.mpc import Allocator, AllocationPolicy
+from src.fleet import FleetState, CHARGING, OPERATING
+from src.simulator import Simulator
+from src.plotting import PlotMode
+from src.graph import random_graph
+from src.utils import compute_adjacency_matrix, component_labels, hop_distances, move_computation, tick
+
+REPORT_FILES = ("simulation_stats.csv", "missed_chances.csv", "robot_status.csv")
+
+def run_simulation(name, config, epochs=1000, **kwargs):
+    np.random.seed(0)
+    s = Simulator(0, name, config=config, plot_mode=PlotMode.OFF, **kwargs)
+    s.run(epochs)
+    return s
+
+@pytest.mark.parametrize("task_demand", [20, 20.5])
+@pytest.mark.parametrize("mode", ["vectorized", "event_driven"])
+def test_fleet_report_matches_robots(tmp_path, monkeypatch, task_demand, mode):
+    """
+    The FleetState paths write the same report of the Robot objects, also with a fractional task demand.
+    """
+    monkeypatch.chdir(tmp_path)
+    config = {"n_robots": 8, "charge_rate": 65, "discharge_rate": 25, "total_battery": 220*60, "AI_computation": task_demand}
+
+    run_simulation("robots", config)
+    run_simulation("fleet", config, **{mode: True})
+
+    for f in REPORT_FILES:
+        assert filecmp.cmp(tmp_path / "res" / "robots" / f, tmp_path / "res" / "fleet" / f, shallow=False), f
+
+def random_fleet(seed, n_robots):
+    rng = np.random.default_rng(seed)
+    return [Robot(i, int(rng.integers(0, 1000)), 1000, str(rng.choice(["operating", "charging"])), int(rng.integers(20, 80)), int(rng.integers(5, 30)), int(rng.integers(0, 20))) for i in range(n_robots)]
+
+def zero_rate_fleet(seed, n_robots):
+    """
+    Robots with zero charge or discharge rates, some of which already meet the condition to change status.
+    """
+    rng = random.Random(seed)
+    return [Robot(i, rng.randint(0, 10)*100, 1000, rng.choice(["operating", "charging"]), rng.choice([0, 50]), rng.choice([0, 0, 10]), rng.choice([0, 20])) for i in range(n_robots)]
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("move_computation_enabled", [False, True])
+def test_event_rollout_matches_step(seed, move_computation_enabled):
+    """
+    The event-driven rollouts (with and without prefix sharing) have the costs of the step by step ones.
+    """
+    n_robots = 2 + seed % 4
+    adjacency_matrix = np.ones((n_robots, n_robots)) - np.eye(n_robots)
+    allocations = [list(range(n_robots)), [1] + list(range(1, n_robots))]
+    args = (0.5, 0.5, move_computation_enabled, adjacency_matrix, 60)
+
+    with np.errstate(divide="ignore"):
+        step = Allocator.optimize_operation_time(zero_rate_fleet(seed, n_robots), *args)
+        assert Allocator.event_optimize_operation_time(zero_rate_fleet(seed, n_robots), *args) == step
+
+        expected = Allocator.batch_optimize_operation_time(zero_rate_fleet(seed, n_robots), allocations, *args)
+        for prefix_sharing in (False, True):
+            costs = Allocator.batch_optimize_operation_time(zero_rate_fleet(seed, n_robots), allocations, *args, event_driven=True, prefix_sharing=prefix_sharing)
+            assert np.array_equal(costs, expected)
+
+def test_ticks_to_threshold_with_zero_rates():
+    """
+    A robot without a rate that already meets the condition to change status changes it at the next tick.
+    """
+    robots = [Robot(0, 400, 1000, "operating", 30, 0, 0), Robot(1, 600, 1000, "charging", 0, 5, 0), Robot(2, 600, 1000, "operating", 30, 0, 0), Robot(3, 400, 1000, "charging", 0, 5, 0)]
+    fleet = FleetState.from_robots(robots)
+
+    assert fleet.ticks_to_threshold(0.5, 0.5).tolist() == [[1, 1, np.inf, np.inf]]
+    fleet.tick(0.5, 0.5)
+    assert fleet.status.tolist() == [[CHARGING, OPERATING, OPERATING, CHARGING]]
+
+@pytest.mark.parametrize("seed", range(10))
+def test_has_pending_match_matches_reachability(seed):
+    """
+    The pending matches found through the component labels are the ones of the reachability matrix.
+    """
+    rng = np.random.default_rng(seed)
+    n_robots = 12
+    graph = random_graph(n_robots, 0.15, seed)
+    robots = [Robot(i, int(rng.integers(0, 1000)), 1000, rng.choice(["operating", "charging"]), 50, 10, 20) for i in range(n_robots)]
+    fleet = FleetState.from_robots(robots, n_copies=30)
+    allocations = [[i if rng.random() < 0.7 else int(rng.integers(n_robots)) for i in range(n_robots)] for _ in range(30)]
+    allocations = [a if Allocator(n_robots, batched=True, lazy=True).is_candidate(a) else list(range(n_robots)) for a in allocations]
+    fleet.apply_allocations(allocations)
+
+    reachable = np.isfinite(hop_distances(graph))
+    np.fill_diagonal(reachable, False)
+    free = (fleet.offload_to == fleet.ids) & (fleet.status == OPERATING)
+    can_host = (fleet.status == CHARGING) & ~fleet.is_hosting()
+    expected = (can_host & (free.astype(np.int64) @ reachable.T.astype(np.int64) > 0)).any(axis=1)
+
+    np.testing.assert_array_equal(fleet.has_pending_match(component_labels(graph)), expected)
+    np.testing.assert_array_equal(fleet.has_pending_match(component_labels(graph.toarray())), expected)
+
+def apply_allocation(robots, allocation):
+    """
+    Assign the tasks of the robots as the ProcessPool workers do.
+    """
+    for r in robots:
+        r.unhost()
+        r.unoffload()
+    for i, id in enumerate(allocation):
+        robots[i].offload(robots[id])
+        robots[id].host(robots[i].get_self_task())
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fleet_tick_matches_robots(seed):
+    """
+    Every copy of a FleetState evolves as its own list of Robot objects, through tick, move_computation
+    and update_computation.
+    """
+    n_robots = 8
+    robots = random_fleet(seed, n_robots)
+    adjacency_matrix = compute_adjacency_matrix(n_robots, 1) if seed % 2 == 0 else random_graph(n_robots, 0.3, seed).toarray()
+    allocator = Allocator(n_robots, AllocationPolicy.MOVE2, batched=True)
+    allocations = allocator.get_candidates([-1] * n_robots)[::7][:6]
+
+    fleet = FleetState.from_robots(robots, n_copies=len(allocations))
+    fleet.apply_allocations(allocations)
+    copies = []
+    for allocation in allocations:
+        copy = random_fleet(seed, n_robots)
+        apply_allocation(copy, allocation)
+        copies.append(copy)
+
+    for _ in range(300):
+        available, _ = fleet.tick(0.95, 0.05)
+        fleet.move_computation(available, adjacency_matrix)
+        fleet.update_computation()
+        for row, copy in enumerate(copies):
+            ids, _ = tick({}, copy, 0.95, 0.05, False)
+            assert np.flatnonzero(available[row]).tolist() == sorted(ids)
+            move_computation(ids, copy, adjacency_matrix)
+            for r in copy:
+                r.update_computation()
+            assert snapshot_robots(fleet.make_robots(row)) == snapshot_robots(copy)
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("event_driven", [False, True])
+def test_prefix_sharing_matches_batch_rollout(seed, event_driven):
+    """
+    The candidates that share the rollout of the current allocation have the costs of the plain batched
+    rollout, also when the robots already offload some tasks and with a sparse topology.
+    """
+    n_robots = 6
+    robots = random_fleet(seed, n_robots)
+    adjacency_matrix = compute_adjacency_matrix(n_robots, 1) if seed % 2 == 0 else random_graph(n_robots, 0.3, seed).toarray()
+    allocator = Allocator(n_robots, AllocationPolicy.MOVE2, batched=True)
+    allocations = allocator.get_candidates([-1] * n_robots)
+    apply_allocation(robots, allocations[len(allocations) // 2])
+    args = (0.05, 0.95, True, adjacency_matrix, 100, event_driven)
+
+    for objective in (Allocator.batch_optimize_operation_time, Allocator.batch_optimize_missed_chanches):
+        expected = objective(robots, allocations, *args)
+        np.testing.assert_array_equal(objective(robots, allocations, *args, prefix_sharing=True), expected)
+
+    shared = Allocator(n_robots, AllocationPolicy.MOVE2, batched=True, prefix_sharing=True)
+    allocation = shared.find_best_allocation(100, robots, 0.05, 0.95, True, adjacency_matrix)
+    assert Allocator.batch_optimize_operation_time(robots, [allocation], *args)[0] == Allocator.batch_optimize_operation_time(robots, allocations, *args).min()
@@ -0,0 +1,135 @@
+import itertools
+import numpy as np
+import pytest
+from src.robot import Robot
+from src.mpc import Allocator, AllocationPolicy
+from src.utils import compute_adjacency_matrix, min_cost_assignment
+
+def make_fleet(levels, statuses, total_battery=1000):
+    return [Robot(i, level, total_battery, status, 50, 10, 20) for i, (level, status) in enumerate(zip(levels, statuses))]
+
+@pytest.mark.parametrize("policy", ["BRUTE_FORCE", "MOVE1", "MOVE2"])
+def test_symmetry_reduction_keeps_one_candidate_per_class(policy):
+    """
+    Robots in the same battery band are interchangeable: the reduced candidates are a subset of the full
+    ones, with concrete robot ids, and every full candidate maps to one of them.
+    """
+    robots = make_fleet([910, 930, 950, 120, 140, 500], ["operating", "operating", "operating", "charging", "charging", "charging"])
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    allocator = Allocator(len(robots), AllocationPolicy[policy], batched=True)
+
+    classes = Allocator.symmetry_classes(robots, adjacency_matrix, True, 10)
+    assert classes == [0, 0, 0, 3, 3, 5]
+
+    full = allocator.get_candidates([-1] * len(robots))
+    reduced = allocator.get_candidates([-1] * len(robots), classes)
+    assert 0 < len(reduced) < len(full)
+    assert set(map(tuple, reduced)) <= set(map(tuple, full))
+    assert {tuple(Allocator.canonical_allocation(alloc, classes)) for alloc in full} == set(map(tuple, reduced))
+
+def test_symmetry_classes_respect_bands_constraints_and_topology():
+    robots = make_fleet([910, 990, 950, 120], ["operating"] * 3 + ["charging"])
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+
+    # with enough bands every robot is in its own class
+    assert Allocator.symmetry_classes(robots, adjacency_matrix, True, 1000) is None
+    assert Allocator.symmetry_classes(robots, adjacency_matrix, True, 10) == [0, 0, 0, 3]
+    assert Allocator.symmetry_classes(robots, adjacency_matrix, True, 10, [-1, 1, -1, -1]) == [0, 1, 0, 3]
+
+    # robot 2 is not connected to robot 3, unlike robots 0 and 1
+    adjacency_matrix[2, 3] = adjacency_matrix[3, 2] = 0
+    assert Allocator.symmetry_classes(robots, adjacency_matrix, True, 10) == [0, 0, 2, 3]
+    assert Allocator.symmetry_classes(robots, adjacency_matrix, False, 10) == [0, 0, 0, 3]
+
+def test_symmetry_reduction_finds_a_candidate():
+    robots = make_fleet([910, 930, 950, 120, 140], ["operating"] * 3 + ["charging"] * 2)
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    allocator = Allocator(len(robots), AllocationPolicy.BRUTE_FORCE, batched=True, symmetry_bands=10)
+    allocation = allocator.find_best_allocation(100, robots, 0.05, 0.95, True, adjacency_matrix)
+    assert allocator.is_candidate(allocation)
+
+CONSTRAINTS = [[-1] * 6, [-1, 3, -1, -1, -1, -1], [0, -1, -1, 2, -1, -1], [-1, -1, 4, -1, 4, 1]]
+
+@pytest.mark.parametrize("n", [1, 2, 3])
+@pytest.mark.parametrize("constrained_allocation", CONSTRAINTS)
+def test_move_n_catalog_matches_powerset(n, constrained_allocation):
+    """
+    The MOVE-n candidates filtered out of the catalog are the ones of the recursive enumeration, in the
+    same order. The recursive enumeration does not check the constraint of the last robot, so its
+    allocations are filtered first.
+    """
+    allocator = Allocator(6, AllocationPolicy.BRUTE_FORCE, batched=True)
+    expected = [alloc for alloc in allocator.move_n_powerset(n, constrained_allocation) if allocator._validate_with_constraints(alloc, constrained_allocation)]
+
+    candidates = allocator.constrained_move_n(n, constrained_allocation)
+    assert candidates.tolist() == expected
+    assert allocator.constrained_move_n(n, constrained_allocation).tolist() == expected
+    assert allocator.move_n_catalog(n) is allocator.move_n_catalog(n)
+
+@pytest.mark.parametrize("policy", ["MOVE1", "MOVE2"])
+def test_move_n_best_allocation_matches_powerset(policy):
+    robots = make_fleet([910, 930, 300, 120, 140, 500], ["operating", "operating", "operating", "charging", "charging", "charging"])
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    args = (0.05, 0.95, True, adjacency_matrix, 100)
+    allocator = Allocator(len(robots), AllocationPolicy[policy], batched=True)
+
+    expected = allocator.move_n_powerset(int(policy[-1]), [-1] * len(robots))
+    costs = Allocator.batch_optimize_operation_time(robots, expected, *args)
+    allocation = allocator.find_best_allocation(100, robots, *args[:-1])
+    assert allocator.is_candidate(allocation)
+    assert Allocator.batch_optimize_operation_time(robots, [allocation], *args)[0] == costs.min()
+
+@pytest.mark.parametrize("constrained_allocation", [None, [-1] * 5, [-1, 3, -1, -1, -1], [0, -1, -1, 2, 2]])
+def test_lazy_candidates_match_custom_powerset(constrained_allocation):
+    allocator = Allocator(5, AllocationPolicy.BRUTE_FORCE, batched=True)
+    expected = [alloc for alloc in allocator.custom_powerset() if allocator._validate_with_constraints(alloc, constrained_allocation)]
+
+    assert list(allocator.iter_custom_powerset(constrained_allocation)) == expected
+    for depth in (1, 2, 5, 8):
+        shards = allocator.shard_prefixes(depth, constrained_allocation)
+        assert [alloc for prefix in shards for alloc in allocator.iter_custom_powerset(constrained_allocation, prefix)] == expected
+
+@pytest.mark.parametrize("shape", [(4, 4), (3, 5), (5, 3)])
+def test_min_cost_assignment_matches_permutations(shape):
+    rng = np.random.default_rng(sum(shape))
+    cost = rng.integers(-20, 20, shape)
+    assignment = min_cost_assignment(cost)
+
+    assigned = assignment[assignment != -1]
+    assert len(set(assigned.tolist())) == len(assigned) == min(shape)
+    if shape[0] <= shape[1]:
+        expected = min(sum(cost[i, j] for i, j in enumerate(columns)) for columns in itertools.permutations(range(shape[1]), shape[0]))
+    else:
+        expected = min(sum(cost[i, j] for j, i in enumerate(rows)) for rows in itertools.permutations(range(shape[0]), shape[1]))
+    assert sum(cost[i, j] for i, j in enumerate(assignment) if j != -1) == expected
+
+def random_fleet(seed, n_robots):
+    rng = np.random.default_rng(seed)
+    return [Robot(i, int(rng.integers(100, 1000)), 1000, str(rng.choice(["operating", "charging"])), int(rng.integers(20, 80)), int(rng.integers(5, 30)), 20) for i in range(n_robots)]
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("constrained_allocation", [None, [-1] * 5, [4, -1, -1, -1, -1]])
+def test_heuristics_find_candidates_between_identity_and_brute_force(seed, constrained_allocation):
+    """
+    The heuristic allocations are candidates that satisfy the constraints, not worse than offloading no
+    task (or than GREEDY for LOCAL_SEARCH) and not better than the best allocation of BRUTE_FORCE.
+    """
+    robots = random_fleet(seed, 5)
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    args = (0.05, 0.95, True, adjacency_matrix, 100)
+
+    def cost(allocation):
+        return Allocator.batch_optimize_operation_time(robots, [allocation], *args)[0]
+
+    brute_force = Allocator(len(robots), AllocationPolicy.BRUTE_FORCE, batched=True)
+    optimum = cost(brute_force.find_best_allocation(100, robots, *args[:-1], constrained_allocation))
+    base, _, _ = Allocator.offload_options(robots, constrained_allocation)
+    
+    costs = {}
+    for policy in ("GREEDY", "MATCHING", "LOCAL_SEARCH"):
+        allocator = Allocator(len(robots), AllocationPolicy[policy], batched=True, seed=seed)
+        allocation = allocator.find_best_allocation(100, robots, *args[:-1], constrained_allocation)
+        assert brute_force.is_candidate(allocation, constrained_allocation)
+        costs[policy] = cost(allocation)
+        assert optimum <= costs[policy] <= cost(base)
+    assert costs["LOCAL_SEARCH"] <= costs["GREEDY"]
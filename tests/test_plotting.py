@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pytest
+from src.simulator import Simulator
+from src.plotting import PlotMode, bucket_bounds, downsample, fleet_percentiles
+
+CONFIG = {"n_robots": 4, "charge_rate": 65, "discharge_rate": 25, "total_battery": 220*60, "AI_computation": 20}
+
+@pytest.mark.parametrize("n, max_points", [(0, 10), (7, 100), (1000, 100), (1001, 7)])
+def test_bucket_bounds_cover_the_samples(n, max_points):
+    bounds = bucket_bounds(n, max_points)
+    assert bounds[0] == 0 and bounds[-1] == n
+    assert (np.diff(bounds) >= 0).all()
+    assert len(bounds) - 1 == max(1, min(n, max_points // 2))
+
+@pytest.mark.parametrize("seed", range(3))
+def test_downsample_keeps_minimum_and_maximum_of_each_bucket(seed):
+    rng = np.random.default_rng(seed)
+    values = np.cumsum(rng.normal(size=10_000))
+    values[rng.integers(len(values))] = 1e6
+
+    x, y = downsample(values, 200)
+    assert len(x) <= 200
+    assert (np.diff(x) > 0).all()
+    np.testing.assert_array_equal(y, values[x])
+    bounds = bucket_bounds(len(values), 200)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        kept = y[(x >= start) & (x < stop)]
+        assert kept.min() == values[start:stop].min() and kept.max() == values[start:stop].max()
+
+    short = values[:150]
+    x, y = downsample(short, 200)
+    np.testing.assert_array_equal(x, np.arange(150))
+    np.testing.assert_array_equal(y, short)
+
+def test_fleet_percentiles_by_chunks():
+    levels = np.random.default_rng(0).integers(0, 1000, (1000, 9))
+    percentiles = fleet_percentiles(levels, chunk_size=64)
+    for p, series in percentiles.items():
+        np.testing.assert_array_equal(series, np.percentile(levels, p, axis=1))
+
+@pytest.mark.parametrize("max_robots", [16, 2])
+def test_plots_are_written_with_the_results(tmp_path, monkeypatch, max_robots):
+    monkeypatch.chdir(tmp_path)
+    np.random.seed(0)
+    s = Simulator(0, "plotted", config=CONFIG, plot_mode=PlotMode.INLINE, plot_max_points=50, plot_max_robots=max_robots)
+    s.run(300)
+
+    files = os.listdir(tmp_path / "res" / "plotted")
+    assert "fleet_status.png" in files
+    assert ("battery_levels.png" in files) == (CONFIG["n_robots"] <= max_robots)
+
+def test_background_plot_is_joined(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    np.random.seed(0)
+    s = Simulator(0, "background", config=CONFIG, plot_mode=PlotMode.BACKGROUND, plot_max_points=50)
+    s.run(300)
+    process = s.plot_process
+    assert process is not None
+
+    # a second run waits for the plot of the first one before replacing its results
+    s.run(300)
+    assert process.exitcode == 0 and s.plot_process is not process
+
+    process = s.plot_process
+    s.wait_plot()
+    assert process.exitcode == 0 and s.plot_process is None
+    assert (tmp_path / "res" / "background" / "fleet_status.png").exists()
+    s.wait_plot()
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+from src.robot import Robot, snapshot_robots, clone_robots
+from src.mpc import Allocator, AllocationPolicy, ProcessPool, SharedArrays
+from src.fleet import FleetState
+from src.graph import CSRGraph
+from src.utils import compute_adjacency_matrix
+
+WINDOW = 200
+
+def make_fleet(seed, n_robots=5):
+    rng = np.random.default_rng(seed)
+    return [Robot(i, int(rng.integers(100, 1000)), 1000, str(rng.choice(["operating", "charging"])), int(rng.integers(20, 80)), int(rng.integers(5, 30)), 20) for i in range(n_robots)]
+
+def allocation_cost(robots, allocation, adjacency_matrix):
+    """
+    Cost of an allocation as evaluated by the ProcessPool workers.
+    """
+    rob = clone_robots(snapshot_robots(robots))
+    for r in rob:
+        r.unhost()
+        r.unoffload()
+    for i, id in enumerate(allocation):
+        rob[i].offload(rob[id])
+        rob[id].host(rob[i].get_self_task())
+    return Allocator.optimize_operation_time(rob, 0.05, 0.95, True, adjacency_matrix, WINDOW)
+
+def best_allocation(seed, policy, **kwargs):
+    """
+    Allocation chosen by an Allocator with a pool of two workers, and the best cost of the pool.
+    """
+    robots = make_fleet(seed)
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    allocator = Allocator(len(robots), policy, 2, **kwargs)
+    try:
+        allocation = allocator.find_best_allocation(WINDOW, robots, 0.05, 0.95, True, adjacency_matrix)
+        return allocation, allocator.process_pool.best_cost, allocation_cost(robots, allocation, adjacency_matrix)
+    finally:
+        allocator.terminate()
+
+def test_shared_arrays_round_trip():
+    robots = make_fleet(0)
+    arrays = FleetState.from_robots(robots).to_arrays()
+    arrays["candidates"] = np.array([[0, 1, 2, 3, 4], [1, 1, 2, 3, 4]])
+    shared = SharedArrays(arrays)
+    try:
+        read = SharedArrays.read(shared.descriptor)
+        assert read.keys() == arrays.keys()
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(read[name], array)
+            assert read[name].dtype == np.asarray(array).dtype
+        assert snapshot_robots(FleetState(**{k: v for k, v in read.items() if k != "candidates"}).make_robots()) == snapshot_robots(robots)
+    finally:
+        shared.release()
+    assert shared.segments == []
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("policy", [AllocationPolicy.BRUTE_FORCE, AllocationPolicy.MOVE1])
+def test_shared_memory_pool_matches_default_pool(seed, policy):
+    """
+    The allocation chosen with the fleet published in shared memory has the cost of the one chosen by
+    the default pool, which sends the robots through the queues.
+    """
+    _, expected, expected_cost = best_allocation(seed, policy)
+    allocation, cost, allocation_cost = best_allocation(seed, policy, shared_memory=True)
+    assert cost == expected == expected_cost
+    assert allocation_cost == cost
+
+def test_shared_memory_pool_with_sparse_topology():
+    robots = make_fleet(1)
+    graph = CSRGraph.from_dense(compute_adjacency_matrix(len(robots), 1))
+    costs = []
+    for shared_memory in (False, True):
+        allocator = Allocator(len(robots), AllocationPolicy.MOVE1, 2, shared_memory=shared_memory)
+        try:
+            allocator.find_best_allocation(WINDOW, robots, 0.05, 0.95, True, graph)
+            costs.append(allocator.process_pool.best_cost)
+        finally:
+            allocator.terminate()
+    assert costs[0] == costs[1]
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("kwargs", [{"chunk_size": 16}, {"pruning": True}, {"chunk_size": 16, "pruning": True}, {"chunk_size": 16, "pruning": True, "shared_memory": True}])
+def test_chunked_and_pruned_pool_matches_default_pool(seed, kwargs):
+    """
+    Sending the candidates in chunks and stopping the rollouts that cannot beat the best cost found so far
+    do not change the cost of the chosen allocation.
+    """
+    _, expected, _ = best_allocation(seed, AllocationPolicy.BRUTE_FORCE)
+    allocation, cost, allocation_cost = best_allocation(seed, AllocationPolicy.BRUTE_FORCE, **kwargs)
+    assert cost == expected
+    assert allocation_cost == cost
+
+def test_pruned_rollout_stops_only_above_the_bound():
+    robots = make_fleet(0)
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    args = (0.05, 0.95, True, adjacency_matrix, WINDOW)
+    cost = Allocator.optimize_operation_time(clone_robots(snapshot_robots(robots)), *args)
+
+    assert Allocator.optimize_operation_time(clone_robots(snapshot_robots(robots)), *args, lambda: cost + 1) == cost
+    assert Allocator.optimize_operation_time(clone_robots(snapshot_robots(robots)), *args, lambda: -np.inf) == np.inf
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("kwargs", [{"lazy": True}, {"lazy": True, "shard_depth": 1}, {"lazy": True, "shared_memory": True, "pruning": True}])
+def test_lazy_pool_matches_default_pool(seed, kwargs):
+    """
+    The workers enumerating the shards of the candidates choose an allocation with the cost of the
+    one chosen out of the full list.
+    """
+    _, expected, _ = best_allocation(seed, AllocationPolicy.BRUTE_FORCE)
+    allocation, cost, allocation_cost = best_allocation(seed, AllocationPolicy.BRUTE_FORCE, **kwargs)
+    assert cost == expected
+    assert allocation_cost == cost
+
+@pytest.mark.parametrize("seed", range(2))
+@pytest.mark.parametrize("kwargs", [{"batched": True}, {"pruning": True}, {"lazy": True, "pruning": True}])
+def test_warm_start_matches_cold_search(seed, kwargs):
+    """
+    A warm-started Allocator returns its previous allocation while no robot changes status, and
+    otherwise the allocation it finds starting from it has the cost of the one found from scratch.
+    """
+    robots = make_fleet(seed)
+    adjacency_matrix = compute_adjacency_matrix(len(robots), 1)
+    args = (WINDOW, robots, 0.05, 0.95, True, adjacency_matrix)
+    warm = Allocator(len(robots), AllocationPolicy.BRUTE_FORCE, 2, warm_start=True, **kwargs)
+    cold = Allocator(len(robots), AllocationPolicy.BRUTE_FORCE, 2, **kwargs)
+    try:
+        allocation = warm.find_best_allocation(*args)
+        assert allocation_cost(robots, allocation, adjacency_matrix) == allocation_cost(robots, cold.find_best_allocation(*args), adjacency_matrix)
+        assert warm.find_best_allocation(*args) == allocation
+        assert warm.n_reused == 1
+
+        for r in robots[:2]:
+            r.status = "charging" if r.status == "operating" else "operating"
+        allocation = warm.find_best_allocation(*args)
+        assert warm.n_reused == 1
+        assert allocation_cost(robots, allocation, adjacency_matrix) == allocation_cost(robots, cold.find_best_allocation(*args), adjacency_matrix)
+        assert warm.find_best_allocation(*args, [0, -1, -1, -1, -1])[0] == 0
+        assert warm.n_reused == 1
+    finally:
+        warm.terminate()
+        cold.terminate()
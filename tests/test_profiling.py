@@ -0,0 +1,80 @@
+import filecmp
+import numpy as np
+import pandas as pd
+import pytest
+from src.simulator import Simulator
+from src.plotting import PlotMode
+from src.profiling import NULL_PHASE, Profiler
+
+CONFIG = {"n_robots": 4, "charge_rate": 65, "discharge_rate": 25, "total_battery": 220*60, "AI_computation": 20}
+
+def test_profiler_records_phases_and_counters():
+    profiler = Profiler()
+    profiler.begin()
+    with profiler.phase("outer"):
+        with profiler.phase("inner"):
+            pass
+        with profiler.phase("inner"):
+            pass
+    profiler.set_epoch(3)
+    profiler.add_time("pool_busy", 2.0, calls=4)
+    profiler.count("candidates", 10)
+    profiler.set_epoch(None)
+    profiler.count("candidates", 5)
+    profiler.count("pool_capacity_s", 8.0)
+    profiler.finish()
+
+    assert profiler.calls == {"outer": 1, "inner": 2, "pool_busy": 4}
+    assert profiler.times["outer"] >= profiler.times["inner"]
+    assert profiler.epochs == {3: {"pool_busy_s": 2.0, "candidates": 10}}
+
+    summary = profiler.summary(epochs=100)
+    assert summary["candidates"] == 15
+    assert summary["worker_utilization"] == 0.25
+    assert summary["epochs_per_s"] == 100 / summary["wall_time_s"]
+    assert profiler.wall_time() == summary["wall_time_s"]
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler(enabled=False)
+    assert profiler.phase("tick") is NULL_PHASE
+    with profiler.phase("tick"):
+        pass
+    profiler.set_epoch(0)
+    profiler.add_time("pool_busy", 1.0)
+    profiler.count("candidates")
+
+    assert not profiler.times and not profiler.calls and not profiler.counters and not profiler.epochs
+
+def test_profiler_dump(tmp_path):
+    profiler = Profiler()
+    profiler.set_epoch(0)
+    with profiler.phase("tick"):
+        profiler.count("candidates", 3)
+    profiler.set_epoch(1)
+    profiler.count("reused_allocations")
+    profiler.finish()
+    profiler.dump(tmp_path / "profile", epochs=2)
+
+    phases = pd.read_csv(tmp_path / "profile" / "profile.csv")
+    assert phases["phase"].tolist() == ["tick"] and phases["calls"].tolist() == [1]
+    assert pd.read_csv(tmp_path / "profile" / "profile_summary.csv")["candidates"].tolist() == [3]
+    epochs = pd.read_csv(tmp_path / "profile" / "profile_epochs.csv")
+    assert epochs["epoch"].tolist() == [0, 1]
+    assert epochs["candidates"].tolist() == [3, 0]
+    assert epochs["reused_allocations"].tolist() == [0, 1]
+
+@pytest.mark.parametrize("kwargs", [{}, {"event_driven": True}])
+def test_profiling_does_not_change_the_report(tmp_path, monkeypatch, kwargs):
+    monkeypatch.chdir(tmp_path)
+    for name, profile in (("plain", False), ("profiled", True)):
+        np.random.seed(0)
+        s = Simulator(0, name, config=CONFIG, plot_mode=PlotMode.OFF, optimize_computation_frequency=50, num_processes=1, profile=profile, **kwargs)
+        s.run(300)
+
+    for f in ("simulation_stats.csv", "missed_chances.csv", "robot_status.csv"):
+        assert filecmp.cmp(tmp_path / "res" / "plain" / f, tmp_path / "res" / "profiled" / f, shallow=False), f
+    assert not (tmp_path / "res" / "plain" / "profile.csv").exists()
+    summary = pd.read_csv(tmp_path / "res" / "profiled" / "profile_summary.csv")
+    assert summary["candidates"].iloc[0] > 0
+    assert 0 < summary["worker_utilization"].iloc[0] <= 1
+    assert "optimize_computation" in pd.read_csv(tmp_path / "res" / "profiled" / "profile.csv")["phase"].tolist()
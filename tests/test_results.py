@@ -0,0 +1,42 @@
+import os
+import numpy as np
+import pytest
+from src.simulator import Simulator
+from src.plotting import PlotMode
+
+CONFIG = {"n_robots": 4, "charge_rate": 65, "discharge_rate": 25, "total_battery": 220*60, "AI_computation": 20}
+
+def test_results_are_moved_into_place(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    np.random.seed(0)
+    s = Simulator(0, "complete", config=CONFIG, plot_mode=PlotMode.OFF, profile=True)
+    s.run(100)
+
+    assert sorted(os.listdir(tmp_path / "res")) == ["complete"]
+    for f in ("simulation_stats.csv", "missed_chances.csv", "robot_status.csv", "battery_levels.npy", "robot_status.npy", "profile.csv"):
+        assert (tmp_path / "res" / "complete" / f).exists(), f
+    assert len(s.results.battery_levels()) == 100
+
+def test_failed_run_leaves_no_results(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    np.random.seed(0)
+    s = Simulator(0, "failed", config=CONFIG, plot_mode=PlotMode.OFF)
+
+    def fail(ep):
+        if ep == 50:
+            raise RuntimeError("failed")
+    monkeypatch.setattr(s, "update_stats", fail)
+
+    with pytest.raises(RuntimeError):
+        s.run(100)
+    assert os.listdir(tmp_path / "res") == []
+
+def test_run_replaces_previous_results(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "res" / "rerun").mkdir(parents=True)
+    (tmp_path / "res" / "rerun" / "stale.csv").write_text("")
+
+    np.random.seed(0)
+    Simulator(0, "rerun", config=CONFIG, plot_mode=PlotMode.OFF).run(10)
+    assert not (tmp_path / "res" / "rerun" / "stale.csv").exists()
+    assert (tmp_path / "res" / "rerun" / "simulation_stats.csv").exists()
@@ -0,0 +1,90 @@
+import filecmp
+import numpy as np
+import pytest
+from src.mpc import AllocationPolicy, ProcessPool
+from src.simulator import Simulator, ValidationMode
+from src.plotting import PlotMode
+
+CONFIG = {"n_robots": 5, "charge_rate": 65, "discharge_rate": 25, "total_battery": 220*60, "AI_computation": 20}
+REPORT_FILES = ("simulation_stats.csv", "missed_chances.csv", "robot_status.csv")
+
+def make_simulator(name, **kwargs):
+    np.random.seed(0)
+    kwargs.setdefault("batched_evaluation", True)
+    return Simulator(0, name, config=CONFIG, plot_mode=PlotMode.OFF, optimize_computation_frequency=100, allocation_policy=AllocationPolicy.MOVE1, **kwargs)
+
+@pytest.mark.parametrize("kwargs", [{}, {"vectorized": True}, {"event_driven": True}])
+def test_validation_modes_write_the_same_report(tmp_path, monkeypatch, kwargs):
+    monkeypatch.chdir(tmp_path)
+    for mode in ValidationMode:
+        make_simulator(mode.name, validation=mode, validation_interval=50, **kwargs).run(600)
+
+    for mode in (ValidationMode.OFF, ValidationMode.SAMPLED):
+        for f in REPORT_FILES:
+            assert filecmp.cmp(tmp_path / "res" / "FULL" / f, tmp_path / "res" / mode.name / f, shallow=False), f
+
+def corrupt_computation(monkeypatch, s, epoch, amount):
+    """
+    Add amount to the total computation kept by the simulator when epoch is validated.
+    """
+    validate = s.validate
+    def corrupted(ep, steps=1):
+        if ep - steps < epoch <= ep:
+            s.computation_total += amount
+        validate(ep, steps)
+    monkeypatch.setattr(s, "validate", corrupted)
+
+@pytest.mark.parametrize("kwargs", [{}, {"vectorized": True}, {"event_driven": True}])
+@pytest.mark.parametrize("mode, amount, detected", [
+    (ValidationMode.FULL, 1, True),
+    (ValidationMode.SAMPLED, 1, True),
+    (ValidationMode.FULL, CONFIG["n_robots"], True),
+    (ValidationMode.SAMPLED, CONFIG["n_robots"], True),
+    (ValidationMode.OFF, 1, False),
+])
+def test_validation_detects_corrupted_computation(tmp_path, monkeypatch, kwargs, mode, amount, detected):
+    """
+    A total computation that is not a multiple of the number of robots, or that differs from the stats of
+    the robots, is detected by the FULL and SAMPLED validations, and never without validation.
+    """
+    monkeypatch.chdir(tmp_path)
+    s = make_simulator("corrupted", validation=mode, validation_interval=50, **kwargs)
+    corrupt_computation(monkeypatch, s, 123, amount)
+
+    if detected:
+        with pytest.raises(AssertionError, match="total computation"):
+            s.run(300)
+    else:
+        s.run(300)
+
+def fail(*args):
+    raise RuntimeError("failed")
+
+@pytest.mark.parametrize("patched", ["update_stats", "get_best_result"])
+def test_failed_run_terminates_the_pool(tmp_path, monkeypatch, patched):
+    """
+    The workers are stopped when the simulation fails, also while they are evaluating allocations whose
+    results are never read.
+    """
+    monkeypatch.chdir(tmp_path)
+    s = make_simulator("failed", num_processes=2, batched_evaluation=False)
+    processes = list(s.allocator.process_pool.processes)
+    monkeypatch.setattr(s.allocator.process_pool if patched == "get_best_result" else s, patched, fail)
+
+    with pytest.raises(RuntimeError):
+        s.run(300)
+    assert not any(p.is_alive() for p in processes)
+    assert s.allocator.process_pool.processes == []
+
+def test_failed_run_keeps_the_pool_of_the_caller(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with ProcessPool(2) as pool:
+        s = make_simulator("failed", process_pool=pool, batched_evaluation=False)
+        monkeypatch.setattr(s, "update_stats", fail)
+        with pytest.raises(RuntimeError):
+            s.run(300)
+        assert all(p.is_alive() for p in pool.processes)
+
+        make_simulator("complete", process_pool=pool, batched_evaluation=False).run(300)
+        assert (tmp_path / "res" / "complete" / "simulation_stats.csv").exists()
+    assert pool.processes == []
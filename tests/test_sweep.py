@@ -0,0 +1,72 @@
+import pytest
+from src.mpc import AllocationPolicy
+from src.plotting import PlotMode
+from src.sweep import sweep_jobs, is_complete, job_cores, run_sweep
+
+CONFIG = {"n_robots": 4, "charge_rate": 65, "discharge_rate": 25, "total_battery": 220*60, "AI_computation": 20}
+
+def test_sweep_job_names():
+    variants = {"reference": dict(move_computation_enabled=False), "battery": dict(move_computation_enabled=True, allocation_policy=AllocationPolicy.MOVE1)}
+
+    jobs = sweep_jobs({"medium": CONFIG}, range(2), variants, 10)
+    assert [job["sim_name"] for job in jobs] == ["medium-reference-0", "medium-battery-0", "medium-reference-1", "medium-battery-1"]
+
+    # the names of main.py, res/reference and res/battery
+    jobs = sweep_jobs({"medium": CONFIG}, range(1), variants, 10, name="{variant}")
+    assert [job["sim_name"] for job in jobs] == ["reference", "battery"]
+    assert jobs[1]["allocation_policy"] is AllocationPolicy.MOVE1 and jobs[1]["epochs"] == 10
+
+    jobs = sweep_jobs({"medium": CONFIG}, range(1), {"battery": dict(sim_name="old-battery")}, 10)
+    assert jobs[0]["sim_name"] == "old-battery"
+
+def test_sweep_duplicated_names():
+    with pytest.raises(ValueError):
+        sweep_jobs({"medium": CONFIG}, range(2), {"reference": {}}, 10, name="{variant}")
+
+def test_is_complete(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    job = sweep_jobs({"medium": CONFIG}, range(1), {"reference": {}}, 10, name="{variant}")[0]
+    assert not is_complete(job)
+
+    (tmp_path / "res" / "reference").mkdir(parents=True)
+    for f in ("simulation_stats.csv", "missed_chances.csv", "robot_status.csv"):
+        (tmp_path / "res" / "reference" / f).write_text("")
+    assert is_complete(job)
+
+    # the results of a job with its own results_root are looked up there
+    job = sweep_jobs({"medium": CONFIG}, range(1), {"reference": dict(results_root="other")}, 10, name="{variant}")[0]
+    assert not is_complete(job)
+    (tmp_path / "other").mkdir()
+    (tmp_path / "res" / "reference").rename(tmp_path / "other" / "reference")
+    assert is_complete(job)
+
+def test_job_cores_count_the_simulation():
+    pooled = dict(optimize_computation_frequency=100, num_processes=4)
+    assert job_cores({}, 8) == 1
+    assert job_cores(dict(pooled, batched_evaluation=True), 8) == 1
+    assert job_cores(dict(pooled, allocation_policy=AllocationPolicy.GREEDY), 8) == 1
+    assert job_cores(dict(optimize_computation_frequency=100), 8) == 2
+    assert job_cores(pooled, 8) == 5
+    assert job_cores(pooled, 4) == 4
+    assert job_cores(pooled, 1) == 1
+
+def test_run_sweep_resumes(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    variants = {"reference": dict(plot_mode=PlotMode.OFF, results_root="sweep"), "battery": dict(plot_mode=PlotMode.OFF, results_root="sweep", optimize_computation_frequency=50, allocation_policy=AllocationPolicy.MOVE1, num_processes=4)}
+    jobs = sweep_jobs({"medium": CONFIG}, range(1), variants, 100, name="{variant}")
+
+    assert run_sweep(jobs, n_cores=2) == []
+    assert all(is_complete(job) for job in jobs)
+    assert not (tmp_path / "res").exists()
+
+    capsys.readouterr()
+    assert run_sweep(jobs, n_cores=2) == []
+    assert capsys.readouterr().out.count("already completed") == 2
+
+def test_run_sweep_waits_for_the_plots(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    jobs = sweep_jobs({"medium": CONFIG}, range(2), {"reference": dict(plot_mode=PlotMode.BACKGROUND, plot_max_points=50)}, 100)
+
+    assert run_sweep(jobs, n_cores=2) == []
+    for job in jobs:
+        assert (tmp_path / "res" / job["sim_name"] / "fleet_status.png").exists()
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from src.graph import CSRGraph
+from src.robot import Robot, RobotIndex, snapshot_robots
+from src.utils import compute_adjacency_matrix, component_labels, dijkstra, hop_distances, neighbour_order, tick, move_computation
+
+@pytest.mark.parametrize("probability", [0.05, 0.2, 1])
+def test_hop_distances_match_bfs(probability):
+    np.random.seed(0)
+    adjacency_matrix = compute_adjacency_matrix(60, probability)
+    graph = CSRGraph.from_dense(adjacency_matrix)
+
+    expected = np.array([graph.hop_distances(i) for i in range(len(graph))])
+    np.testing.assert_array_equal(hop_distances(adjacency_matrix), expected)
+    np.testing.assert_array_equal(hop_distances(graph), expected)
+
+@pytest.mark.parametrize("probability", [0.05, 0.2, 1])
+def test_neighbour_order_matches_dijkstra(probability):
+    np.random.seed(1)
+    adjacency_matrix = compute_adjacency_matrix(30, probability)
+    neighbours = neighbour_order(adjacency_matrix)
+
+    for i in range(len(adjacency_matrix)):
+        buckets = dijkstra(adjacency_matrix, i)
+        assert neighbours[i].tolist() == [id for distance in buckets for id in sorted(buckets[distance])]
+
+def test_neighbour_order_is_computed_once_per_topology():
+    np.random.seed(2)
+    adjacency_matrix = compute_adjacency_matrix(10, 0.5)
+    neighbours = neighbour_order(adjacency_matrix)
+
+    assert neighbour_order(adjacency_matrix) is neighbours
+    assert neighbour_order(neighbours) is neighbours
+    assert neighbour_order(adjacency_matrix.copy()) is not neighbours
+
+@pytest.mark.parametrize("probability", [0, 0.02, 0.1, 1])
+def test_component_labels(probability):
+    np.random.seed(3)
+    adjacency_matrix = compute_adjacency_matrix(40, probability)
+    graph = CSRGraph.from_dense(adjacency_matrix)
+    labels = component_labels(graph)
+
+    # same label if and only if reachable, labelled with the lowest id of the component
+    reachable = np.isfinite(hop_distances(adjacency_matrix))
+    np.testing.assert_array_equal(labels[:, None] == labels[None, :], reachable)
+    np.testing.assert_array_equal(labels, reachable.argmax(axis=1))
+    np.testing.assert_array_equal(component_labels(adjacency_matrix), labels)
+
+def test_component_labels_are_computed_once_per_topology():
+    np.random.seed(4)
+    adjacency_matrix = compute_adjacency_matrix(10, 0.2)
+    graph = CSRGraph.from_dense(adjacency_matrix)
+
+    for topology in (adjacency_matrix, graph):
+        labels = component_labels(topology)
+        assert component_labels(topology) is labels
+        assert not labels.flags.writeable
+    assert component_labels(adjacency_matrix.copy()) is not component_labels(adjacency_matrix)
+
+def random_fleet(seed, n_robots):
+    rng = np.random.default_rng(seed)
+    return [Robot(i, int(rng.integers(0, 1000)), 1000, str(rng.choice(["operating", "charging"])), int(rng.integers(20, 80)), int(rng.integers(5, 30)), int(rng.integers(0, 20))) for i in range(n_robots)]
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("delay_enabled", [False, True])
+def test_tick_with_index_matches_scan(seed, delay_enabled):
+    """
+    The available robots read from the free hosts of a RobotIndex are the ones found by visiting the robots.
+    """
+    indexed = random_fleet(seed, 12)
+    scanned = random_fleet(seed, 12)
+    RobotIndex(indexed)
+    adjacency_matrix = compute_adjacency_matrix(12, 1)
+
+    for _ in range(500):
+        result = tick({}, indexed, 0.95, 0.05, delay_enabled)
+        expected = tick({}, scanned, 0.95, 0.05, delay_enabled)
+        assert result == expected
+        move_computation(result[0], indexed, adjacency_matrix)
+        move_computation(expected[0], scanned, adjacency_matrix)
+        assert snapshot_robots(indexed) == snapshot_robots(scanned)